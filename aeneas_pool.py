@@ -0,0 +1,274 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import wave
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from decoded_audio import SAMPLE_RATE, DecodedAudio
+
+ALIGN_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # Long-lived aeneas worker processes
+SCRATCH_DIR = None  # Parent of the per-job scratch folders; None uses the system temp folder
+WINDOWED_OVER_SEC = 15 * 60  # Longer recordings are aligned in windows, so aeneas memory stays bounded
+WINDOW_SEC = 5 * 60  # Target length of a window between two anchors
+WINDOW_OVERLAP_SEC = 20  # Audio (and the lines expected in it) added on both sides of a window as context
+ANCHOR_SEARCH_SEC = 10  # Anchors snap to the quietest point this far around their proportional position
+ENERGY_FRAME_SEC = 0.05
+SPEECH_LEVEL = 0.1  # Frames below this fraction of the 95th percentile energy count as pauses
+ENERGY_SMOOTH_FRAMES = 5  # Frames averaged so a single quiet frame inside a word is not picked
+ENERGY_BLOCK_SEC = 60  # Samples read at a time when computing frame energies
+
+
+def task_config(language):
+    return f"task_language={language}|is_text_type=plain|os_task_file_format=json"
+
+
+def _init_worker():
+    # Pay the aeneas import (and its espeak-ng extension) once per worker, not once per file
+    import aeneas.executetask  # noqa: F401
+    import aeneas.task  # noqa: F401
+
+
+def align(audio_path, transcript_path, language, scratch_dir=SCRATCH_DIR):
+    """Align a plain-text transcript (one fragment per line) to its audio with aeneas, in this process.
+
+    Returns {"fragments": [...]} in the layout of the sync map JSON that
+    aeneas.tools.execute_task writes, without writing it anywhere. aeneas' temporary
+    files go to a scratch folder of this job only, removed afterwards, so concurrent
+    jobs and overlapping runs never share a path.
+    """
+    from aeneas.executetask import ExecuteTask
+    from aeneas.runtimeconfiguration import RuntimeConfiguration
+    from aeneas.syncmap.fragment import SyncMapFragment
+    from aeneas.task import Task
+
+    scratch = tempfile.mkdtemp(prefix="aeneas_", dir=scratch_dir)
+    try:
+        task = Task(config_string=task_config(language))
+        task.audio_file_path_absolute = os.path.abspath(audio_path)
+        task.text_file_path_absolute = os.path.abspath(transcript_path)
+        ExecuteTask(task, rconf=RuntimeConfiguration(f"{RuntimeConfiguration.TMP_PATH}={scratch}")).execute()
+        fragments = []
+        for fragment in task.sync_map_leaves(SyncMapFragment.REGULAR):
+            text = fragment.text_fragment
+            fragments.append({
+                "begin": f"{float(fragment.begin):.3f}",
+                "end": f"{float(fragment.end):.3f}",
+                "id": text.identifier,
+                "language": text.language,
+                "lines": list(text.lines),
+                "children": [],
+            })
+        return {"fragments": fragments}
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def decode(audio_path, tmp_dir=None):
+    """Decode a file once for alignment and chunking. A 16kHz mono 16-bit WAV is memory-mapped as it is."""
+    if str(audio_path).endswith(".wav"):
+        try:
+            return DecodedAudio.from_wav(audio_path)
+        except (ValueError, EOFError, wave.Error):
+            pass
+    return DecodedAudio.from_file(audio_path, tmp_dir=tmp_dir)
+
+
+def transcript_lines(transcript_path):
+    """The lines of a plain-text transcript that aeneas turns into fragments."""
+    with open(transcript_path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def frame_energy(samples, frame_sec=ENERGY_FRAME_SEC, block_sec=ENERGY_BLOCK_SEC):
+    """Smoothed RMS of every frame. samples is read one block at a time, so a memory-mapped
+    recording is never loaded whole; only the energies (20 per second) are kept."""
+    frame = int(SAMPLE_RATE * frame_sec)
+    block = frame * int(block_sec / frame_sec)
+    energies = []
+    for position in range(0, len(samples) - frame + 1, block):
+        chunk = np.asarray(samples[position:position + block], dtype=np.float32)
+        chunk = chunk[:len(chunk) // frame * frame].reshape(-1, frame)
+        energies.append(np.sqrt(np.mean(chunk * chunk, axis=1)))
+    energy = np.concatenate(energies) if energies else np.zeros(0, dtype=np.float32)
+    if len(energy) < ENERGY_SMOOTH_FRAMES:
+        return energy
+    # Moving average; the windows at the edges hold fewer frames, so divide by the count
+    kernel = np.ones(ENERGY_SMOOTH_FRAMES, dtype=np.float32)
+    return np.convolve(energy, kernel, mode="same") / np.convolve(np.ones_like(energy), kernel, mode="same")
+
+
+def plan_windows(lines, duration_sec, energy, window_sec=WINDOW_SEC, overlap_sec=WINDOW_OVERLAP_SEC,
+                 search_sec=ANCHOR_SEARCH_SEC, frame_sec=ENERGY_FRAME_SEC):
+    """Split a long alignment into windows at anchors: (line index, time) breakpoints.
+
+    Frames louder than SPEECH_LEVEL of the loud end of the recording count as speech,
+    and each line is expected where the speech heard so far is proportional to the text
+    (in characters) before it, so pauses do not shift the estimate. About every
+    window_sec, the line expected nearest is chosen as an anchor and its time snapped to
+    the centre of the pause nearest to the expectation, within search_sec.
+
+    A window aligns the lines between two anchors (its core) plus the lines expected in
+    overlap_sec of audio on either side, now estimated between the anchors, against that
+    audio. Returns dicts with start_sec, end_sec, first and last (the lines aligned) and
+    core_first and core_last (the lines kept).
+    """
+    weights = np.array([len(line.replace(" ", "")) + 1 for line in lines], dtype=np.float64)
+    text = np.concatenate([[0.0], np.cumsum(weights)])
+    loud = energy > np.percentile(energy, 95) * SPEECH_LEVEL if len(energy) else np.zeros(0, dtype=bool)
+    if not loud.any():
+        loud = np.ones(max(1, int(duration_sec / frame_sec)), dtype=bool)
+    speech = np.cumsum(loud)  # Frames of speech heard up to and including each frame
+
+    def speech_at(time):
+        return speech[min(max(int(time / frame_sec), 0), len(speech) - 1)]
+
+    def expected_starts(anchor_lines, anchor_times):
+        # The first speech frame after the speech expected before each line
+        heard = np.interp(text, [text[line] for line in anchor_lines], [speech_at(time) for time in anchor_times])
+        return np.minimum(np.searchsorted(speech, heard + 1), len(speech) - 1) * frame_sec
+
+    expected = expected_starts([0, len(lines)], [0.0, duration_sec])
+    num_windows = min(max(1, round(duration_sec / window_sec)), len(lines))
+
+    anchors = [(0, 0.0)]
+    for j in range(1, num_windows):
+        target = j * duration_sec / num_windows
+        line = int(np.argmin(np.abs(expected[1:-1] - target))) + 1
+        if line <= anchors[-1][0]:
+            continue
+        lo = max(0, int((expected[line] - search_sec) / frame_sec))
+        hi = min(len(loud), int((expected[line] + search_sec) / frame_sec) + 1)
+        time = expected[line]
+        pauses = np.flatnonzero(np.diff(np.concatenate([[1], loud[lo:hi].astype(np.int8), [1]])))
+        if len(pauses):
+            # Pairs of (first quiet frame, first loud frame after it)
+            centres = (pauses[0::2] + pauses[1::2]) / 2
+            time = (lo + centres[np.argmin(np.abs(lo + centres - expected[line] / frame_sec))]) * frame_sec
+        if time <= anchors[-1][1]:
+            continue
+        anchors.append((line, time))
+    anchors.append((len(lines), duration_sec))
+
+    # Between anchors, expect lines from the speech heard between those anchors
+    expected = expected_starts([line for line, _ in anchors], [time for _, time in anchors])
+
+    windows = []
+    for (core_first, start), (core_end, end) in zip(anchors, anchors[1:]):
+        start_sec = max(0.0, start - overlap_sec)
+        end_sec = min(duration_sec, end + overlap_sec)
+        # Context lines: those expected to be spoken in the added audio
+        first = core_first
+        while first > 0 and expected[first - 1] >= start_sec:
+            first -= 1
+        last = core_end - 1
+        while last + 1 < len(lines) and expected[last + 1] < end_sec:
+            last += 1
+        windows.append({"start_sec": start_sec, "end_sec": end_sec, "first": first, "last": last,
+                        "core_first": core_first, "core_last": core_end - 1})
+    return windows
+
+
+def stitch_windows(windows, alignments, lines, language):
+    """Merge per-window alignments into one {"fragments": [...]} over the whole recording.
+
+    Only the core lines of each window are kept, shifted by the window start, and every
+    fragment is clamped so fragments never overlap or run backwards.
+    """
+    fragments = []
+    previous_end = 0.0
+    for window, alignment in zip(windows, alignments):
+        window_fragments = alignment["fragments"]
+        if len(window_fragments) != window["last"] - window["first"] + 1:
+            raise ValueError(f"Window at {window['start_sec']:.1f}s returned {len(window_fragments)} fragments "
+                             f"for {window['last'] - window['first'] + 1} lines")
+        for index in range(window["core_first"], window["core_last"] + 1):
+            fragment = window_fragments[index - window["first"]]
+            begin = max(previous_end, window["start_sec"] + float(fragment["begin"]))
+            end = max(begin, window["start_sec"] + float(fragment["end"]))
+            fragments.append({
+                "begin": f"{begin:.3f}",
+                "end": f"{end:.3f}",
+                "id": f"f{index + 1:06}",
+                "language": language,
+                "lines": [lines[index]],
+                "children": [],
+            })
+            previous_end = end
+    return {"fragments": fragments}
+
+
+class AlignmentPool:
+    """Process pool of aeneas workers that stay up for the whole run.
+
+    submit() returns a future of (alignment, audio): the file's alignment
+    ({"fragments": [...]}) and its DecodedAudio, so the caller can chunk the file without
+    decoding it again. Each file is decoded once, here: files up to WINDOWED_OVER_SEC are
+    handed to one worker as a 16kHz WAV in scratch (or as they are, if they already are
+    one), and longer ones are split by plan_windows, their windows aligned in parallel and
+    stitched back together, so the memory of a worker depends on WINDOW_SEC and not on the
+    length of the recording. Workers are only started once a file actually needs aeneas,
+    so runs served entirely from word timing sidecars start none. They are spawned rather
+    than forked, as the planner threads are running by then.
+    """
+
+    def __init__(self, workers=None, scratch_dir=None):
+        workers = workers or ALIGN_WORKERS
+        self.scratch_dir = scratch_dir or SCRATCH_DIR
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        # Threads that decode a file, plan its windows and wait for them
+        self.planner = ThreadPoolExecutor(max_workers=workers)
+
+    def submit(self, audio_path, transcript_path, language, prepare=None):
+        """prepare(audio_path), when given, runs on the planner thread first and returns the
+        path to align instead (such as a silence-removed copy), so it overlaps other files."""
+        return self.planner.submit(self.align_file, audio_path, transcript_path, language, prepare)
+
+    def align_file(self, audio_path, transcript_path, language, prepare=None):
+        if prepare is not None:
+            audio_path = prepare(audio_path)
+        audio = decode(audio_path, self.scratch_dir)
+        lines = transcript_lines(transcript_path)
+        if audio.duration_sec > WINDOWED_OVER_SEC and len(lines) >= 2:
+            return self.align_windowed(audio, lines, language), audio
+        if audio.samples.dtype == np.int16:
+            # Already a 16kHz WAV (from_wav), which aeneas reads as it is
+            return self.executor.submit(align, audio_path, transcript_path, language, self.scratch_dir).result(), audio
+        scratch = tempfile.mkdtemp(prefix="aeneas_file_", dir=self.scratch_dir)
+        try:
+            wav_path = os.path.join(scratch, "audio.wav")
+            audio.export_wav(wav_path, 0, audio.duration_sec)
+            alignment = self.executor.submit(align, wav_path, transcript_path, language, self.scratch_dir).result()
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        return alignment, audio
+
+    def align_windowed(self, audio, lines, language):
+        windows = plan_windows(lines, audio.duration_sec, frame_energy(audio.samples))
+        print(f"Aligning {os.path.basename(str(audio.source))} in {len(windows)} windows")
+        scratch = tempfile.mkdtemp(prefix="aeneas_windows_", dir=self.scratch_dir)
+        try:
+            futures = []
+            for i, window in enumerate(windows):
+                audio_path = os.path.join(scratch, f"window_{i:04}.wav")
+                transcript_path = os.path.join(scratch, f"window_{i:04}.txt")
+                audio.export_wav(audio_path, window["start_sec"], window["end_sec"])
+                with open(transcript_path, "w", encoding="utf-8") as f:
+                    f.write("\n".join(lines[window["first"]:window["last"] + 1]) + "\n")
+                futures.append(self.executor.submit(align, audio_path, transcript_path, language, self.scratch_dir))
+            return stitch_windows(windows, [future.result() for future in futures], lines, language)
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    def close(self):
+        self.planner.shutdown()
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
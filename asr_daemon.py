@@ -0,0 +1,405 @@
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import resource
+import signal
+import socket
+import socketserver
+import time
+from bisect import bisect_right
+from queue import Empty
+
+import numpy as np
+
+from decoded_audio import MEMMAP_OVER_SEC, SAMPLE_RATE, DecodedAudio
+
+ASR_SOCKET = "/tmp/asr_daemon.sock"
+MODEL_NAME = "small"
+WORKERS = 2  # Worker processes, each holding its own copy of the models
+MEMORY_BUDGET_MB = 8000  # Resident memory all workers together may use
+BATCH_SIZE = 16  # VAD segments per model forward pass
+CHUNK_SIZE_SEC = 30  # Longest VAD chunk whisperx merges speech into
+CONCAT_MAX_SEC = MEMMAP_OVER_SEC  # Files concatenated into one transcribe call; longer files go alone, uncopied
+WORKER_START_TIMEOUT_SEC = 900  # How long a worker may take to load the model (a first run downloads it)
+# Where clients decode files for the daemon (see decode): the daemon maps the same pages, so
+# a file is held in memory once, as it would be in the client alone, and never copied
+SHARED_AUDIO_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# Approx. resident MB one CPU worker needs for the int8 model; used to size the pool before
+# anything is loaded. What each load actually added is measured and reported by status jobs.
+MODEL_MEMORY_MB = {"tiny": 450, "base": 600, "small": 1100, "medium": 2600,
+                   "large-v2": 4800, "large-v3": 4800}
+ALIGN_MODEL_MEMORY_MB = 500
+
+
+def rss_mb():
+    """Resident memory of this process in MB."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_model(model_name=MODEL_NAME, threads=0):
+    """Load a whisperx model on the GPU if there is one. Returns (model, device, compute_type)."""
+    import torch
+    import whisperx
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    compute_type = "float16" if device == "cuda" else "int8"  # int8 is safer and faster for CPU
+    options = {"threads": threads} if threads else {}
+    return whisperx.load_model(model_name, device, compute_type=compute_type, **options), device, compute_type
+
+
+class ModelHost:
+    """The models of one process, loaded on first use and then kept.
+
+    memory records the resident MB each load added, which is what a status job reports
+    per worker. Alignment models are loaded per language; when the process is over
+    max_mb, the least recently loaded one is dropped before another is loaded.
+    """
+
+    def __init__(self, model_name=MODEL_NAME, threads=0, max_mb=None):
+        self.model_name = model_name
+        self.threads = threads
+        self.max_mb = max_mb
+        self.model = None
+        self.device = None
+        self.compute_type = None
+        self.align_models = {}  # language -> (model, metadata)
+        self.memory = {}
+        self.jobs = 0
+
+    def _measure(self, name, load):
+        before = rss_mb()
+        loaded = load()
+        self.memory[name] = round(rss_mb() - before, 1)
+        return loaded
+
+    def asr(self):
+        if self.model is None:
+            self.model, self.device, self.compute_type = self._measure(
+                self.model_name, lambda: load_model(self.model_name, self.threads))
+        return self.model
+
+    def aligner(self, language):
+        if language not in self.align_models:
+            import whisperx
+
+            self.asr()
+            while self.align_models and self.max_mb and rss_mb() + ALIGN_MODEL_MEMORY_MB > self.max_mb:
+                dropped = next(iter(self.align_models))
+                del self.align_models[dropped]
+                self.memory.pop(f"align:{dropped}", None)
+                gc.collect()
+            self.align_models[language] = self._measure(
+                f"align:{language}", lambda: whisperx.load_align_model(language_code=language, device=self.device))
+        return self.align_models[language]
+
+    def transcribe_files(self, audios, language=None, batch_size=BATCH_SIZE):
+        """Transcribe several DecodedAudio and return one result per file.
+
+        Files are grouped by language (detected per file when language is None) and each
+        group goes through as few model.transcribe calls as possible: the files are
+        concatenated, up to CONCAT_MAX_SEC per call, with more than CHUNK_SIZE_SEC of silence
+        between them, so no VAD chunk spans two files and segments of all files fill the
+        same batches. A file longer than that (a memory-mapped one) is transcribed on its own
+        without being copied. Each segment is then given back to the file it came from, with
+        its times made relative to that file.
+        """
+        model = self.asr()
+        groups = {}
+        for index, audio in enumerate(audios):
+            groups.setdefault(language or model.detect_language(audio.samples), []).append(index)
+
+        gap = np.zeros(SAMPLE_RATE * (CHUNK_SIZE_SEC + 1), dtype=np.float32)
+        calls = []  # (language, indexes of the files concatenated in one call)
+        for group_language, indexes in groups.items():
+            length = 0
+            for index in indexes:
+                file_length = len(audios[index].samples)
+                fits = length + len(gap) + file_length <= CONCAT_MAX_SEC * SAMPLE_RATE
+                if calls and calls[-1][0] == group_language and fits:
+                    calls[-1][1].append(index)
+                    length += len(gap) + file_length
+                else:
+                    calls.append((group_language, [index]))
+                    length = file_length
+
+        results = [None] * len(audios)
+        for group_language, indexes in calls:
+            parts = []
+            starts = []
+            position = 0
+            for i, index in enumerate(indexes):
+                if i:
+                    parts.append(gap)
+                    position += len(gap)
+                starts.append(position / SAMPLE_RATE)
+                parts.append(audios[index].samples)
+                position += len(audios[index].samples)
+
+            samples = parts[0] if len(parts) == 1 else np.concatenate(parts)
+            result = model.transcribe(samples, batch_size=batch_size, language=group_language,
+                                      chunk_size=CHUNK_SIZE_SEC)
+            for index in indexes:
+                results[index] = {"segments": [], "language": result.get("language")}
+            for segment in result["segments"]:
+                i = max(bisect_right(starts, (segment["start"] + segment["end"]) / 2) - 1, 0)
+                offset = starts[i]
+                results[indexes[i]]["segments"].append(dict(segment, start=segment["start"] - offset,
+                                                            end=segment["end"] - offset))
+        return results
+
+    def align(self, result, audio):
+        """Word timings for a transcription result, from the alignment model of its language."""
+        import whisperx
+
+        align_model, metadata = self.aligner(result["language"])
+        aligned = whisperx.align(result["segments"], align_model, metadata, audio.samples, self.device,
+                                 return_char_alignments=False)
+        return {"segments": aligned["segments"], "word_segments": aligned.get("word_segments", []),
+                "language": result["language"]}
+
+    def run(self, job, audios=None):
+        """Run a job: {"mode": "transcribe" | "align", "paths": [...], "language": None,
+        "batch_size": BATCH_SIZE}. audios may hold the files already decoded by the caller;
+        "samples", when present, holds a sample_spec per path, whose file is memory-mapped
+        instead of decoding the path again (a None spec decodes it)."""
+        start = time.time()
+        mode = job.get("mode", "transcribe")
+        if mode not in ("transcribe", "align"):
+            raise ValueError(f"Unknown mode {mode!r}")
+        if audios is None:
+            specs = job.get("samples") or [None] * len(job["paths"])
+            audios = [DecodedAudio.from_file(path) if spec is None else DecodedAudio(mapped_samples(spec), path)
+                      for spec, path in zip(specs, job["paths"])]
+        results = self.transcribe_files(audios, job.get("language"), job.get("batch_size", BATCH_SIZE))
+        if mode == "align":
+            results = [self.align(result, audio) for result, audio in zip(results, audios)]
+        self.jobs += 1
+        return {"results": results, "audio_sec": sum(audio.duration_sec for audio in audios),
+                "elapsed_sec": time.time() - start, "worker": self.status()}
+
+    def status(self):
+        return {"pid": os.getpid(), "device": self.device, "compute_type": self.compute_type,
+                "jobs": self.jobs, "rss_mb": round(rss_mb(), 1), "models_mb": dict(self.memory)}
+
+
+# ---- Worker processes ----
+_host = None
+
+
+def _init_worker(model_name, threads, max_mb, reports):
+    global _host
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C stops the daemon, which then terminates the pool
+    try:
+        _host = ModelHost(model_name, threads, max_mb)
+        _host.asr()
+    except BaseException as e:
+        # Report instead of only dying, or the daemon would wait for this worker forever
+        reports.put({"pid": os.getpid(), "error": f"{type(e).__name__}: {e}"})
+        raise
+    reports.put(_host.status())
+
+
+def _run_job(job):
+    return _host.run(job)
+
+
+class AsrDaemon:
+    """A pool of worker processes with the model loaded, taking jobs from any number of clients.
+
+    The pool is sized so the workers fit in memory_budget_mb by the MODEL_MEMORY_MB estimate,
+    and every worker loads the model before the daemon starts accepting jobs. Each job runs
+    on one worker; the last status every worker returned is kept for status jobs.
+    """
+
+    def __init__(self, model_name=MODEL_NAME, workers=WORKERS, memory_budget_mb=MEMORY_BUDGET_MB):
+        estimate_mb = MODEL_MEMORY_MB.get(model_name, max(MODEL_MEMORY_MB.values()))
+        fits = max(1, int(memory_budget_mb // estimate_mb))
+        if workers > fits:
+            print(f"{workers} workers of ~{estimate_mb} MB do not fit in {memory_budget_mb} MB, starting {fits}")
+            workers = fits
+        self.model_name = model_name
+        self.memory_budget_mb = memory_budget_mb
+        self.num_workers = workers
+        self.workers = {}
+        threads = max(1, (os.cpu_count() or 1) // workers)
+
+        print(f"Loading {model_name} in {workers} worker processes, {threads} threads each")
+        start = time.time()
+        context = multiprocessing.get_context("spawn")
+        reports = context.Queue()
+        self.pool = context.Pool(workers, _init_worker, (model_name, threads, memory_budget_mb / workers, reports))
+        for _ in range(workers):
+            try:
+                status = reports.get(timeout=WORKER_START_TIMEOUT_SEC)
+            except Empty:
+                self.close()
+                raise RuntimeError(f"ASR workers did not load {model_name} within {WORKER_START_TIMEOUT_SEC}s")
+            if "error" in status:
+                self.close()
+                raise RuntimeError(f"ASR worker {status['pid']} failed to load {model_name}: {status['error']}")
+            self.workers[status["pid"]] = status
+            print(f"Worker {status['pid']} ready on {status['device']}: {status['models_mb']} MB loaded, "
+                  f"{status['rss_mb']:.0f} MB resident")
+        print(f"Models warm in {time.time() - start:.1f}s, {self.resident_mb():.0f} MB resident in total")
+
+    def resident_mb(self):
+        return sum(status["rss_mb"] for status in self.workers.values())
+
+    def status(self):
+        return {"model": self.model_name, "workers": list(self.workers.values()),
+                "resident_mb": round(self.resident_mb(), 1), "memory_budget_mb": self.memory_budget_mb}
+
+    def submit(self, job):
+        if job.get("mode") == "status":
+            return self.status()
+        response = self.pool.apply(_run_job, (job,))
+        self.workers[response["worker"]["pid"]] = response["worker"]
+        return response
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """One JSON job per line in, one JSON response per line out; errors come back as {"error": ...}."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.asr.submit(json.loads(line))
+            except Exception as e:
+                response = {"error": f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(response, ensure_ascii=False, default=float) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+
+class AsrServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, daemon):
+        self.asr = daemon
+        super().__init__(socket_path, JobHandler)
+        os.chmod(socket_path, 0o600)
+
+
+# ---- Client ----
+_local_host = None
+
+
+def decode(path, socket_path=ASR_SOCKET):
+    """Decode a file for run_job. When a daemon socket exists, the samples go into a named
+    file in SHARED_AUDIO_DIR for the daemon to map; call release_file() once run_job returns."""
+    shared_dir = SHARED_AUDIO_DIR if os.path.exists(socket_path) else None
+    return DecodedAudio.from_file(path, shared_dir=shared_dir)
+
+
+def sample_spec(audio):
+    """Where the daemon can map the samples of a DecodedAudio, or None when they are not in a named file."""
+    if audio.mapped_file is None:
+        return None
+    path, offset = audio.mapped_file
+    return {"path": path, "offset": offset, "dtype": audio.samples.dtype.str, "count": len(audio.samples)}
+
+
+def mapped_samples(spec):
+    """Memory-map the samples a sample_spec points to, copy-on-write like a long decode.
+    16-bit samples (a WAV mapped by from_wav) are converted to the float32 the model takes."""
+    if not spec["count"]:
+        return np.zeros(0, dtype=np.float32)
+    samples = np.memmap(spec["path"], dtype=spec["dtype"], mode="c", offset=spec["offset"],
+                        shape=(spec["count"],))
+    if samples.dtype == np.int16:
+        return samples.astype(np.float32) / 32768.0
+    return samples
+
+
+def request(job, socket_path=ASR_SOCKET, timeout=None):
+    """Send one job to the daemon and return its response. Raises FileNotFoundError or
+    ConnectionRefusedError when no daemon is listening on socket_path.
+
+    Paths are sent absolute, as the daemon would resolve relative ones from its own working folder."""
+    if "paths" in job:
+        job = dict(job, paths=[os.path.abspath(path) for path in job["paths"]])
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(timeout)
+        conn.connect(socket_path)
+        conn.sendall((json.dumps(job) + "\n").encode("utf-8"))
+        with conn.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError(f"ASR daemon at {socket_path} closed the connection")
+    response = json.loads(line)
+    if "error" in response:
+        raise RuntimeError(f"ASR daemon: {response['error']}")
+    return response
+
+
+def daemon_available(socket_path=ASR_SOCKET):
+    try:
+        request({"mode": "status"}, socket_path, timeout=5)
+        return True
+    except OSError:
+        return False
+
+
+def run_job(job, audios=None, socket_path=ASR_SOCKET):
+    """Run a job on the daemon, or in this process when no daemon is listening.
+
+    audios (the files of job["paths"], already decoded) are handed to the daemon by the
+    sample_spec of their mapped file, so each file is decoded once whichever process
+    transcribes it; audios decoded by decode() are mapped without a copy. Without a daemon
+    the model is loaded here on the first job and kept for the next ones, and audios are
+    used as they are.
+    """
+    global _local_host
+    try:
+        if audios is not None and os.path.exists(socket_path):
+            return request(dict(job, samples=[sample_spec(audio) for audio in audios]), socket_path)
+        return request(job, socket_path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        if _local_host is None:
+            print(f"No ASR daemon at {socket_path}, loading {MODEL_NAME} in this process")
+            _local_host = ModelHost()
+        return _local_host.run(job, audios)
+
+
+def serve(socket_path=ASR_SOCKET, model_name=MODEL_NAME, workers=WORKERS, memory_budget_mb=MEMORY_BUDGET_MB):
+    """Start the worker pool and answer jobs on socket_path until interrupted."""
+    if os.path.exists(socket_path):
+        if daemon_available(socket_path):
+            raise SystemExit(f"An ASR daemon is already listening on {socket_path}")
+        os.remove(socket_path)
+
+    daemon = AsrDaemon(model_name, workers, memory_budget_mb)
+    server = AsrServer(socket_path, daemon)
+    print(f"Listening on {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+        daemon.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep whisperx models warm and transcribe files for local clients.")
+    parser.add_argument("--socket", default=ASR_SOCKET)
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--memory-budget-mb", type=float, default=MEMORY_BUDGET_MB)
+    args = parser.parse_args()
+    serve(args.socket, args.model, args.workers, args.memory_budget_mb)
+
+
+if __name__ == "__main__":
+    main()
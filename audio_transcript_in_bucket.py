@@ -1,23 +1,62 @@
 import os
+import re
 import io
+import hashlib
 import shutil
+import subprocess
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
 from pathlib import Path
 from google.cloud import speech, storage
 from pydub import AudioSegment
+from pydub.utils import mediainfo
 
-# Set your credentials path
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "/home/vikrant/youtube_downloader/gstt_json.json"
+from bucket_state import BlobStateStore, LOOKUP_BATCH, MAX_ATTEMPTS
+from speech_quota import RateLimitedSpeechClient
+from transcript_cache import CACHE_DB, TranscriptCache, cache_key, decode_command
+from word_timings import response_words, sidecar_path, write_sidecar
+
+# Set your credentials path (used unless GOOGLE_APPLICATION_CREDENTIALS is already set)
+CREDENTIALS_PATH = "/home/vikrant/youtube_downloader/gstt_json.json"
 
 BUCKET_NAME = "mixed_audio_data"
 BASE_GCS_PATH = "full_audio/english"
 LOCAL_TMP = "/tmp/gstt_work/english"
 OUTPUT_DIR = "/home/vikrant/youtube_downloader/english_transcripts"
+STATE_DB = "/home/vikrant/youtube_downloader/english_transcripts/.bucket_state.sqlite3"
+LIST_PAGE_SIZE = 1000  # Blobs per listing request; the listing is streamed page by page
+WORD_TIMESTAMPS = True  # Also save word timings and confidences next to each transcript
+MAX_IN_FLIGHT = 8  # Max blobs being prepared or recognized at the same time
+PREPARE_WORKERS = 4  # Threads that download, convert and upload blobs
+POLL_INTERVAL_SEC = 15  # How often in-flight recognition operations are polled
+UPLOAD_ENCODING = "flac"  # "linear16" (WAV), "flac" or "ogg_opus"
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # Resumable upload chunk size for streamed uploads (multiple of 256 KB)
+
+# Upload encodings: ffmpeg output arguments, RecognitionConfig encoding, file extension, content type
+UPLOAD_ENCODINGS = {
+    "linear16": (["-f", "wav", "-acodec", "pcm_s16le"], "LINEAR16", ".wav", "audio/wav"),
+    "flac": (["-f", "flac"], "FLAC", ".flac", "audio/flac"),
+    "ogg_opus": (["-f", "ogg", "-acodec", "libopus", "-b:a", "32k"], "OGG_OPUS", ".opus", "audio/ogg"),
+}
+
+# GCP clients and transcript cache, created by init_clients()
+speech_client = None
+storage_client = None
+cache = None
 
-# Init GCP clients
-speech_client = speech.SpeechClient()
-storage_client = storage.Client()
+def init_clients(speech_client_override=None, storage_client_override=None, cache_path=CACHE_DB):
+    """Create the GCP clients and open the transcript cache at cache_path (None disables it).
+    Pass fake clients to run the pipeline offline.
 
-os.makedirs(LOCAL_TMP, exist_ok=True)
+    The speech client is wrapped in the shared quota limiter, so recognitions are rate
+    limited and quota errors retried whichever client is used."""
+    global speech_client, storage_client, cache
+    if speech_client_override is None or storage_client_override is None:
+        os.environ.setdefault("GOOGLE_APPLICATION_CREDENTIALS", CREDENTIALS_PATH)
+    speech_client = RateLimitedSpeechClient(speech_client_override or speech.SpeechClient())
+    storage_client = storage_client_override or storage.Client()
+    cache = TranscriptCache(cache_path) if cache_path else None
 
 def convert_mp3_to_wav(mp3_path, wav_path):
     sound = AudioSegment.from_file(mp3_path)
@@ -36,72 +75,311 @@ def upload_blob(bucket_name, source_file_name, destination_blob_name):
     blob.upload_from_filename(source_file_name)
     return f"gs://{bucket_name}/{destination_blob_name}"
 
-def transcribe_long_audio_gcs(gcs_uri):
-    audio = speech.RecognitionAudio(uri=gcs_uri)
-    config = speech.RecognitionConfig(
-        encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+class CountingReader:
+    """Wraps a pipe for streaming uploads: counts the bytes read and reports them as tell(),
+    which resumable uploads need but pipes cannot provide."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def tell(self):
+        return self.bytes_read
+
+def encode_and_upload(mp3_path, bucket_name, destination_blob_name, encoding, client=None):
+    """Encode an MP3 to 16kHz mono FLAC/OGG_OPUS with ffmpeg and stream it straight into
+    a GCS upload, without writing the encoded file to LOCAL_TMP. Returns (gcs_uri, bytes uploaded).
+    client defaults to the storage client of init_clients()."""
+    output_args, _, _, content_type = UPLOAD_ENCODINGS[encoding]
+    command = [AudioSegment.converter, "-nostdin", "-v", "error", "-i", mp3_path,
+               "-ac", "1", "-ar", "16000"] + output_args + ["-"]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    reader = CountingReader(process.stdout)
+    try:
+        blob = (client or storage_client).bucket(bucket_name).blob(destination_blob_name)
+        blob.chunk_size = UPLOAD_CHUNK_SIZE
+        blob.upload_from_file(reader, content_type=content_type)
+    finally:
+        process.stdout.close()
+        process.wait()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to encode {mp3_path} as {encoding} (exit code {process.returncode})")
+    return f"gs://{bucket_name}/{destination_blob_name}", reader.bytes_read
+
+def decoded_pcm_digest(path):
+    """Decode a file to 16kHz mono 16-bit PCM with the cache's decoder (shared with
+    transcript.py) and hash it as it streams by. Returns (sha1 hex digest, PCM bytes)."""
+    process = subprocess.Popen(decode_command(path), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    digest = hashlib.sha1()
+    num_bytes = 0
+    for block in iter(lambda: process.stdout.read(1024 * 1024), b""):
+        digest.update(block)
+        num_bytes += len(block)
+    process.stdout.close()
+    if process.wait() != 0:
+        raise RuntimeError(f"ffmpeg failed to decode {path} (exit code {process.returncode})")
+    return digest.hexdigest(), num_bytes
+
+def audio_duration_sec(path):
+    try:
+        return float(mediainfo(path)["duration"])
+    except Exception:
+        pass
+    # No ffprobe: decode to nowhere and read the last progress time ffmpeg reports
+    result = subprocess.run([AudioSegment.converter, "-nostdin", "-i", path, "-f", "null", "-"],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    times = re.findall(r"time=(\d+):(\d+):(\d+(?:\.\d+)?)", result.stderr.decode(errors="replace"))
+    if not times:
+        return 0.0
+    hours, minutes, seconds = times[-1]
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+def recognition_config(encoding=UPLOAD_ENCODING):
+    return speech.RecognitionConfig(
+        encoding=getattr(speech.RecognitionConfig.AudioEncoding, UPLOAD_ENCODINGS[encoding][1]),
         sample_rate_hertz=16000,
         language_code="en-IN",  # English (India)
-        enable_automatic_punctuation=True
+        enable_automatic_punctuation=True,
+        enable_word_time_offsets=WORD_TIMESTAMPS,
+        enable_word_confidence=WORD_TIMESTAMPS
     )
-    operation = speech_client.long_running_recognize(config=config, audio=audio)
+
+def start_long_audio_recognition(gcs_uri, encoding=UPLOAD_ENCODING, audio_sec=0.0):
+    """Start a long-running recognition and return the operation without waiting for it.
+    encoding must be the one gcs_uri was uploaded in. audio_sec is charged against the
+    audio-seconds quota."""
+    audio = speech.RecognitionAudio(uri=gcs_uri)
+    return speech_client.long_running_recognize(config=recognition_config(encoding), audio=audio,
+                                                audio_sec=audio_sec)
+
+def response_transcript(response):
+    return " ".join(result.alternatives[0].transcript for result in response.results)
+
+def transcribe_long_audio_gcs(gcs_uri):
+    operation = start_long_audio_recognition(gcs_uri)
     response = operation.result(timeout=5000)
+    return response_transcript(response)
 
-    transcript = " ".join(result.alternatives[0].transcript for result in response.results)
-    return transcript
+def prepare_blob(job):
+    """Download, convert and upload one blob, then start its recognition. Runs on a worker thread.
+    Returns None instead of an operation when the transcript cache already has the audio."""
+    download_blob(BUCKET_NAME, job["blob_name"], job["mp3_local"])
+    print(f"Downloaded {job['mp3_local']}")
 
-def process_bucket():
-    blobs = storage_client.list_blobs(BUCKET_NAME, prefix=BASE_GCS_PATH)
-    blobs_list = list(blobs)
+    if cache is not None:
+        digest, num_bytes = decoded_pcm_digest(job["mp3_local"])
+        job["audio_sec"] = num_bytes / 32000
+        job["cache_key"] = cache_key(digest, recognition_config(job["encoding"]))
+        job["cached"] = cache.get(job["cache_key"])
+        if job["cached"] is not None:
+            print(f"Transcript cache hit: {job['blob_name']}")
+            return None
 
-    if not blobs_list:
-        print("No blobs found in the bucket.")
-        return
+    if job["encoding"] == "linear16":
+        convert_mp3_to_wav(job["mp3_local"], job["wav_local"])
+        print(f"Converted to WAV: {job['wav_local']}")
 
-    print(f"Found {len(blobs_list)} blobs to process.")
+        gcs_uri = upload_blob(BUCKET_NAME, job["wav_local"], job["gcs_wav_path"])
+        job["bytes_uploaded"] = os.path.getsize(job["wav_local"])
+        job["audio_sec"] = (job["bytes_uploaded"] - 44) / 32000
+        job["uploaded"] = True
+        print(f"Uploaded WAV to GCS: {gcs_uri}")
+    else:
+        if "audio_sec" not in job:
+            job["audio_sec"] = audio_duration_sec(job["mp3_local"])
+        job["uploaded"] = True  # A failed streamed upload may still leave a partial object
+        gcs_uri, job["bytes_uploaded"] = encode_and_upload(job["mp3_local"], BUCKET_NAME,
+                                                           job["gcs_wav_path"], job["encoding"])
+        print(f"Uploaded {job['encoding'].upper()} to GCS: {gcs_uri}")
 
-    for blob in blobs_list:
-        if blob.name.endswith(".mp3"):
-            try:
-                rel_path = os.path.relpath(blob.name, BASE_GCS_PATH)
-                base_name = os.path.splitext(rel_path)[0]
-                local_out_path = os.path.join(OUTPUT_DIR, base_name + ".txt")
+    return start_long_audio_recognition(gcs_uri, job["encoding"], job["audio_sec"])
 
-                # Skip if already processed
-                if os.path.exists(local_out_path):
-                    print(f"Skipping already processed file: {blob.name}")
-                    continue
+def cleanup_job(job):
+    for local_path in (job["mp3_local"], job["wav_local"]):
+        if os.path.exists(local_path):
+            os.remove(local_path)
+    if job.get("uploaded"):
+        try:
+            storage_client.bucket(BUCKET_NAME).blob(job["gcs_wav_path"]).delete()
+        except Exception as e:
+            print(f"Error deleting gs://{BUCKET_NAME}/{job['gcs_wav_path']}: {e}")
 
-                print(f"Processing: {blob.name}")
+def finish_job(job, operation, stats=None, state=None):
+    """Write the transcript of a finished operation (or of a cache hit, when operation is None),
+    record it in the state store and clean up its temporary files."""
+    try:
+        if operation is None:
+            transcript, words = job["cached"]
+        else:
+            response = operation.result()
+            transcript = response_transcript(response)
+            words = response_words(response) if WORD_TIMESTAMPS else None
+            if job.get("cache_key") is not None:
+                cache.put(job["cache_key"], transcript, words)
+        print(f"Transcript: {transcript}")
 
-                mp3_local = os.path.join(LOCAL_TMP, os.path.basename(blob.name))
-                wav_local = mp3_local.replace(".mp3", ".wav")
-                gcs_wav_path = f"gstt_temp/{Path(wav_local).name}"
+        os.makedirs(os.path.dirname(job["local_out_path"]), exist_ok=True)
+        with open(job["local_out_path"], "w", encoding="utf-8") as f:
+            f.write(transcript)
+        if words is not None:
+            write_sidecar(sidecar_path(job["local_out_path"]), words)
 
-                download_blob(BUCKET_NAME, blob.name, mp3_local)
-                print(f"Downloaded {mp3_local}")
+        print(f"Transcript saved to {job['local_out_path']}")
+        if stats is not None:
+            stats["files"] += 1
+            stats["bytes_uploaded"] += job.get("bytes_uploaded", 0)
+            stats["audio_sec"] += job.get("audio_sec", 0.0)
+        if state is not None:
+            state.mark_done(job["blob"], job["local_out_path"], job.get("audio_sec"),
+                            time.time() - job["started_at"])
+    except Exception as e:
+        print(f"Error processing {job['blob_name']}: {e}")
+        if state is not None:
+            state.mark_failed(job["blob"], e)
+    finally:
+        cleanup_job(job)
 
-                convert_mp3_to_wav(mp3_local, wav_local)
-                print(f"Converted to WAV: {wav_local}")
+def make_job(blob, encoding=UPLOAD_ENCODING):
+    rel_path = os.path.relpath(blob.name, BASE_GCS_PATH)
+    base_name = os.path.splitext(rel_path)[0]
+    # Blobs with the same file name in different folders are in flight together, so the
+    # temporary names carry a hash of the full blob name
+    temp_stem = f"{Path(blob.name).stem}-{hashlib.sha1(blob.name.encode('utf-8')).hexdigest()[:12]}"
+    return {
+        "blob": blob,
+        "blob_name": blob.name,
+        "encoding": encoding,
+        "local_out_path": os.path.join(OUTPUT_DIR, base_name + ".txt"),
+        "mp3_local": os.path.join(LOCAL_TMP, temp_stem + ".mp3"),
+        "wav_local": os.path.join(LOCAL_TMP, temp_stem + ".wav"),
+        "gcs_wav_path": f"gstt_temp/{temp_stem}{UPLOAD_ENCODINGS[encoding][2]}",
+    }
 
-                gcs_uri = upload_blob(BUCKET_NAME, wav_local, gcs_wav_path)
-                print(f"Uploaded WAV to GCS: {gcs_uri}")
+def print_upload_stats(encoding, stats, elapsed):
+    audio_hours = stats["audio_sec"] / 3600
+    print(f"Encoding {encoding}: {stats['files']} files, {stats['bytes_uploaded'] / 1e6:.1f} MB uploaded, "
+          f"{elapsed:.1f} s wall")
+    if audio_hours:
+        print(f"  per audio-hour: {stats['bytes_uploaded'] / 1e6 / audio_hours:.1f} MB uploaded, "
+              f"{elapsed / audio_hours:.1f} s wall")
 
-                transcript = transcribe_long_audio_gcs(gcs_uri)
-                print(f"Transcript: {transcript}")
+def pending_jobs(state, encoding, counts, max_attempts=MAX_ATTEMPTS):
+    """Stream the listing under BASE_GCS_PATH page by page and yield a job for every MP3
+    that is new, was overwritten since it was transcribed, or failed fewer than
+    max_attempts times. Blobs are looked up in the state store LOOKUP_BATCH at a time."""
+    blobs = storage_client.list_blobs(BUCKET_NAME, prefix=BASE_GCS_PATH, page_size=LIST_PAGE_SIZE)
+    mp3_blobs = (blob for blob in blobs if blob.name.endswith(".mp3"))
+    while True:
+        batch = list(islice(mp3_blobs, LOOKUP_BATCH))
+        if not batch:
+            return
+        rows = state.lookup(blob.name for blob in batch)
+        for blob in batch:
+            counts["listed"] += 1
+            job = make_job(blob, encoding)
+            row = rows.get(blob.name)
+            if row is None and os.path.exists(job["local_out_path"]):
+                # Transcribed before the state store existed
+                state.mark_done(blob, job["local_out_path"])
+                row = rows[blob.name] = (blob.generation, blob.md5_hash, "done", 0)
+            if not state.needs_processing(blob, row, max_attempts):
+                counts["skipped"] += 1
+                continue
+            if row is not None and row[2] == "done":
+                print(f"Blob changed since it was transcribed: {blob.name}")
+            yield job
 
-                os.makedirs(os.path.dirname(local_out_path), exist_ok=True)
-                with open(local_out_path, "w", encoding="utf-8") as f:
-                    f.write(transcript)
+def process_bucket(max_in_flight=MAX_IN_FLIGHT, poll_interval=POLL_INTERVAL_SEC, encoding=UPLOAD_ENCODING,
+                   state_db=STATE_DB):
+    """Transcribe every MP3 under BASE_GCS_PATH, keeping up to max_in_flight blobs in flight.
 
-                print(f"Transcript saved to {local_out_path}")
+    Worker threads download, convert and upload blobs and start their long-running
+    recognition; the main thread polls all started operations together every
+    poll_interval seconds and writes each transcript as soon as its operation finishes.
+
+    encoding selects what is uploaded for recognition: "linear16" converts to a WAV in
+    LOCAL_TMP first, while "flac" and "ogg_opus" are encoded by ffmpeg and streamed
+    straight into the upload. Bytes uploaded and wall time per audio-hour are printed
+    at the end. Returns those statistics.
+
+    Which blobs need work is decided by the SQLite store at state_db, keyed by blob
+    name, generation and md5, while the listing is streamed; an incremental run costs
+    one listing pass plus batched indexed lookups, and overwritten blobs are
+    transcribed again.
+    """
+    os.makedirs(LOCAL_TMP, exist_ok=True)
+    state = BlobStateStore(state_db)
+    counts = {"listed": 0, "skipped": 0}
+    pending = pending_jobs(state, encoding, counts)
+    listing_done = False
+
+    preparing = {}  # future -> job
+    recognizing = []  # (operation, job)
+    stats = {"files": 0, "bytes_uploaded": 0, "audio_sec": 0.0}
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=min(PREPARE_WORKERS, max_in_flight)) as executor:
+        while not listing_done or preparing or recognizing:
+            # Top up to the in-flight limit
+            while not listing_done and len(preparing) + len(recognizing) < max_in_flight:
+                job = next(pending, None)
+                if job is None:
+                    listing_done = True
+                    break
+                print(f"Processing: {job['blob_name']}")
+                job["started_at"] = time.time()
+                state.mark_running(job["blob"])
+                preparing[executor.submit(prepare_blob, job)] = job
+
+            # Wait for a prepared blob, or just for the next poll when only operations are left
+            if preparing:
+                done, _ = wait(preparing, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            else:
+                done = ()
+                time.sleep(poll_interval)
+
+            for future in done:
+                job = preparing.pop(future)
+                try:
+                    operation = future.result()
+                except Exception as e:
+                    print(f"Error processing {job['blob_name']}: {e}")
+                    state.mark_failed(job["blob"], e)
+                    cleanup_job(job)
+                    continue
+                if operation is None:
+                    finish_job(job, None, stats, state)
+                else:
+                    recognizing.append((operation, job))
 
-                # Cleanup
-                os.remove(mp3_local)
-                os.remove(wav_local)
-                storage_client.bucket(BUCKET_NAME).blob(gcs_wav_path).delete()
+            # Poll all in-flight operations together
+            still_running = []
+            for operation, job in recognizing:
+                try:
+                    finished = operation.done()
+                except Exception as e:
+                    # A failed poll is retried on the next round
+                    print(f"Error polling {job['blob_name']}: {e}")
+                    finished = False
+                if finished:
+                    finish_job(job, operation, stats, state)
+                else:
+                    still_running.append((operation, job))
+            recognizing = still_running
 
-            except Exception as e:
-                print(f"Error processing {blob.name}: {e}")
+    print(f"Listed {counts['listed']} MP3 blobs, skipped {counts['skipped']} already transcribed.")
+    print(f"State store {state_db}: {state.counts()}")
+    state.close()
+    speech_client.print_metrics()
+    if cache is not None:
+        cache.print_stats()
+    print_upload_stats(encoding, stats, time.time() - start_time)
+    return stats
 
-process_bucket()
+if __name__ == "__main__":
+    init_clients()
+    process_bucket()
@@ -0,0 +1,93 @@
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from pydub import AudioSegment
+
+import audio_transcript_in_bucket as bucket_stt
+from fake_gcp import FakeSpeechClient, FakeStorageClient
+from speech_quota import TokenBucket
+
+
+def synthetic_mp3(duration_sec):
+    """Returns the bytes of a mono MP3 of pink noise."""
+    result = subprocess.run([AudioSegment.converter, "-nostdin", "-v", "error", "-f", "lavfi",
+                             "-i", f"anoisesrc=d={duration_sec}:c=pink", "-ac", "1", "-f", "mp3", "-"],
+                            check=True, stdout=subprocess.PIPE)
+    return result.stdout
+
+
+def run(num_blobs, max_in_flight, speech_latency, mp3_bytes, encoding=bucket_stt.UPLOAD_ENCODING,
+        bandwidth=50 * 1024 * 1024, error_rate=0.0, requests_per_minute=None):
+    """Runs process_bucket against fake clients and returns (wall seconds, upload statistics)."""
+    storage_client = FakeStorageClient(bandwidth_bytes_per_sec=bandwidth)
+    for i in range(num_blobs):
+        storage_client.add_blob(bucket_stt.BUCKET_NAME, f"{bucket_stt.BASE_GCS_PATH}/file_{i:04}.mp3", mp3_bytes)
+    bucket_stt.init_clients(FakeSpeechClient(latency_sec=speech_latency, error_rate=error_rate), storage_client,
+                            cache_path=None)
+    limiter = bucket_stt.speech_client
+    limiter.backoff_base_sec = 0.05  # Keep injected 429s from dominating the wall time
+    if requests_per_minute:
+        limiter.requests = TokenBucket(requests_per_minute)
+
+    output_dir = tempfile.mkdtemp(prefix="bench_transcripts_")
+    local_tmp = tempfile.mkdtemp(prefix="bench_tmp_")
+    bucket_stt.OUTPUT_DIR, bucket_stt.LOCAL_TMP = output_dir, local_tmp
+    try:
+        start = time.perf_counter()
+        stats = bucket_stt.process_bucket(max_in_flight=max_in_flight, poll_interval=0.05, encoding=encoding,
+                                          state_db=os.path.join(local_tmp, "state.sqlite3"))
+        return time.perf_counter() - start, stats
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        shutil.rmtree(local_tmp, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure process_bucket throughput against fake GCP clients.")
+    parser.add_argument("--blobs", type=int, default=32)
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--speech-latency", type=float, default=2.0,
+                        help="Simulated seconds per long-running recognition")
+    parser.add_argument("--audio-sec", type=int, default=30, help="Duration of each synthetic MP3")
+    parser.add_argument("--compare", choices=["in-flight", "encodings"], default="in-flight",
+                        help="Compare in-flight limits, or upload encodings at the first in-flight limit")
+    parser.add_argument("--upload-mbps", type=float, default=400.0,
+                        help="Simulated storage bandwidth in megabits per second")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of recognition requests the fake client rejects with a 429")
+    parser.add_argument("--requests-per-minute", type=float, default=None,
+                        help="Request quota of the limiter (default: speech_quota.REQUESTS_PER_MINUTE)")
+    args = parser.parse_args()
+
+    mp3_bytes = synthetic_mp3(args.audio_sec)
+    bandwidth = args.upload_mbps * 1e6 / 8
+
+    if args.compare == "encodings":
+        print(f"{'encoding':<10}{'MB up':>10}{'MB/audio-h':>12}{'wall s':>10}{'wall s/audio-h':>16}")
+        for encoding in bucket_stt.UPLOAD_ENCODINGS:
+            wall, stats = run(args.blobs, args.in_flight[0], args.speech_latency, mp3_bytes, encoding, bandwidth)
+            audio_hours = stats["audio_sec"] / 3600
+            if not audio_hours:
+                # Every job failed (e.g. the encoder is missing), so there is nothing to divide by
+                print(f"{encoding:<10}{stats['bytes_uploaded'] / 1e6:>10.1f}{'n/a':>12}{wall:>10.2f}{'n/a':>16}")
+                continue
+            print(f"{encoding:<10}{stats['bytes_uploaded'] / 1e6:>10.1f}"
+                  f"{stats['bytes_uploaded'] / 1e6 / audio_hours:>12.1f}{wall:>10.2f}{wall / audio_hours:>16.1f}")
+        return
+
+    results = [(n, run(args.blobs, n, args.speech_latency, mp3_bytes, bandwidth=bandwidth,
+                       error_rate=args.error_rate, requests_per_minute=args.requests_per_minute)[0])
+               for n in args.in_flight]
+
+    print(f"{'in-flight':>10}{'wall s':>10}{'files/sec':>12}{'speedup':>10}")
+    baseline = results[0][1]
+    for n, wall in results:
+        print(f"{n:>10}{wall:>10.2f}{args.blobs / wall:>12.2f}{baseline / wall:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
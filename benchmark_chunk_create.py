@@ -0,0 +1,109 @@
+import argparse
+import logging
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import chunk_create
+
+# Synthetic input used when no --input-root is given
+SYNTHETIC_FILES = 16
+SYNTHETIC_DURATION_SEC = 120
+
+
+def make_synthetic_input(root: Path, language: str, num_files: int, duration_sec: int):
+    """Generates num_files stereo 44.1kHz MP3 files of noise under root/<language>."""
+    lang_folder = root / language
+    lang_folder.mkdir(parents=True, exist_ok=True)
+    for i in range(num_files):
+        out_path = lang_folder / f"synthetic_{i:03}.mp3"
+        subprocess.run([chunk_create.AudioSegment.converter, "-nostdin", "-v", "error", "-y",
+                        "-f", "lavfi", "-i", f"anoisesrc=d={duration_sec}:c=pink",
+                        "-ac", "2", "-ar", "44100", str(out_path)], check=True)
+
+
+def cpu_seconds() -> float:
+    """User + system CPU time of this process and all reaped children (pool workers, ffmpeg)."""
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def audio_seconds(output_root: Path) -> float:
+    """Total duration of the exported 16kHz mono 16-bit chunks, from their file sizes."""
+    bytes_per_sec = chunk_create.SAMPLE_RATE * chunk_create.SAMPLE_WIDTH
+    return sum((p.stat().st_size - 44) / bytes_per_sec for p in output_root.rglob("*.wav"))
+
+
+def run_config(label: str, input_root: Path, language: str, options: dict) -> dict:
+    """Runs process_all once with the given keyword options and measures throughput."""
+    output_root = Path(tempfile.mkdtemp(prefix="bench_output_"))
+    try:
+        cpu_start = cpu_seconds()
+        wall_start = time.perf_counter()
+        chunk_create.process_all(input_root, output_root, chunk_create.CHUNK_LENGTH_SEC,
+                                 chunk_create.TRAIN_RATIO, language, **options)
+        wall = time.perf_counter() - wall_start
+        cpu = cpu_seconds() - cpu_start
+        audio_hours = audio_seconds(output_root) / 3600
+    finally:
+        shutil.rmtree(output_root, ignore_errors=True)
+    num_files = len(chunk_create.gather_files(input_root, language))
+    return {
+        "config": label,
+        "files_per_sec": num_files / wall if wall else 0.0,
+        "audio_hours_per_cpu_hour": audio_hours / (cpu / 3600) if cpu else 0.0,
+        "wall_sec": wall,
+        "cpu_sec": cpu,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare engines or boundary modes of chunk_create.process_all.")
+    parser.add_argument("--input-root", type=Path, default=None,
+                        help="Folder containing <language>/*.mp3 (default: generate synthetic input)")
+    parser.add_argument("--language", "-l", default="english")
+    parser.add_argument("--compare", choices=["engines", "boundaries"], default="engines",
+                        help="Compare the thread and process engines, or fixed-length and energy boundaries")
+    parser.add_argument("--engine", choices=sorted(chunk_create.ENGINES), default="process",
+                        help="Engine used when comparing boundary modes")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--memory-budget-mb", type=float, default=None)
+    args = parser.parse_args()
+
+    synthetic_root = None
+    input_root = args.input_root
+    if input_root is None:
+        synthetic_root = input_root = Path(tempfile.mkdtemp(prefix="bench_input_"))
+        make_synthetic_input(input_root, args.language, SYNTHETIC_FILES, SYNTHETIC_DURATION_SEC)
+
+    common = {"max_workers": args.workers, "memory_budget_mb": args.memory_budget_mb}
+    if args.compare == "engines":
+        configs = [(engine, dict(common, engine=engine, streaming=args.stream))
+                   for engine in sorted(chunk_create.ENGINES)]
+    else:
+        # Both boundary modes use the streaming decoder, so only the cut placement differs
+        configs = [(mode, dict(common, engine=args.engine, streaming=True, boundary_mode=mode))
+                   for mode in chunk_create.BOUNDARY_MODES]
+
+    try:
+        results = [run_config(label, input_root, args.language, options) for label, options in configs]
+    finally:
+        if synthetic_root:
+            shutil.rmtree(synthetic_root, ignore_errors=True)
+
+    print(f"{'config':<10}{'files/sec':>12}{'audio-h/CPU-h':>16}{'wall s':>10}{'CPU s':>10}")
+    for r in results:
+        print(f"{r['config']:<10}{r['files_per_sec']:>12.2f}{r['audio_hours_per_cpu_hour']:>16.1f}"
+              f"{r['wall_sec']:>10.2f}{r['cpu_sec']:>10.2f}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s: %(message)s")
+    main()
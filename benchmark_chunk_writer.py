@@ -0,0 +1,85 @@
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from pydub import AudioSegment
+
+from chunk_writer import ChunkWriter
+from decoded_audio import DecodedAudio
+
+
+def make_synthetic_input(path, duration_sec):
+    """Generates a stereo 44.1kHz WAV of pink noise, the kind of source the chunkers resample."""
+    subprocess.run([AudioSegment.converter, "-nostdin", "-v", "error", "-y", "-f", "lavfi",
+                    "-i", f"anoisesrc=d={duration_sec}:c=pink", "-ac", "2", "-ar", "44100", path], check=True)
+
+
+def spans(duration_sec, chunk_sec):
+    return [(start, min(start + chunk_sec, duration_sec)) for start in range(0, int(duration_sec), chunk_sec)]
+
+
+def run_pydub(audio_path, output_dir, chunk_sec):
+    """The previous path: slice an AudioSegment, then resample and export every chunk."""
+    start_time = time.perf_counter()
+    audio = AudioSegment.from_file(audio_path)
+    write_start = time.perf_counter()
+    chunks = spans(len(audio) / 1000, chunk_sec)
+    for i, (start, end) in enumerate(chunks):
+        chunk_audio = audio[int(start * 1000):int(end * 1000)].set_frame_rate(16000).set_channels(1)
+        chunk_audio.export(os.path.join(output_dir, f"chunk_{i:05}.wav"), format="wav")
+        with open(os.path.join(output_dir, f"chunk_{i:05}.txt"), "w", encoding="utf-8") as f:
+            f.write("text")
+    end_time = time.perf_counter()
+    return len(chunks), end_time - start_time, end_time - write_start
+
+
+def run_writer(audio_path, output_dir, chunk_sec, workers):
+    """Decode and resample once, then write every chunk from the same PCM buffer."""
+    start_time = time.perf_counter()
+    audio = DecodedAudio.from_file(audio_path)
+    write_start = time.perf_counter()
+    chunks = spans(audio.duration_sec, chunk_sec)
+    with ChunkWriter(workers=workers) as writer:
+        for i, (start, end) in enumerate(chunks):
+            writer.write(audio, os.path.join(output_dir, f"chunk_{i:05}.wav"), start, end, "text",
+                         os.path.join(output_dir, f"chunk_{i:05}.txt"))
+    end_time = time.perf_counter()
+    return len(chunks), end_time - start_time, end_time - write_start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunks/sec of the pydub export path and of ChunkWriter.")
+    parser.add_argument("--audio", default=None, help="Source file (default: synthesize a stereo 44.1kHz WAV)")
+    parser.add_argument("--duration-sec", type=int, default=1800, help="Length of the synthetic source")
+    parser.add_argument("--chunk-sec", type=int, default=5)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 4])
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="bench_chunk_writer_")
+    try:
+        audio_path = args.audio
+        if audio_path is None:
+            audio_path = os.path.join(scratch, "source.wav")
+            make_synthetic_input(audio_path, args.duration_sec)
+
+        configs = [("pydub export", lambda output_dir: run_pydub(audio_path, output_dir, args.chunk_sec))]
+        configs += [(f"writer {workers} threads", lambda output_dir, workers=workers:
+                     run_writer(audio_path, output_dir, args.chunk_sec, workers)) for workers in args.workers]
+        results = []
+        for label, run in configs:
+            output_dir = tempfile.mkdtemp(prefix="chunks_", dir=scratch)
+            results.append((label, run(output_dir)))
+            shutil.rmtree(output_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    print(f"{'config':<20}{'chunks':>8}{'total s':>10}{'write s':>10}{'chunks/s':>10}")
+    for label, (num_chunks, total, writing) in results:
+        print(f"{label:<20}{num_chunks:>8}{total:>10.2f}{writing:>10.2f}{num_chunks / writing if writing else 0:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import cli
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def wall_time(command, repeats):
+    """Best wall time in seconds of running command repeats times."""
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def importtime_lines(code):
+    """(name, cumulative seconds, depth) of every module imported by running code under -X importtime."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=HERE, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    lines = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # The name is indented by two spaces per level below the module that imported it
+        lines.append((name.strip(), int(cumulative) / 1e6, (len(name) - len(name.lstrip())) // 2))
+    return lines
+
+
+def import_times(module_name, startup_modules):
+    """Import module_name in a fresh interpreter. Returns (cumulative seconds of the module,
+    the heaviest modules it imported directly as [(name, seconds)]). Modules the interpreter
+    imports at startup anyway are left out."""
+    total = 0.0
+    direct = []
+    for name, seconds, depth in importtime_lines(f"import {module_name}"):
+        if name == module_name:
+            total = seconds
+        elif depth == 1 and name not in startup_modules:
+            direct.append((name, seconds))
+    return total, sorted(direct, key=lambda item: item[1], reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time of the CLI and import time of every subcommand's script.")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per --help measurement (best is shown)")
+    parser.add_argument("--top", type=int, default=3, help="Heaviest imports shown per script")
+    args = parser.parse_args()
+
+    command = [sys.executable, "cli.py"]
+    print(f"{'cli.py --help':<32}{wall_time(command + ['--help'], args.repeats) * 1000:>8.0f} ms")
+    for subcommand in sorted({name for name, _ in cli.METHOD_MODULES}):
+        print(f"{'cli.py ' + subcommand + ' --help':<32}"
+              f"{wall_time(command + [subcommand, '--help'], args.repeats) * 1000:>8.0f} ms")
+
+    startup_modules = {name for name, _, _ in importtime_lines("pass")}
+    print(f"\n{'subcommand':<32}{'script':<30}{'import ms':>10}  heaviest imports (ms)")
+    rows = [("(cli itself)", "cli")] + [(f"{subcommand} --method {method}", module_name)
+                                        for (subcommand, method), module_name in cli.METHOD_MODULES.items()]
+    for label, module_name in rows:
+        try:
+            total, heaviest = import_times(module_name, startup_modules)
+        except RuntimeError as e:
+            print(f"{label:<32}{module_name:<30}{'-':>10}  {e}")
+            continue
+        details = ", ".join(f"{name} {seconds * 1000:.0f}" for name, seconds in heaviest[:args.top])
+        print(f"{label:<32}{module_name:<30}{total * 1000:>10.0f}  {details}")
+
+
+if __name__ == "__main__":
+    main()
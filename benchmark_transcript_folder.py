@@ -0,0 +1,147 @@
+import argparse
+import os
+import random
+import resource
+import shutil
+import subprocess
+import tempfile
+import wave
+from array import array
+
+from pydub import AudioSegment
+
+import transcript
+from fake_gcp import FakeSpeechClient, FakeStorageClient
+from speech_quota import TokenBucket
+
+
+def make_synthetic_input(root, num_files, duration_sec, conforming=False):
+    """Writes num_files WAVs of noise, spread over a few subfolders. They are 44.1kHz stereo,
+    or already 16kHz mono like chunk_create.py output when conforming is set."""
+    channels, frame_rate = ("1", "16000") if conforming else ("2", "44100")
+    for i in range(num_files):
+        folder = os.path.join(root, f"speaker_{i % 4}")
+        os.makedirs(folder, exist_ok=True)
+        subprocess.run([AudioSegment.converter, "-nostdin", "-v", "error", "-y", "-f", "lavfi",
+                        "-i", f"anoisesrc=d={duration_sec}:c=pink", "-ac", channels, "-ar", frame_rate,
+                        os.path.join(folder, f"chunk_{i:04}.wav")], check=True)
+
+
+def make_word_input(root, num_files, duration_sec, seed=0):
+    """Writes num_files 16kHz mono WAVs of tone bursts separated by silence. The fake client
+    recognizes each burst as one word, so transcripts can be compared across modes."""
+    rng = random.Random(seed)
+    for i in range(num_files):
+        folder = os.path.join(root, f"speaker_{i % 4}")
+        os.makedirs(folder, exist_ok=True)
+        samples = array("h", bytes(2 * int(16000 * duration_sec)))
+        position = rng.randint(1, 4) * 1600
+        while position < len(samples) - 4800:
+            length = rng.randint(2, 6) * 1600
+            for j in range(position, min(position + length, len(samples))):
+                samples[j] = 8000 if (j // 20) % 2 else -8000
+            position += length + rng.randint(2, 5) * 1600
+        with wave.open(os.path.join(folder, f"chunk_{i:04}.wav"), "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(16000)
+            wav.writeframes(samples.tobytes())
+
+
+def read_outputs(output_dir):
+    """{relative path: contents} of every transcript and sidecar under output_dir."""
+    outputs = {}
+    for root, _, files in os.walk(output_dir):
+        for file in files:
+            path = os.path.join(root, file)
+            with open(path, "r", encoding="utf-8") as f:
+                outputs[os.path.relpath(path, output_dir)] = f.read()
+    return outputs
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run(input_dir, max_in_flight, speech_latency, cache_path=None, bundle_size=0, outputs=None):
+    """Runs process_folder against a fake Speech client and returns its statistics, plus CPU
+    seconds and the number of API requests. The transcripts are stored in outputs if given."""
+    storage = FakeStorageClient(latency_sec=0.0)
+    fake = FakeSpeechClient(latency_sec=speech_latency, audio_words=outputs is not None, storage=storage)
+    transcript.init_client(fake, cache_path, storage_client_override=storage)
+    # Quotas are not what is being measured here
+    transcript.client.requests = TokenBucket(1e9)
+    transcript.client.audio_seconds = TokenBucket(1e9)
+    output_dir = tempfile.mkdtemp(prefix="bench_transcripts_")
+    try:
+        cpu_start = cpu_seconds()
+        stats = transcript.process_folder(input_dir, output_dir, max_in_flight, bundle_size)
+        stats["cpu_sec"] = cpu_seconds() - cpu_start
+        stats["requests"] = fake.requests
+        if outputs is not None:
+            outputs.update(read_outputs(output_dir))
+        return stats
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def compare_bundling(args):
+    """Transcribes word-burst files one request each and in bundles, and checks that every
+    transcript and word timing sidecar comes out the same."""
+    input_dir = tempfile.mkdtemp(prefix="bench_wavs_")
+    single, bundled = {}, {}
+    try:
+        make_word_input(input_dir, args.files, args.audio_sec)
+        n = args.in_flight[0]
+        results = [("single", run(input_dir, n, args.speech_latency, outputs=single)),
+                   (f"bundle {args.bundle_size}", run(input_dir, n, args.speech_latency,
+                                                      bundle_size=args.bundle_size, outputs=bundled))]
+    finally:
+        shutil.rmtree(input_dir, ignore_errors=True)
+
+    print(f"{'mode':<12}{'requests':>10}{'wall s':>10}{'files/sec':>12}")
+    for label, stats in results:
+        print(f"{label:<12}{stats['requests']:>10}{stats['elapsed_sec']:>10.2f}{stats['files_per_sec']:>12.2f}")
+    mismatched = sorted(path for path in single if single[path] != bundled.get(path))
+    print(f"{len(single) - len(mismatched)}/{len(single)} outputs identical")
+    for path in mismatched[:5]:
+        print(f"  {path}:\n    single:  {single[path][:120]}\n    bundled: {bundled.get(path, '')[:120]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure transcript.process_folder throughput against a fake Speech client.")
+    parser.add_argument("--files", type=int, default=64)
+    parser.add_argument("--audio-sec", type=float, default=10.0, help="Duration of each synthetic WAV")
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--speech-latency", type=float, default=0.5,
+                        help="Simulated seconds per recognize request")
+    parser.add_argument("--conforming", action="store_true",
+                        help="Generate 16kHz mono 16-bit WAVs, which are passed through without conversion")
+    parser.add_argument("--bundle-size", type=int, default=0,
+                        help="Compare one request per file with bundles of this many files (word-burst input)")
+    parser.add_argument("--cache", action="store_true",
+                        help="Share one transcript cache across the runs, so every run after the first is served from it")
+    args = parser.parse_args()
+
+    if args.bundle_size:
+        compare_bundling(args)
+        return
+
+    input_dir = tempfile.mkdtemp(prefix="bench_wavs_")
+    cache_path = os.path.join(input_dir, "transcript_cache.sqlite3") if args.cache else None
+    try:
+        make_synthetic_input(input_dir, args.files, args.audio_sec, args.conforming)
+        results = [(n, run(input_dir, n, args.speech_latency, cache_path)) for n in args.in_flight]
+    finally:
+        shutil.rmtree(input_dir, ignore_errors=True)
+
+    print(f"{'in-flight':>10}{'wall s':>10}{'files/sec':>12}{'audio-s/sec':>13}{'CPU ms/file':>13}")
+    for n, stats in results:
+        cpu_ms_per_file = 1000 * stats["cpu_sec"] / stats["files"] if stats["files"] else 0.0
+        print(f"{n:>10}{stats['elapsed_sec']:>10.2f}{stats['files_per_sec']:>12.2f}"
+              f"{stats['audio_sec_per_sec']:>13.1f}{cpu_ms_per_file:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
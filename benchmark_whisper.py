@@ -0,0 +1,83 @@
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+
+from pydub import AudioSegment
+
+import asr_daemon
+import chunk_by_wishper
+from manifest import ManifestWriter
+
+# Sentences read by espeak-ng when no --audio-dir is given
+SYNTHETIC_TEXT = ("The quick brown fox jumps over the lazy dog. "
+                  "We are measuring how fast the speech model transcribes this recording. ")
+
+
+def make_synthetic_input(root, num_files, repeats):
+    """Synthesizes num_files MP3s of English speech with espeak-ng."""
+    for i in range(num_files):
+        wav_path = os.path.join(root, f"speech_{i:03}.wav")
+        subprocess.run(["espeak-ng", "-s", str(150 + 5 * (i % 5)), "-w", wav_path, SYNTHETIC_TEXT * repeats],
+                       check=True)
+        subprocess.run([AudioSegment.converter, "-nostdin", "-v", "error", "-y", "-i", wav_path,
+                        os.path.join(root, f"speech_{i:03}.mp3")], check=True)
+        os.remove(wav_path)
+
+
+def run_config(audio_dir, options):
+    """Runs chunk_by_wishper.process_all_files with its outputs redirected to a temp folder."""
+    output_root = tempfile.mkdtemp(prefix="bench_whisper_")
+    chunk_by_wishper.OUTPUT_AUDIO_DIR = os.path.join(output_root, "audio_chunks")
+    chunk_by_wishper.OUTPUT_TEXT_DIR = os.path.join(output_root, "transcript_chunks")
+    chunk_by_wishper.MANIFEST_PATH = os.path.join(output_root, "manifest.jsonl")
+    chunk_by_wishper.manifest = ManifestWriter(chunk_by_wishper.MANIFEST_PATH)
+    os.makedirs(chunk_by_wishper.OUTPUT_AUDIO_DIR)
+    os.makedirs(chunk_by_wishper.OUTPUT_TEXT_DIR)
+    try:
+        return chunk_by_wishper.process_all_files(audio_dir, **options)
+    finally:
+        chunk_by_wishper.manifest.close()
+        shutil.rmtree(output_root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Real-time factor of chunk_by_wishper with and without cross-file batching.")
+    parser.add_argument("--audio-dir", default=None, help="Folder of MP3s (default: synthesize speech with espeak-ng)")
+    parser.add_argument("--files", type=int, default=8, help="Number of synthetic files")
+    parser.add_argument("--repeats", type=int, default=6, help="Times the synthetic text is read per file")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[4, 16])
+    parser.add_argument("--files-per-call", type=int, default=chunk_by_wishper.FILES_PER_CALL)
+    args = parser.parse_args()
+
+    synthetic_dir = None
+    audio_dir = args.audio_dir
+    if audio_dir is None:
+        synthetic_dir = audio_dir = tempfile.mkdtemp(prefix="bench_speech_")
+        make_synthetic_input(audio_dir, args.files, args.repeats)
+
+    configs = [("serial", {"files_per_call": 1, "batch_size": args.batch_sizes[0], "decode_workers": 0})]
+    configs += [(f"batched {batch_size}", {"files_per_call": args.files_per_call, "batch_size": batch_size})
+                for batch_size in args.batch_sizes]
+    try:
+        results = [(label, run_config(audio_dir, options)) for label, options in configs]
+    finally:
+        if synthetic_dir:
+            shutil.rmtree(synthetic_dir, ignore_errors=True)
+
+    if asr_daemon.daemon_available():
+        workers = asr_daemon.request({"mode": "status"})["workers"]
+        print(f"ASR daemon: {len(workers)} workers on {workers[0]['device']}, compute type {workers[0]['compute_type']}")
+    else:
+        host = asr_daemon._local_host
+        print(f"In-process model on {host.device}, compute type {host.compute_type}")
+    print(f"{'config':<14}{'audio min':>10}{'wall s':>10}{'RTF':>8}{'x realtime':>12}")
+    for label, stats in results:
+        speed = 1 / stats["rtf"] if stats["rtf"] else 0.0
+        print(f"{label:<14}{stats['audio_sec'] / 60:>10.1f}{stats['elapsed_sec']:>10.1f}"
+              f"{stats['rtf']:>8.3f}{speed:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import sqlite3
+import time
+from pathlib import Path
+
+MAX_ATTEMPTS = 3  # Failed blobs are retried on later runs until they reach this many attempts
+LOOKUP_BATCH = 500  # Blob names looked up per query (below SQLite's bound-parameter limit)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    name TEXT PRIMARY KEY,
+    generation INTEGER,
+    md5 TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    audio_sec REAL,
+    elapsed_sec REAL,
+    output_path TEXT,
+    error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blobs_status ON blobs (status);
+"""
+
+
+class BlobStateStore:
+    """Local SQLite record of every blob a bucket run has seen.
+
+    Each row is keyed by blob name and remembers the generation and md5 that were
+    processed, so an overwritten blob is picked up again, and the status
+    ("running", "done" or "failed"), number of attempts, audio and wall duration and
+    output path. It is only used from the thread that drives the run.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def lookup(self, names):
+        """Returns {name: (generation, md5, status, attempts)} for the names that have a row."""
+        rows = {}
+        names = list(names)
+        for i in range(0, len(names), LOOKUP_BATCH):
+            batch = names[i:i + LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            for name, generation, md5, status, attempts in self.conn.execute(
+                    f"SELECT name, generation, md5, status, attempts FROM blobs WHERE name IN ({placeholders})",
+                    batch):
+                rows[name] = (generation, md5, status, attempts)
+        return rows
+
+    @staticmethod
+    def needs_processing(blob, row, max_attempts=MAX_ATTEMPTS):
+        """Whether a listed blob has to be (re)transcribed given its stored row."""
+        if row is None:
+            return True
+        generation, md5, status, attempts = row
+        if generation != blob.generation or md5 != blob.md5_hash:
+            # The blob was overwritten since it was processed
+            return True
+        if status == "done":
+            return False
+        return attempts < max_attempts
+
+    def _upsert(self, blob, status, attempts_delta=0, **fields):
+        now = time.time()
+        columns = ["generation", "md5", "status"] + list(fields)
+        values = [blob.generation, blob.md5_hash, status] + list(fields.values())
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns)
+        # A new generation starts counting attempts again
+        self.conn.execute(
+            f"INSERT INTO blobs (name, {', '.join(columns)}, attempts, updated_at) "
+            f"VALUES (?, {', '.join('?' * len(columns))}, ?, ?) "
+            f"ON CONFLICT(name) DO UPDATE SET {updates}, updated_at = excluded.updated_at, "
+            f"attempts = CASE WHEN blobs.generation IS excluded.generation "
+            f"THEN blobs.attempts + ? ELSE ? END",
+            [blob.name] + values + [attempts_delta, now, attempts_delta, attempts_delta])
+        self.conn.commit()
+
+    def mark_running(self, blob):
+        self._upsert(blob, "running", attempts_delta=1, error=None)
+
+    def mark_done(self, blob, output_path, audio_sec=None, elapsed_sec=None):
+        self._upsert(blob, "done", output_path=str(output_path), audio_sec=audio_sec,
+                     elapsed_sec=elapsed_sec, error=None)
+
+    def mark_failed(self, blob, error):
+        self._upsert(blob, "failed", error=str(error))
+
+    def counts(self):
+        """Number of rows per status."""
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM blobs GROUP BY status"))
+
+    def close(self):
+        self.conn.close()
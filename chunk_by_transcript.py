@@ -1,36 +1,30 @@
 import os
-import json
-import subprocess
-from pydub import AudioSegment
+from concurrent.futures import as_completed
+from functools import partial
+from aeneas_pool import AlignmentPool
+from chunk_writer import ChunkWriter
+from decoded_audio import DecodedAudio
+from manifest import ManifestWriter, build_duration_index
+from word_timings import sidecar_alignment
 
 # ---- CONFIG ----
 AUDIO_DIR = r"D:\Models\audio_data_processing\audio_data\hindi"
 TRANSCRIPT_DIR = r"D:\Models\audio_data_processing\audio_data\split_transcript"
 OUTPUT_AUDIO_DIR = "output/audio_chunks"
 OUTPUT_TEXT_DIR = "output/transcript_chunks"
+MANIFEST_PATH = "output/manifest.jsonl"
+WORDS_DIR = TRANSCRIPT_DIR  # Where <name>.words.json sidecars from the STT scripts are looked up
 LANGUAGE = "hin"  # Adjust if necessary
 
-# ---- Ensure output directories exist ----
-os.makedirs(OUTPUT_AUDIO_DIR, exist_ok=True)
-os.makedirs(OUTPUT_TEXT_DIR, exist_ok=True)
-
-def run_aeneas_alignment(audio_path, transcript_path, output_json_path):
-    print(f"Aligning {os.path.basename(audio_path)}...")
-    command = [
-        "python", "-m", "aeneas.tools.execute_task",
-        audio_path,
-        transcript_path,
-        f"task_language={LANGUAGE}|is_text_type=plain|os_task_file_format=json",
-        output_json_path
-    ]
-    subprocess.run(command, check=True)
-
-def chunk_audio(audio_path, json_path, file_prefix):
-    print(f"Processing {file_prefix}...")
-    audio = AudioSegment.from_mp3(audio_path)
+manifest = ManifestWriter(MANIFEST_PATH)
+chunk_writer = ChunkWriter()
 
-    with open(json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+def chunk_audio(audio_path, data, file_prefix, audio=None):
+    """Export one chunk per fragment of an aeneas-style alignment ({"fragments": [...]}).
+    Pass audio when the file is already decoded (AlignmentPool hands its decode on)."""
+    print(f"Processing {file_prefix}...")
+    if audio is None:
+        audio = DecodedAudio.from_file(audio_path)
 
     for i, fragment in enumerate(data["fragments"]):
         start_ms = int(float(fragment["begin"]) * 1000)
@@ -41,34 +35,52 @@ def chunk_audio(audio_path, json_path, file_prefix):
         audio_filename = os.path.join(OUTPUT_AUDIO_DIR, f"{chunk_name}.wav")
         text_filename = os.path.join(OUTPUT_TEXT_DIR, f"{chunk_name}.txt")
 
-        chunk_audio = audio[start_ms:end_ms]
-        # chunk_audio.export(audio_filename, format="wav")
-        chunk_audio.set_frame_rate(16000).set_channels(1).export(audio_filename, format="wav")
-        with open(text_filename, "w", encoding="utf-8") as tf:
-            tf.write(sentence)
+        # Written in the background; the manifest row is added once the files are in place
+        chunk_writer.write(audio, audio_filename, start_ms / 1000, end_ms / 1000, sentence, text_filename,
+                           on_written=partial(manifest.append, chunk_name, audio_path, LANGUAGE, start=start_ms / 1000,
+                                              end=end_ms / 1000, text=sentence, path=audio_filename))
 
     print(f"Saved {i+1} chunks for {file_prefix}")
 
 def process_all_files():
-    for audio_file in os.listdir(AUDIO_DIR):
-        if not audio_file.endswith(".mp3"):
-            continue
-
-        filename = os.path.splitext(audio_file)[0]
-        audio_path = os.path.join(AUDIO_DIR, audio_file)
-        transcript_path = os.path.join(TRANSCRIPT_DIR, f"{filename}.txt")
-        alignment_json = f"temp_alignment_{filename}.json"
-
-        if not os.path.exists(transcript_path):
-            print(f"Transcript for {filename} not found. Skipping.")
-            continue
-
-        try:
-            run_aeneas_alignment(audio_path, transcript_path, alignment_json)
-            chunk_audio(audio_path, alignment_json, filename)
-        finally:
-            if os.path.exists(alignment_json):
-                os.remove(alignment_json)
+    os.makedirs(OUTPUT_AUDIO_DIR, exist_ok=True)
+    os.makedirs(OUTPUT_TEXT_DIR, exist_ok=True)
+
+    # Files without word timings are aligned by a pool of aeneas workers and chunked as they finish
+    with AlignmentPool() as pool:
+        aligning = {}
+        for audio_file in os.listdir(AUDIO_DIR):
+            if not audio_file.endswith(".mp3"):
+                continue
+
+            filename = os.path.splitext(audio_file)[0]
+            audio_path = os.path.join(AUDIO_DIR, audio_file)
+            transcript_path = os.path.join(TRANSCRIPT_DIR, f"{filename}.txt")
+
+            if not os.path.exists(transcript_path):
+                print(f"Transcript for {filename} not found. Skipping.")
+                continue
+
+            alignment = sidecar_alignment(WORDS_DIR, filename, transcript_path)
+            if alignment is not None:
+                print(f"Using Google word timings for {filename}, skipping aeneas.")
+                chunk_audio(audio_path, alignment, filename)
+                continue
+
+            print(f"Aligning {audio_file}...")
+            aligning[pool.submit(audio_path, transcript_path, LANGUAGE)] = (audio_path, filename)
+
+        for future in as_completed(aligning):
+            audio_path, filename = aligning[future]
+            try:
+                alignment, audio = future.result()
+            except Exception as e:
+                print(f"Alignment failed for {filename}: {e}")
+                continue
+            chunk_audio(audio_path, alignment, filename, audio)
+
+    chunk_writer.flush()
+    build_duration_index(MANIFEST_PATH)
 
 if __name__ == "__main__":
     process_all_files()
@@ -1,77 +1,83 @@
 import os
-from pydub import AudioSegment
-import whisperx
-import torch
 import math
+from bisect import bisect_right
+from functools import partial
+from asr_daemon import decode, run_job
+from chunk_writer import ChunkWriter
+from manifest import ManifestWriter, build_duration_index
 
 # ---- CONFIG ----
 AUDIO_DIR = r"D:\Models\audio_data_processing\audio_data\sample_audio"
 TRANSCRIPT_DIR = r"D:\Models\audio_data_processing\audio_data\sample_transcript"
 OUTPUT_AUDIO_DIR = "output_1/audio_chunks"
 OUTPUT_TEXT_DIR = "output_1/transcript_chunks"
-MODEL_NAME = "small"
-
-# ---- Ensure output directories exist ----
-os.makedirs(OUTPUT_AUDIO_DIR, exist_ok=True)
-os.makedirs(OUTPUT_TEXT_DIR, exist_ok=True)
-
-# ---- Device detection ----
-device = "cuda" if torch.cuda.is_available() else "cpu"
-print(f"Using device: {device.upper()}")
-
-# ---- Choose compute type based on device ----
-if device == "cuda":
-    compute_type = "float16"
-else:
-    compute_type = "int8"  # safer and faster for CPU
-
-# ---- Load WhisperX model ----
-model = whisperx.load_model(MODEL_NAME, device, compute_type=compute_type)
+MANIFEST_PATH = "output_1/manifest.jsonl"
+CHUNK_SIZE = 10  # Words per chunk
+
+manifest = ManifestWriter(MANIFEST_PATH)
+chunk_writer = ChunkWriter()
+
+def build_word_index(segments):
+    """Cumulative word counts: entry k is the number of words in segments[0..k].
+    Built once per transcription and reusable for any chunk size."""
+    word_index = []
+    total = 0
+    for segment in segments:
+        total += len(segment["text"].split())
+        word_index.append(total)
+    return word_index
+
+def chunk_spans(segments, word_index, num_chunks, chunk_size):
+    """(start_time, end_time) of every chunk of chunk_size words, or None for chunks past
+    the last transcribed word. A chunk spans from the start of the segment holding its
+    first word to the end of the segment holding its last word."""
+    total_words = word_index[-1] if word_index else 0
+    spans = []
+    for i in range(num_chunks):
+        start_word = i * chunk_size
+        if start_word >= total_words:
+            spans.append(None)
+            continue
+        last_word = min((i + 1) * chunk_size, total_words) - 1
+        first_segment = bisect_right(word_index, start_word)
+        last_segment = bisect_right(word_index, last_word, lo=first_segment)
+        spans.append((segments[first_segment]["start"], segments[last_segment]["end"]))
+    return spans
 
-def process_audio_file(audio_path, transcript_path):
+def process_audio_file(audio_path, transcript_path, chunk_size=CHUNK_SIZE):
     print(f"Processing: {os.path.basename(audio_path)}")
 
-    # Transcribe audio and get timestamps
-    result = model.transcribe(audio_path)
+    # Decode once: the same 16kHz samples are transcribed and sliced into chunks
+    audio = decode(audio_path)
+
+    # Transcribe audio and get timestamps, on the ASR daemon when one is running
+    try:
+        result = run_job({"mode": "transcribe", "paths": [audio_path]}, audios=[audio])["results"][0]
+    finally:
+        audio.release_file()
 
-    audio = AudioSegment.from_mp3(audio_path)
     file_prefix = os.path.splitext(os.path.basename(audio_path))[0]
 
     # Read transcript
     with open(transcript_path, "r", encoding="utf-8") as f:
         transcript = f.read()
 
-    # Split transcript into chunks by word count (e.g., 10 words per chunk)
+    # Split transcript into chunks by word count (chunk_size words per chunk)
     words = transcript.split()
-    chunk_size = 10  # You can adjust this number to chunk by a different word count
     num_chunks = math.ceil(len(words) / chunk_size)
 
-    for i in range(num_chunks):
+    # Find the start and end times of all chunks in one pass over a word index
+    spans = chunk_spans(result["segments"], build_word_index(result["segments"]), num_chunks, chunk_size)
+
+    for i, span in enumerate(spans):
         start_word = i * chunk_size
         end_word = (i + 1) * chunk_size
         chunk_text = " ".join(words[start_word:end_word])
 
-        # Find the corresponding start and end times for this chunk
-        start_time = None
-        end_time = None
-        current_word_index = 0
-
-        for segment in result["segments"]:
-            segment_words = segment["text"].split()
-            segment_start = segment["start"]
-            segment_end = segment["end"]
-
-            # Check if this segment contains any of the chunk words
-            for word in segment_words:
-                if current_word_index >= start_word and current_word_index < end_word:
-                    if start_time is None:
-                        start_time = segment_start
-                    end_time = segment_end
-                current_word_index += 1
-
-        if start_time is None or end_time is None:
+        if span is None:
             print(f"Skipping chunk {i+1} for {file_prefix} due to no time match")
             continue
+        start_time, end_time = span
 
         # Convert start and end times to milliseconds
         start_ms = int(start_time * 1000)
@@ -81,17 +87,18 @@ def process_audio_file(audio_path, transcript_path):
         audio_filename = os.path.join(OUTPUT_AUDIO_DIR, f"{chunk_name}.wav")
         text_filename = os.path.join(OUTPUT_TEXT_DIR, f"{chunk_name}.txt")
 
-        # Extract and save audio chunk
-        chunk_audio = audio[start_ms:end_ms]
-        chunk_audio.set_frame_rate(16000).set_channels(1).export(audio_filename, format="wav")
-
-        # Save text transcript for this chunk
-        with open(text_filename, "w", encoding="utf-8") as f:
-            f.write(chunk_text)
+        # Save the audio chunk and its transcript, in the background
+        chunk_writer.write(audio, audio_filename, start_ms / 1000, end_ms / 1000, chunk_text, text_filename,
+                           on_written=partial(manifest.append, chunk_name, audio_path, result.get("language"),
+                                              start=start_ms / 1000, end=end_ms / 1000, text=chunk_text,
+                                              path=audio_filename))
 
     print(f"Saved {num_chunks} chunks for {file_prefix}\n")
 
 def process_all_files():
+    os.makedirs(OUTPUT_AUDIO_DIR, exist_ok=True)
+    os.makedirs(OUTPUT_TEXT_DIR, exist_ok=True)
+
     for audio_file in os.listdir(AUDIO_DIR):
         if audio_file.endswith(".mp3"):
             filename = os.path.splitext(audio_file)[0]
@@ -102,7 +109,10 @@ def process_all_files():
                 print(f"Transcript for {filename} not found. Skipping.")
                 continue
 
-            process_audio_file(audio_path, transcript_path)
+            process_audio_file(audio_path, transcript_path, CHUNK_SIZE)
+
+    chunk_writer.flush()
+    build_duration_index(MANIFEST_PATH)
 
 if __name__ == "__main__":
     process_all_files()
@@ -1,37 +1,74 @@
 import os
-from pydub import AudioSegment
-import whisperx
-import torch
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from asr_daemon import decode, run_job
+from chunk_writer import ChunkWriter
+from manifest import ManifestWriter, build_duration_index
 
 # ---- CONFIG ----
 AUDIO_DIR = r"D:\Models\audio_data_processing\audio_data\sample_audio"
 OUTPUT_AUDIO_DIR = "output/audio_chunks"
 OUTPUT_TEXT_DIR = "output/transcript_chunks"
-MODEL_NAME = "small"
+MANIFEST_PATH = "output/manifest.jsonl"
+LANGUAGE = None  # None detects the language of every file
+BATCH_SIZE = 16  # VAD segments per model forward pass
+FILES_PER_CALL = 8  # Files whose segments are batched into one transcribe call
+DECODE_WORKERS = 2  # Threads decoding upcoming files while the model runs; 0 decodes inline
+PREFETCH_FILES = 16  # Decoded files kept ready ahead of the model
 
-# ---- Ensure output directories exist ----
-os.makedirs(OUTPUT_AUDIO_DIR, exist_ok=True)
-os.makedirs(OUTPUT_TEXT_DIR, exist_ok=True)
+manifest = ManifestWriter(MANIFEST_PATH)
+chunk_writer = ChunkWriter()
 
-# ---- Device detection ----
-device = "cuda" if torch.cuda.is_available() else "cpu"
-print(f"Using device: {device.upper()}")
+def decoded_files(audio_paths, decode_workers=DECODE_WORKERS):
+    """Yield (audio_path, DecodedAudio) in order, decoding up to PREFETCH_FILES ahead on
+    decode_workers threads so the model never waits on ffmpeg."""
+    if decode_workers <= 0:
+        for audio_path in audio_paths:
+            yield audio_path, decode(audio_path)
+        return
 
-# ---- Choose compute type based on device ----
-if device == "cuda":
-    compute_type = "float16"
-else:
-    compute_type = "int8"  # safer and faster for CPU
+    with ThreadPoolExecutor(max_workers=decode_workers) as pool:
+        paths = iter(audio_paths)
+        futures = deque((path, pool.submit(decode, path)) for path in islice(paths, PREFETCH_FILES))
+        while futures:
+            audio_path, future = futures.popleft()
+            for next_path in islice(paths, 1):
+                futures.append((next_path, pool.submit(decode, next_path)))
+            try:
+                audio = future.result()
+            except Exception as e:
+                print(f"Error decoding {audio_path}: {e}")
+                continue
+            yield audio_path, audio
 
-# ---- Load WhisperX model ----
-model = whisperx.load_model(MODEL_NAME, device, compute_type=compute_type)
+def transcribe_files(items, language, batch_size=BATCH_SIZE):
+    """Transcribe several decoded files in one job and return one result per file.
 
-def process_audio_file(audio_path):
+    The job runs on the ASR daemon (asr_daemon.py) when one is listening, so the model
+    is already loaded; otherwise the model is loaded in this process on the first call.
+    The files the daemon mapped the samples from are removed afterwards.
+    """
+    job = {"mode": "transcribe", "paths": [audio_path for audio_path, _ in items],
+           "language": language, "batch_size": batch_size}
+    try:
+        return run_job(job, audios=[audio for _, audio in items])["results"]
+    finally:
+        for _, audio in items:
+            audio.release_file()
+
+def process_audio_file(audio_path, result=None, audio=None):
+    """Export one chunk per segment. audio (a DecodedAudio) and result are reused when
+    given, so the file is decoded once and chunks are sliced from the same samples."""
     print(f"Processing: {os.path.basename(audio_path)}")
 
-    result = model.transcribe(audio_path)
+    if audio is None:
+        audio = decode(audio_path)
+    if result is None:
+        result = transcribe_files([(audio_path, audio)], LANGUAGE)[0]
 
-    audio = AudioSegment.from_mp3(audio_path)
     file_prefix = os.path.splitext(os.path.basename(audio_path))[0]
 
     for i, segment in enumerate(result["segments"]):
@@ -43,19 +80,51 @@ def process_audio_file(audio_path):
         audio_filename = os.path.join(OUTPUT_AUDIO_DIR, f"{chunk_name}.wav")
         text_filename = os.path.join(OUTPUT_TEXT_DIR, f"{chunk_name}.txt")
 
-        chunk_audio = audio[start_ms:end_ms]
-        chunk_audio.set_frame_rate(16000).set_channels(1).export(audio_filename, format="wav")
+        chunk_writer.write(audio, audio_filename, start_ms / 1000, end_ms / 1000, text, text_filename,
+                           on_written=partial(manifest.append, chunk_name, audio_path, result.get("language"),
+                                              start=start_ms / 1000, end=end_ms / 1000, text=text,
+                                              path=audio_filename))
+
+    print(f"Saved {len(result['segments'])} chunks for {file_prefix}\n")
+
+def process_all_files(audio_dir=AUDIO_DIR, files_per_call=FILES_PER_CALL, batch_size=BATCH_SIZE,
+                      decode_workers=DECODE_WORKERS):
+    """Transcribe and chunk every MP3 in audio_dir.
+
+    Files are decoded ahead by a prefetch pool and every files_per_call files are
+    transcribed in one job, in batches of batch_size segments (the files of a job are
+    grouped by language by whoever runs it). Prints and returns the real-time factor
+    (wall / audio seconds).
+    """
+    audio_paths = [os.path.join(audio_dir, audio_file) for audio_file in sorted(os.listdir(audio_dir))
+                   if audio_file.endswith(".mp3")]
+    os.makedirs(OUTPUT_AUDIO_DIR, exist_ok=True)
+    os.makedirs(OUTPUT_TEXT_DIR, exist_ok=True)
+    start_time = time.time()
+    audio_sec = 0.0
+    pending = []  # [(audio_path, audio)]
+
+    def flush():
+        for (audio_path, audio), result in zip(pending, transcribe_files(pending, LANGUAGE, batch_size)):
+            process_audio_file(audio_path, result, audio)
+        pending.clear()
 
-        with open(text_filename, "w", encoding="utf-8") as f:
-            f.write(text)
+    for audio_path, audio in decoded_files(audio_paths, decode_workers):
+        audio_sec += audio.duration_sec
+        pending.append((audio_path, audio))
+        if len(pending) >= files_per_call:
+            flush()
+    if pending:
+        flush()
 
-    print(f"Saved {i+1} chunks for {file_prefix}\n")
+    chunk_writer.flush()
+    build_duration_index(MANIFEST_PATH)
 
-def process_all_files():
-    for audio_file in os.listdir(AUDIO_DIR):
-        if audio_file.endswith(".mp3"):
-            audio_path = os.path.join(AUDIO_DIR, audio_file)
-            process_audio_file(audio_path)
+    elapsed = time.time() - start_time
+    rtf = elapsed / audio_sec if audio_sec else 0.0
+    print(f"Transcribed {len(audio_paths)} files, {audio_sec / 60:.1f} min of audio in {elapsed:.1f}s "
+          f"(real-time factor {rtf:.3f})")
+    return {"files": len(audio_paths), "audio_sec": audio_sec, "elapsed_sec": elapsed, "rtf": rtf}
 
 if __name__ == "__main__":
     process_all_files()
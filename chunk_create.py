@@ -1,13 +1,23 @@
 import argparse  
+import hashlib  
+import io  
+import json  
 import logging  
 import os  
 import random  
+import subprocess  
+import tempfile  
+import threading  
 import time  
-import uuid  
+import wave  
 from pathlib import Path  
-from concurrent.futures import ThreadPoolExecutor, as_completed  
+from collections import deque  
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait  
+import numpy as np  
 from pydub import AudioSegment  
 from tqdm import tqdm  
+from chunk_shards import ShardWriter, default_shard_prefix, shard_key  
+from manifest import ManifestWriter, build_duration_index  
   
 # Language folder mapping  
 LANG_MAP = {  
@@ -28,6 +38,26 @@ INPUT_ROOT = Path("/home/jupyter/myfiles/symphony/fullaudio")
 OUTPUT_ROOT = Path("/home/jupyter/myfiles/symphony/chunks")  
 CHUNK_LENGTH_SEC = 10  # Duration of each chunk in seconds  
 TRAIN_RATIO = 0.9  # Ratio: 90% train, 10% dev  
+SAMPLE_RATE = 16000  # Output sample rate in Hz  
+SAMPLE_WIDTH = 2  # Output sample width in bytes (16-bit PCM)  
+STREAM_FRAME_BYTES = SAMPLE_RATE * SAMPLE_WIDTH  # Bytes read from the decoder pipe per frame (1 second)  
+ENGINES = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}  # Execution engines for process_all  
+MP3_DECODE_EXPANSION = 14  # Approx. in-memory bytes per MP3 byte (decoded source + 16kHz copy + chunk slices)  
+STREAM_WORKER_BYTES = 64 * 1024 * 1024  # Approx. memory of one streaming worker (chunk buffer + ffmpeg)  
+OUTPUT_FORMATS = ("wav", "shards")  # One WAV file per chunk, or ~1 GB tar shards per split and language  
+SPLIT_SEED = 1234  # Seed of the per-file train/dev split, so reruns route chunks identically  
+HASH_BLOCK_BYTES = 1024 * 1024  # Read size when hashing source files  
+BOUNDARY_MODES = ("fixed", "energy")  # Cut every CHUNK_LENGTH_SEC, or at the quietest point in a window  
+MIN_CHUNK_SEC = 6  # Energy mode: shortest allowed chunk in seconds  
+MAX_CHUNK_SEC = 14  # Energy mode: longest allowed chunk in seconds  
+ENERGY_FRAME_MS = 20  # Energy mode: analysis frame length  
+ENERGY_SMOOTH_FRAMES = 5  # Energy mode: frames averaged so a single quiet frame inside a word is not picked  
+  
+# Shard writers of this process, keyed by (output_root, split, lang_code, pid)  
+_shard_writers = {}  
+_shard_writers_lock = threading.Lock()  
+# Manifest writers, keyed by manifest path (each writer reopens its descriptor after a fork)  
+_manifest_writers = {}  
   
   
 def create_output_folders(output_root: Path):  
@@ -39,8 +69,152 @@ def create_output_folders(output_root: Path):
             (output_root / split / code).mkdir(parents=True, exist_ok=True)  
   
   
+def file_digest(path: Path) -> str:  
+    """SHA-1 of a file's content, read in fixed-size blocks."""  
+    digest = hashlib.sha1()  
+    with open(path, "rb") as f:  
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b""):  
+            digest.update(block)  
+    return digest.hexdigest()  
+  
+  
+def make_chunk_name(source_digest: str, start_sec: float, end_sec: float) -> str:  
+    """Builds a chunk file name: e.g., a1b2c3---0000.000-0010.000.wav  
+    The token is derived from the source file's content hash and the chunk offsets,  
+    so re-chunking the same file always produces the same names.  
+    """  
+    # Format times as "0000.000"  
+    start_str = f"{start_sec:08.3f}"  
+    end_str = f"{end_sec:08.3f}"  
+    # Deterministic token with 6 characters  
+    token = hashlib.sha1(f"{source_digest}:{start_str}:{end_str}".encode()).hexdigest()[:6]  
+    return f"{token}---{start_str}-{end_str}.wav"  
+  
+  
+def split_rng(source_digest: str) -> random.Random:  
+    """Seeded RNG for the train/dev split of one source file, independent of processing order."""  
+    return random.Random(f"{SPLIT_SEED}:{source_digest}")  
+  
+  
+def atomic_write(out_path: Path, write):  
+    """Calls write(tmp_path) and renames the result to out_path, so a crash never leaves a partial file."""  
+    tmp_path = out_path.with_name(out_path.name + ".tmp")  
+    try:  
+        write(tmp_path)  
+        os.replace(tmp_path, out_path)  
+    except BaseException:  
+        if tmp_path.exists():  
+            tmp_path.unlink()  
+        raise  
+  
+  
+class RunJournal:  
+    """Append-only JSONL journal of the source files a run has fully chunked.  
+  
+    Entries are keyed by (path, size, mtime), so checking whether a file is done  
+    costs one stat and a set lookup. A file that crashed halfway is not in the  
+    journal and is simply chunked again; deterministic names make that overwrite  
+    its partial output instead of duplicating it.  
+    """  
+  
+    def __init__(self, path: Path):  
+        self.path = path  
+        self._done = set()  
+        if path.exists():  
+            with open(path, "r", encoding="utf-8") as f:  
+                for line in f:  
+                    if not line.strip():  
+                        continue  
+                    try:  
+                        entry = json.loads(line)  
+                    except ValueError:  
+                        # Torn last line from a crash  
+                        continue  
+                    self._done.add((entry["source"], entry["size"], entry["mtime_ns"]))  
+        self._file = open(path, "a", encoding="utf-8")  
+  
+    @staticmethod  
+    def _file_key(audio_path: Path):  
+        stat = audio_path.stat()  
+        return str(audio_path), stat.st_size, stat.st_mtime_ns  
+  
+    def is_done(self, audio_path: Path) -> bool:  
+        return self._file_key(audio_path) in self._done  
+  
+    def mark_done(self, audio_path: Path, num_chunks: int):  
+        source, size, mtime_ns = self._file_key(audio_path)  
+        self._done.add((source, size, mtime_ns))  
+        self._file.write(json.dumps({"source": source, "size": size, "mtime_ns": mtime_ns,  
+                                     "chunks": num_chunks}, ensure_ascii=False) + "\n")  
+        self._file.flush()  
+        os.fsync(self._file.fileno())  
+  
+    def close(self):  
+        self._file.close()  
+  
+  
+def get_shard_writer(output_root: Path, split: str, lang_code: str) -> ShardWriter:  
+    """Returns this process's shard writer for a split and language folder.  
+    Threads of a process share one writer; each process appends to its own shards.  
+    """  
+    key = (str(output_root), split, lang_code, os.getpid())  
+    with _shard_writers_lock:  
+        writer = _shard_writers.get(key)  
+        if writer is None:  
+            writer = _shard_writers[key] = ShardWriter(output_root / split / lang_code, default_shard_prefix())  
+        return writer  
+  
+  
+def close_shard_writers():  
+    """Closes the shard writers opened by this process."""  
+    with _shard_writers_lock:  
+        for writer in _shard_writers.values():  
+            writer.close()  
+        _shard_writers.clear()  
+  
+  
+def record_chunk(manifest_path: Path, chunk_name: str, metadata: dict, num_samples: int,  
+                 path: Path = None, location: tuple = None):  
+    """Appends one row for an exported chunk to the dataset manifest (no-op without a manifest).  
+    location is (shard path relative to the output root, WAV data offset) for sharded output.  
+    """  
+    if manifest_path is None:  
+        return  
+    writer = _manifest_writers.get(str(manifest_path))  
+    if writer is None:  
+        writer = _manifest_writers.setdefault(str(manifest_path), ManifestWriter(manifest_path))  
+    shard, offset = location or (None, None)  
+    key = shard_key(chunk_name) if shard else chunk_name[:-4]  
+    writer.append(key, metadata["source"], metadata["lang"], metadata["split"], metadata["start"],  
+                  metadata["end"], num_samples, path=path, shard=shard, offset=offset)  
+  
+  
+def save_chunk(output_root: Path, split: str, lang_code: str, chunk_name: str, wav_bytes: bytes,  
+               metadata: dict, output_format: str = "wav", manifest_path: Path = None, num_samples: int = None):  
+    """Stores one encoded WAV chunk either as <split>/<lang_code>/<chunk_name> or in a shard,  
+    and records it in the manifest when manifest_path is given.  
+    """  
+    if output_format == "shards":  
+        shard, offset = get_shard_writer(output_root, split, lang_code).write(shard_key(chunk_name), wav_bytes, metadata)  
+        record_chunk(manifest_path, chunk_name, metadata, num_samples, location=(f"{split}/{lang_code}/{shard}", offset))  
+    else:  
+        out_path = output_root / split / lang_code / chunk_name  
+  
+        def write(tmp_path):  
+            with open(tmp_path, "wb") as f:  
+                f.write(wav_bytes)  
+        atomic_write(out_path, write)  
+        record_chunk(manifest_path, chunk_name, metadata, num_samples, path=out_path)  
+  
+  
+def chunk_metadata(audio_path: Path, lang_code: str, split: str, start_sec: float, end_sec: float) -> dict:  
+    return {"source": str(audio_path), "lang": lang_code, "split": split,  
+            "start": round(start_sec, 3), "end": round(end_sec, 3), "sample_rate": SAMPLE_RATE}  
+  
+  
 def split_and_save_chunks(audio_path: Path, lang_code: str, output_root: Path,  
-                          chunk_length_sec: int, train_ratio: float = 0.9):  
+                          chunk_length_sec: float, train_ratio: float = 0.9, output_format: str = "wav",  
+                          manifest_path: Path = None):  
     """Loads an MP3 audio file, converts it to mono & 16kHz,  
     splits it into fixed-length chunks, and exports each chunk as a WAV file  
     into train and dev folders.  
@@ -48,59 +222,198 @@ def split_and_save_chunks(audio_path: Path, lang_code: str, output_root: Path,
     The exported chunk's file name follows this naming convention:  
         <6-character token>---<start_time>-<end_time>.wav  
     where start_time and end_time are formatted as "0000.000".  
+    With output_format="shards" the chunks are appended to tar shards instead.  
+    Each exported chunk is recorded in the manifest at manifest_path, if given.  
+  
+    Returns the number of exported chunks, or None if the file could not be loaded  
+    or any chunk failed to export.  
     """  
     try:  
+        source_digest = file_digest(audio_path)  
         audio = AudioSegment.from_mp3(audio_path)  
     except Exception as e:  
         logging.error(f"Error loading {audio_path}: {e}")  
-        return  
+        return None  
   
     # Convert to mono and set sample rate to 16kHz  
     audio = audio.set_channels(1).set_frame_rate(16000)  
     duration_ms = len(audio)  
   
     chunks = []  
-    # Create fixed-length chunks  
-    for i in range(0, duration_ms, chunk_length_sec * 1000):  
+    # Create fixed-length chunks (chunk_length_sec may be fractional, slicing needs whole milliseconds)  
+    chunk_ms = int(round(chunk_length_sec * 1000))  
+    for i in range(0, duration_ms, chunk_ms):  
         start_ms = i  
-        end_ms = min(i + chunk_length_sec * 1000, duration_ms)  
+        end_ms = min(i + chunk_ms, duration_ms)  
         chunk = audio[start_ms:end_ms]  
   
-        # Generate a unique token with 6 characters  
-        unique_token = uuid.uuid4().hex[:6]  
-        # Compute start and end times (in seconds)  
-        start_sec = start_ms / 1000  
-        end_sec = end_ms / 1000  
-        # Format times as "0000.000"  
-        start_str = f"{start_sec:08.3f}"  
-        end_str = f"{end_sec:08.3f}"  
-        # Build the file name: e.g., a1b2c3---0000.000-0010.000.wav  
-        chunk_name = f"{unique_token}---{start_str}-{end_str}.wav"  
-        chunks.append((chunk, chunk_name))  
+        chunk_name = make_chunk_name(source_digest, start_ms / 1000, end_ms / 1000)  
+        chunks.append((chunk, chunk_name, start_ms / 1000, end_ms / 1000))  
   
     if not chunks:  
         logging.warning(f"No chunks generated for {audio_path}")  
-        return  
+        return 0  
   
-    # Shuffle and split into train and dev sets  
-    random.shuffle(chunks)  
+    # Shuffle (seeded per source file) and split into train and dev sets  
+    split_rng(source_digest).shuffle(chunks)  
     split_idx = int(len(chunks) * train_ratio)  
     train_chunks = chunks[:split_idx]  
     dev_chunks = chunks[split_idx:]  
   
-    for chunk, fname in train_chunks:  
-        out_path = output_root / "train" / lang_code / fname  
+    failed = 0  
+    for split, split_chunks in (("train", train_chunks), ("dev", dev_chunks)):  
+        for chunk, fname, start_sec, end_sec in split_chunks:  
+            out_path = output_root / split / lang_code / fname  
+            metadata = chunk_metadata(audio_path, lang_code, split, start_sec, end_sec)  
+            try:  
+                if output_format == "shards":  
+                    wav_buffer = io.BytesIO()  
+                    chunk.export(wav_buffer, format="wav")  
+                    save_chunk(output_root, split, lang_code, fname, wav_buffer.getvalue(), metadata,  
+                               output_format, manifest_path, int(chunk.frame_count()))  
+                else:  
+                    atomic_write(out_path, lambda tmp_path: chunk.export(tmp_path, format="wav"))  
+                    record_chunk(manifest_path, fname, metadata, int(chunk.frame_count()), path=out_path)  
+            except Exception as e:  
+                logging.error(f"Error exporting {out_path}: {e}")  
+                failed += 1  
+    return None if failed else len(chunks)  
+  
+  
+def decode_pcm_frames(audio_path: Path, frame_bytes: int = STREAM_FRAME_BYTES):  
+    """Decodes an audio file through an ffmpeg pipe and yields 16kHz mono 16-bit PCM  
+    in frames of frame_bytes bytes (the last frame may be shorter).  
+    Only one frame is held in memory at a time, regardless of the input length.  
+    """  
+    command = [AudioSegment.converter, "-nostdin", "-v", "error", "-i", str(audio_path),  
+               "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-"]  
+    with tempfile.TemporaryFile() as stderr_file:  
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file)  
+        finished = False  
         try:  
-            chunk.export(out_path, format="wav")  
-        except Exception as e:  
-            logging.error(f"Error exporting {out_path}: {e}")  
+            while True:  
+                frame = process.stdout.read(frame_bytes)  
+                if not frame:  
+                    break  
+                yield frame  
+            finished = True  
+        finally:  
+            process.stdout.close()  
+            if not finished:  
+                process.kill()  
+            process.wait()  
+        if process.returncode != 0:  
+            stderr_file.seek(0)  
+            message = stderr_file.read().decode(errors="replace").strip()  
+            raise RuntimeError(f"ffmpeg exited with code {process.returncode}: {message}")  
+  
+  
+def find_quiet_cut(pcm: bytes, min_samples: int, max_samples: int) -> int:  
+    """Returns the sample offset of the quietest point within [min_samples, max_samples] of pcm.  
+  
+    Frame energies over the whole window are computed in one vectorized pass, smoothed with  
+    a short moving average, and the cut is placed at the centre of the lowest-energy frame.  
+    """  
+    frame_samples = SAMPLE_RATE * ENERGY_FRAME_MS // 1000  
+    samples = np.frombuffer(pcm, dtype=np.int16, count=max_samples)[min_samples:]  
+    num_frames = len(samples) // frame_samples  
+    if num_frames == 0:  
+        return max_samples  
+    frames = samples[:num_frames * frame_samples].reshape(num_frames, frame_samples).astype(np.float32)  
+    energy = np.einsum("ij,ij->i", frames, frames)  
+    if num_frames >= ENERGY_SMOOTH_FRAMES:  
+        # Moving average; the windows at the edges hold fewer frames, so divide by the count  
+        kernel = np.ones(ENERGY_SMOOTH_FRAMES, dtype=np.float32)  
+        energy = np.convolve(energy, kernel, mode="same") / np.convolve(np.ones_like(energy), kernel, mode="same")  
+    quietest = int(np.argmin(energy))  
+    return min_samples + quietest * frame_samples + frame_samples // 2  
+  
+  
+def pcm_to_wav_bytes(pcm) -> bytes:  
+    """Wraps raw 16kHz mono 16-bit PCM (any bytes-like object) in a WAV container."""  
+    wav_buffer = io.BytesIO()  
+    with wave.open(wav_buffer, "wb") as wav_file:  
+        wav_file.setnchannels(1)  
+        wav_file.setsampwidth(SAMPLE_WIDTH)  
+        wav_file.setframerate(SAMPLE_RATE)  
+        wav_file.writeframes(pcm)  
+    return wav_buffer.getvalue()  
+  
+  
+def split_and_save_chunks_streaming(audio_path: Path, lang_code: str, output_root: Path,  
+                                    chunk_length_sec: float, train_ratio: float = 0.9, output_format: str = "wav",  
+                                    boundary_mode: str = "fixed", min_chunk_sec: float = MIN_CHUNK_SEC,  
+                                    max_chunk_sec: float = MAX_CHUNK_SEC, manifest_path: Path = None):  
+    """Streaming variant of split_and_save_chunks with bounded memory.  
+  
+    Reads decoded 16kHz mono PCM from an ffmpeg pipe in fixed-size frames and  
+    exports each chunk as soon as it is complete, so peak memory stays at about  
+    one chunk no matter how long the input is. File names follow the same  
+    <token>---<start_time>-<end_time>.wav convention. Since the total number of  
+    chunks is not known up front, each chunk is routed to train with probability  
+    train_ratio (seeded per source file) instead of shuffling the whole file.  
+  
+    With boundary_mode="energy", chunk_length_sec is ignored: whenever max_chunk_sec of audio  
+    is buffered, the chunk is cut at the quietest point between min_chunk_sec and max_chunk_sec  
+    (see find_quiet_cut), in the same pass as decoding.  
+  
+    Returns the number of exported chunks, or None if decoding or any export failed.  
+    """  
+    if boundary_mode == "energy":  
+        chunk_bytes = int(max_chunk_sec * SAMPLE_RATE) * SAMPLE_WIDTH  
+        min_samples = int(min_chunk_sec * SAMPLE_RATE)  
+    else:  
+        chunk_bytes = int(round(chunk_length_sec * SAMPLE_RATE)) * SAMPLE_WIDTH  
+    buffer = bytearray()  
+    samples_written = 0  
+    num_chunks = 0  
+    failed = 0  
+  
+    try:  
+        source_digest = file_digest(audio_path)  
+    except Exception as e:  
+        logging.error(f"Error loading {audio_path}: {e}")  
+        return None  
+    rng = split_rng(source_digest)  
   
-    for chunk, fname in dev_chunks:  
-        out_path = output_root / "dev" / lang_code / fname  
+    def flush(size):  
+        nonlocal samples_written, num_chunks, failed  
+        start_sec = samples_written / SAMPLE_RATE  
+        samples_written += size // SAMPLE_WIDTH  
+        end_sec = samples_written / SAMPLE_RATE  
+        split = "train" if rng.random() < train_ratio else "dev"  
+        chunk_name = make_chunk_name(source_digest, start_sec, end_sec)  
+        out_path = output_root / split / lang_code / chunk_name  
         try:  
-            chunk.export(out_path, format="wav")  
+            with memoryview(buffer) as view:  
+                wav_bytes = pcm_to_wav_bytes(view[:size])  
+            metadata = chunk_metadata(audio_path, lang_code, split, start_sec, end_sec)  
+            save_chunk(output_root, split, lang_code, chunk_name, wav_bytes, metadata, output_format,  
+                       manifest_path, size // SAMPLE_WIDTH)  
         except Exception as e:  
             logging.error(f"Error exporting {out_path}: {e}")  
+            failed += 1  
+        del buffer[:size]  
+        num_chunks += 1  
+  
+    try:  
+        for frame in decode_pcm_frames(audio_path):  
+            buffer += frame  
+            while len(buffer) >= chunk_bytes:  
+                if boundary_mode == "energy":  
+                    flush(find_quiet_cut(buffer, min_samples, chunk_bytes // SAMPLE_WIDTH) * SAMPLE_WIDTH)  
+                else:  
+                    flush(chunk_bytes)  
+    except Exception as e:  
+        logging.error(f"Error loading {audio_path}: {e}")  
+        return None  
+  
+    if buffer:  
+        flush(len(buffer))  
+  
+    if not num_chunks:  
+        logging.warning(f"No chunks generated for {audio_path}")  
+    return None if failed else num_chunks  
   
   
 def gather_files(input_root: Path, selected_lang: str = None):  
@@ -135,28 +448,96 @@ def gather_files(input_root: Path, selected_lang: str = None):
     return files  
   
   
-def process_all(input_root: Path, output_root: Path, chunk_length_sec: int,  
-                train_ratio: float, selected_lang: str = None):  
+def estimate_memory_bytes(audio_path: Path, streaming: bool = False) -> int:  
+    """Rough peak memory needed to chunk one file, used for admission under a memory budget.  
+    Streaming workers hold about one chunk; in-memory workers scale with the decoded file size.  
+    """  
+    if streaming:  
+        return STREAM_WORKER_BYTES  
+    return audio_path.stat().st_size * MP3_DECODE_EXPANSION  
+  
+  
+def process_all(input_root: Path, output_root: Path, chunk_length_sec: float,  
+                train_ratio: float, selected_lang: str = None, streaming: bool = False,  
+                engine: str = "thread", max_workers: int = None, memory_budget_mb: float = None,  
+                output_format: str = "wav", run_id: str = None, boundary_mode: str = "fixed",  
+                min_chunk_sec: float = MIN_CHUNK_SEC, max_chunk_sec: float = MAX_CHUNK_SEC,  
+                manifest_path: Path = None):  
     """Processes the MP3 files concurrently: splits them into chunks and exports them as WAV files  
     into train and dev folders. When selected_lang is specified, only that language folder is processed.  
+    When streaming is True, files are decoded through a pipe with bounded memory per worker.  
+  
+    engine selects a thread pool ("thread") or a process pool ("process"), which sidesteps the GIL  
+    held by pydub resampling and WAV export. When memory_budget_mb is given, a file is only submitted  
+    while the estimated memory of all in-flight files stays within the budget; a file larger than the  
+    whole budget runs on its own once everything else has drained.  
+  
+    output_format="shards" appends chunks to ~1 GB tar shards (see chunk_shards) inside each  
+    <split>/<lang_code> folder instead of writing one WAV file per chunk.  
+  
+    Completed source files are recorded in the run journal <output_root>/.journal-<run_id>.jsonl  
+    (run_id defaults to the language, or "all"). A restarted run with the same run_id skips those  
+    files and re-chunks only the ones that did not finish.  
+  
+    boundary_mode="energy" cuts chunks at the quietest point within [min_chunk_sec, max_chunk_sec]  
+    instead of every chunk_length_sec; it always uses the streaming decoder.  
+  
+    Every exported chunk is appended to the JSONL manifest at manifest_path (default  
+    <output_root>/manifest.jsonl), and a duration-bucketed index is rebuilt at the end of the run.  
     """  
+    manifest_path = manifest_path or output_root / "manifest.jsonl"  
+    split_kwargs = {"output_format": output_format, "manifest_path": manifest_path}  
+    if boundary_mode != "fixed":  
+        streaming = True  
+    if streaming:  
+        split_fn = split_and_save_chunks_streaming  
+        split_kwargs.update(boundary_mode=boundary_mode, min_chunk_sec=min_chunk_sec, max_chunk_sec=max_chunk_sec)  
+    else:  
+        split_fn = split_and_save_chunks  
+    max_workers = max_workers or os.cpu_count()  
     create_output_folders(output_root)  
-    files_to_process = gather_files(input_root, selected_lang)  
+    journal = RunJournal(output_root / f".journal-{run_id or selected_lang or 'all'}.jsonl")  
+    all_files = gather_files(input_root, selected_lang)  
+    files_to_process = [(file, lang) for file, lang in all_files if not journal.is_done(file)]  
+    if len(files_to_process) < len(all_files):  
+        logging.info(f"Skipping {len(all_files) - len(files_to_process)} files already completed in this run")  
     logging.info(f"Total files to process: {len(files_to_process)}")  
   
+    budget = memory_budget_mb * 1024 * 1024 if memory_budget_mb else None  
+    pending = deque(files_to_process)  
+    future_to_file = {}  
+    in_use = 0  
+  
     start_time = time.time()  
-    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:  
-        future_to_file = {  
-            executor.submit(split_and_save_chunks, file, lang, output_root, chunk_length_sec, train_ratio): (file, lang)  
-            for file, lang in files_to_process  
-        }  
-        for future in tqdm(as_completed(future_to_file), total=len(future_to_file),  
-                           desc="Processing audio files", unit="file"):  
-            file, lang = future_to_file[future]  
-            try:  
-                future.result()  
-            except Exception as e:  
-                logging.error(f"Error processing {file} ({lang}): {e}")  
+    with ENGINES[engine](max_workers=max_workers) as executor:  
+        with tqdm(total=len(files_to_process), desc="Processing audio files", unit="file") as progress:  
+            while pending or future_to_file:  
+                # Admit files in order while there is headroom (all at once when no budget is set)  
+                while pending:  
+                    file, lang = pending[0]  
+                    cost = estimate_memory_bytes(file, streaming) if budget else 0  
+                    if budget and future_to_file and (len(future_to_file) >= max_workers or in_use + cost > budget):  
+                        break  
+                    pending.popleft()  
+                    future = executor.submit(split_fn, file, lang, output_root, chunk_length_sec,  
+                                             train_ratio, **split_kwargs)  
+                    future_to_file[future] = (file, lang, cost)  
+                    in_use += cost  
+  
+                done, _ = wait(future_to_file, return_when=FIRST_COMPLETED)  
+                for future in done:  
+                    file, lang, cost = future_to_file.pop(future)  
+                    in_use -= cost  
+                    progress.update(1)  
+                    try:  
+                        num_chunks = future.result()  
+                        if num_chunks is not None:  
+                            journal.mark_done(file, num_chunks)  
+                    except Exception as e:  
+                        logging.error(f"Error processing {file} ({lang}): {e}")  
+    close_shard_writers()  
+    journal.close()  
+    build_duration_index(manifest_path)  
   
     elapsed = time.time() - start_time  
     logging.info(f"✅ Done. Total elapsed time: {elapsed:.2f} seconds")  
@@ -167,8 +548,26 @@ def main():
     parser = argparse.ArgumentParser(description="Process mp3 audio files from a single language folder into chunks.")  
     parser.add_argument("--language", "-l", required=True,  
                         help="The name of the language folder to process (e.g., english)")  
+    parser.add_argument("--stream", action="store_true",  
+                        help="Decode through a pipe and write chunks as they complete (bounded memory)")  
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="thread",  
+                        help="Run files on a thread pool or a process pool")  
+    parser.add_argument("--workers", type=int, default=None,  
+                        help="Number of workers (default: number of CPUs)")  
+    parser.add_argument("--memory-budget-mb", type=float, default=None,  
+                        help="Only admit files while their estimated memory fits in this budget")  
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="wav",  
+                        help="Write one WAV per chunk, or append chunks to ~1 GB tar shards")  
+    parser.add_argument("--run-id", default=None,  
+                        help="Name of the completion journal used to resume a run (default: the language)")  
+    parser.add_argument("--boundary", choices=BOUNDARY_MODES, default="fixed",  
+                        help="Cut every CHUNK_LENGTH_SEC, or at the quietest point of each [min, max] window")  
+    parser.add_argument("--min-chunk-sec", type=float, default=MIN_CHUNK_SEC)  
+    parser.add_argument("--max-chunk-sec", type=float, default=MAX_CHUNK_SEC)  
     args = parser.parse_args()  
-    process_all(INPUT_ROOT, OUTPUT_ROOT, CHUNK_LENGTH_SEC, TRAIN_RATIO, args.language)  
+    process_all(INPUT_ROOT, OUTPUT_ROOT, CHUNK_LENGTH_SEC, TRAIN_RATIO, args.language, args.stream,  
+                args.engine, args.workers, args.memory_budget_mb, args.output_format, args.run_id,  
+                args.boundary, args.min_chunk_sec, args.max_chunk_sec)  
   
   
 if __name__ == "__main__":  
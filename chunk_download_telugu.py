@@ -44,10 +44,6 @@ download_folder = "downloads_tam"
 chunk_output_base = "/home/vikrant/youtube_downloader/audio_chunks"  
 language = "tam"  # Set to "tel" for Telugu  
   
-# Create necessary folders  
-os.makedirs(download_folder, exist_ok=True)  
-os.makedirs(os.path.join(chunk_output_base, language), exist_ok=True)  
-  
 def download_audio(url):  
     """  
     Uses yt-dlp to download the best audio and convert it to mp3.  
@@ -115,6 +111,9 @@ def process_all(urls):
     """  
     Processes all URLs: downloads audio and splits it into chunks.  
     """  
+    # Create necessary folders  
+    os.makedirs(download_folder, exist_ok=True)  
+    os.makedirs(os.path.join(chunk_output_base, language), exist_ok=True)  
     for url in urls:  
         print("=" * 60)  
         print(f"Processing URL: {url}")  
@@ -0,0 +1,202 @@
+import json
+import os
+import socket
+import tarfile
+import threading
+import time
+from pathlib import Path
+
+SHARD_MAX_BYTES = 1024 ** 3  # Roll over to a new shard after about 1 GB
+TAR_BLOCK = tarfile.BLOCKSIZE
+TAR_END = b"\0" * (2 * TAR_BLOCK)  # End-of-archive marker
+
+
+def shard_key(chunk_name: str) -> str:
+    """Turns a chunk file name into a WebDataset sample key.
+    WebDataset splits member names at the first dot, so dots in the key are replaced:
+        a1b2c3---0000.000-0010.000.wav -> a1b2c3---0000_000-0010_000
+    """
+    stem = chunk_name[:-4] if chunk_name.endswith(".wav") else chunk_name
+    return stem.replace(".", "_")
+
+
+class ShardWriter:
+    """Appends samples to size-capped tar shards in WebDataset layout.
+
+    Each sample is stored as consecutive members <key>.wav, <key>.txt (optional)
+    and <key>.json (metadata). Shards are named <prefix>-000000.tar, <prefix>-000001.tar, ...
+    and a new one is started once the current shard would exceed max_bytes.
+    Writes are sequential: after every sample the shard is terminated with the
+    end-of-archive blocks (overwritten by the next sample), so it is always a
+    valid tar file even if the process dies. Next to each shard, <shard>.idx holds
+    one JSON line per member with its data offset and size for random access, and
+    the time the sample was written, which decides between copies of a key that a
+    rerun wrote into other shards.
+    """
+
+    def __init__(self, shard_dir: Path, prefix: str, max_bytes: int = SHARD_MAX_BYTES):
+        self.shard_dir = Path(shard_dir)
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._tar_file = None
+        self._idx_file = None
+        self._offset = 0
+        self._last_written = 0
+
+    def _next_shard_path(self) -> Path:
+        # Never append to a shard left over from an earlier run with the same prefix
+        while (self.shard_dir / f"{self.prefix}-{self._seq:06d}.tar").exists():
+            self._seq += 1
+        path = self.shard_dir / f"{self.prefix}-{self._seq:06d}.tar"
+        self._seq += 1
+        return path
+
+    def _open_next(self):
+        self._close_current()
+        path = self._next_shard_path()
+        self._tar_file = open(path, "wb")
+        self._idx_file = open(str(path) + ".idx", "w", encoding="utf-8")
+        self._offset = 0
+
+    def _close_current(self):
+        if self._tar_file is not None:
+            self._tar_file.close()
+            self._idx_file.close()
+            self._tar_file = None
+            self._idx_file = None
+
+    def write(self, key: str, wav_bytes: bytes, metadata: dict = None, text: str = None):
+        """Appends one sample (audio, optional transcript text and metadata) to the current shard.
+        Returns (shard file name, byte offset of the WAV data) for manifests.
+        """
+        members = [("wav", wav_bytes)]
+        if text is not None:
+            members.append(("txt", text.encode("utf-8")))
+        members.append(("json", json.dumps(dict(metadata or {}, key=key), ensure_ascii=False).encode("utf-8")))
+
+        now = time.time()
+        blobs = []
+        index_lines = []
+        wav_offset = None
+        for ext, data in members:
+            info = tarfile.TarInfo(f"{key}.{ext}")
+            info.size = len(data)
+            info.mtime = now
+            header = info.tobuf(format=tarfile.USTAR_FORMAT)
+            padding = b"\0" * (-len(data) % TAR_BLOCK)
+            blobs.append((header, data, padding))
+
+        sample_size = sum(len(h) + len(d) + len(p) for h, d, p in blobs)
+        with self._lock:
+            if self._tar_file is None or (self._offset and self._offset + sample_size + len(TAR_END) > self.max_bytes):
+                self._open_next()
+            shard_name = Path(self._tar_file.name).name
+            # Nanoseconds, kept increasing within the process so samples never tie
+            written = self._last_written = max(time.time_ns(), self._last_written + 1)
+            for (header, data, padding), (ext, _) in zip(blobs, members):
+                self._tar_file.write(header)
+                if wav_offset is None:
+                    wav_offset = self._offset + len(header)
+                index_lines.append(json.dumps({"key": key, "ext": ext, "shard": shard_name,
+                                               "offset": self._offset + len(header), "size": len(data),
+                                               "written": written}))
+                self._tar_file.write(data)
+                self._tar_file.write(padding)
+                self._offset += len(header) + len(data) + len(padding)
+            self._tar_file.write(TAR_END)
+            self._tar_file.seek(self._offset)
+            self._tar_file.flush()
+            self._idx_file.write("\n".join(index_lines) + "\n")
+            self._idx_file.flush()
+        return shard_name, wav_offset
+
+    def close(self):
+        with self._lock:
+            self._close_current()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShardReader:
+    """Random access by chunk key to the samples in a folder of shards written by ShardWriter.
+    Only the small .idx files are read up front; audio is read with a single seek per member.
+    """
+
+    def __init__(self, shard_dir: Path):
+        self.shard_dir = Path(shard_dir)
+        self._index = {}  # key -> {ext: (shard name, offset, size)}
+        self._written = {}  # key -> write time of the copy in _index
+        self._handles = {}
+        for idx_path in sorted(self.shard_dir.glob("*.tar.idx")):
+            with open(idx_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn last line from a crash
+                        continue
+                    # The last written copy of a key wins, so a re-chunked file replaces its earlier
+                    # samples whichever shard names sort first. The members of one sample share a write time.
+                    key = entry["key"]
+                    written = entry["written"]
+                    if key not in self._index or written > self._written[key]:
+                        self._index[key] = {}
+                        self._written[key] = written
+                    elif written < self._written[key]:
+                        continue
+                    self._index[key][entry["ext"]] = (entry["shard"], entry["offset"], entry["size"])
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def keys(self):
+        return self._index.keys()
+
+    def read(self, key: str, ext: str = "wav") -> bytes:
+        """Returns the raw bytes of one member (e.g. "wav", "txt" or "json") of a sample."""
+        shard_name, offset, size = self._index[key][ext]
+        handle = self._handles.get(shard_name)
+        if handle is None:
+            handle = self._handles[shard_name] = open(self.shard_dir / shard_name, "rb")
+        handle.seek(offset)
+        return handle.read(size)
+
+    def sample(self, key: str) -> dict:
+        """Returns all members of a sample: {"wav": bytes, "txt": str, "json": dict}."""
+        result = {}
+        for ext in self._index[key]:
+            data = self.read(key, ext)
+            if ext == "txt":
+                data = data.decode("utf-8")
+            elif ext == "json":
+                data = json.loads(data)
+            result[ext] = data
+        return result
+
+    def close(self):
+        for handle in self._handles.values():
+            handle.close()
+        self._handles.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def default_shard_prefix() -> str:
+    """Per-process shard prefix, so concurrent workers never append to the same shard."""
+    return f"{socket.gethostname()}-{os.getpid()}"
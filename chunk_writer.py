@@ -0,0 +1,100 @@
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from decoded_audio import SAMPLE_RATE
+
+WRITER_WORKERS = 4  # Threads writing chunk files; 0 writes in the calling thread
+WRITER_QUEUE = 64  # Chunks waiting to be written before write() blocks its caller
+
+
+def wav_header(num_samples, sample_rate=SAMPLE_RATE):
+    """The 44-byte header of a mono 16-bit PCM WAV of num_samples samples."""
+    data_bytes = num_samples * 2
+    return struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + data_bytes, b"WAVE", b"fmt ", 16, 1, 1,
+                       sample_rate, sample_rate * 2, 2, 16, b"data", data_bytes)
+
+
+def write_chunk(path, pcm, text=None, text_path=None, on_written=None):
+    """Write pcm (16-bit samples) as a WAV at path and text at text_path, then call on_written(num_samples=...)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(wav_header(len(pcm)))
+        f.write(pcm)
+    os.replace(tmp_path, path)
+    if text_path is not None:
+        with open(text_path, "w", encoding="utf-8") as f:
+            f.write(text or "")
+    if on_written is not None:
+        on_written(num_samples=len(pcm))
+
+
+class ChunkWriter:
+    """Writes chunk WAVs, and their transcripts, from a DecodedAudio on background threads.
+
+    The source is converted to 16-bit PCM once (DecodedAudio.pcm16) and every chunk is a
+    WAV header followed by a memoryview of that buffer: no per-chunk copy, resampling or
+    ffmpeg call. At most max_pending chunks wait for a writer thread; past that write()
+    blocks, so the queued chunks (and the sources they keep alive) stay bounded.
+
+    on_written, typically a manifest append, runs once a chunk's files are in place, so
+    the manifest never lists a chunk that is not on disk. Call flush() before reading the
+    outputs (e.g. build_duration_index).
+    """
+
+    def __init__(self, workers=None, max_pending=None):
+        self.workers = WRITER_WORKERS if workers is None else workers
+        self.max_pending = max_pending or WRITER_QUEUE
+        self._executor = None  # Started on the first write, so importing a script starts no threads
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._futures = []  # Writes queued since the last flush
+
+    def write(self, audio, path, start_sec, end_sec, text=None, text_path=None, on_written=None):
+        """Queue the samples of audio between two times for path. Returns the number of samples."""
+        pcm = audio.pcm16()
+        start = min(max(int(round(start_sec * SAMPLE_RATE)), 0), len(pcm))
+        end = min(max(int(round(end_sec * SAMPLE_RATE)), start), len(pcm))
+        view = memoryview(pcm[start:end])
+        if self.workers <= 0:
+            write_chunk(path, view, text, text_path, on_written)
+            return end - start
+
+        self._slots.acquire()
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="chunk_writer")
+            future = self._executor.submit(write_chunk, path, view, text, text_path, on_written)
+            self._futures.append(future)
+        future.add_done_callback(lambda done: self._done(done, path))
+        return end - start
+
+    def _done(self, future, path):
+        if future.exception() is not None:
+            print(f"Error writing {path}: {future.exception()}")
+        self._slots.release()
+
+    def flush(self):
+        """Wait for every queued chunk. Raises the first error of a failed write, if any."""
+        with self._lock:
+            futures, self._futures = self._futures, []
+        wait(futures)
+        for future in futures:
+            if future.exception() is not None:
+                raise future.exception()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                executor, self._executor = self._executor, None
+            if executor is not None:
+                executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,8 +1,13 @@
 import os
-import json
-import subprocess
-from pydub import AudioSegment
-from pydub.silence import split_on_silence
+import wave
+from bisect import bisect_right
+from concurrent.futures import as_completed
+from functools import partial
+import numpy as np
+from aeneas_pool import AlignmentPool
+from chunk_writer import ChunkWriter
+from decoded_audio import SAMPLE_RATE, DecodedAudio, to_pcm16
+from manifest import ManifestWriter, build_duration_index
 
 # ---- CONFIG ----
 AUDIO_DIR = r"D:\Models\audio_data_processing\audio_data\hindi"
@@ -10,44 +15,128 @@ TRANSCRIPT_DIR = r"D:\Models\audio_data_processing\audio_data\split_transcript"
 TEMP_AUDIO_DIR = "temp_clean_audio"
 OUTPUT_AUDIO_DIR = "output/audio_chunks"
 OUTPUT_TEXT_DIR = "output/transcript_chunks"
+MANIFEST_PATH = "output/manifest.jsonl"
 LANGUAGE = "hin"
 WORDS_PER_CHUNK = 25
-
-# ---- Ensure directories exist ----
-os.makedirs(TEMP_AUDIO_DIR, exist_ok=True)
-os.makedirs(OUTPUT_AUDIO_DIR, exist_ok=True)
-os.makedirs(OUTPUT_TEXT_DIR, exist_ok=True)
+MIN_SILENCE_MS = 300  # Pauses at least this long are removed
+SILENCE_THRESH_DB = -16  # Frames this far below the level of the whole file count as silence
+KEEP_SILENCE_MS = 100  # Silence kept on both sides of the speech around a removed pause
+SILENCE_BLOCK_SEC = 60  # Samples read at a time when computing frame levels
+
+manifest = ManifestWriter(MANIFEST_PATH)
+chunk_writer = ChunkWriter()
+
+def frame_power(samples, frame, block_sec=SILENCE_BLOCK_SEC):
+    """Mean square of every whole frame of samples, read one block at a time so a memory-mapped file is never loaded whole."""
+    block = frame * max(1, int(block_sec * SAMPLE_RATE) // frame)
+    powers = []
+    for position in range(0, len(samples) - frame + 1, block):
+        chunk = np.asarray(samples[position:position + block], dtype=np.float32)
+        chunk = chunk[:len(chunk) // frame * frame].reshape(-1, frame)
+        powers.append(np.mean(chunk * chunk, axis=1, dtype=np.float64))
+    return np.concatenate(powers) if powers else np.zeros(0)
+
+def speech_ranges(samples):
+    """(start, end) sample ranges left once pauses of MIN_SILENCE_MS are removed.
+
+    The rule of pydub's split_on_silence(min_silence_len=MIN_SILENCE_MS,
+    silence_thresh=dBFS + SILENCE_THRESH_DB, keep_silence=KEEP_SILENCE_MS): every
+    MIN_SILENCE_MS window, at millisecond steps, whose RMS is at most the threshold is
+    silence. Here the window levels come from a running sum of millisecond frame powers
+    instead of one slice at a time.
+    """
+    frame = SAMPLE_RATE // 1000
+    powers = frame_power(samples, frame)
+    window = MIN_SILENCE_MS
+    if len(powers) < window:
+        return [[0, len(samples)]] if len(samples) else []
+    # The level of the whole file (the tail shorter than a frame is ignored)
+    threshold = np.mean(powers) * 10 ** (SILENCE_THRESH_DB / 10)
+    running = np.concatenate([[0.0], np.cumsum(powers)])
+    silent_starts = np.flatnonzero(running[window:] - running[:-window] <= threshold * window)
+
+    # Frames covered by any silent window, as runs of (first frame, end frame)
+    covered = np.zeros(len(powers) + 1, dtype=np.int32)
+    np.add.at(covered, silent_starts, 1)
+    np.add.at(covered, silent_starts + window, -1)
+    silent = np.cumsum(covered[:-1]) > 0
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], silent.astype(np.int8), [0]])))
+    starts, ends = edges[0::2], edges[1::2]
+
+    # Speech lies between the removed pauses, padded with KEEP_SILENCE_MS of them
+    keep = KEEP_SILENCE_MS * frame
+    speech_starts = np.concatenate([[0], ends * frame])
+    speech_ends = np.concatenate([starts * frame, [len(samples)]])
+    non_empty = speech_ends > speech_starts
+    speech_starts = np.maximum(speech_starts[non_empty] - keep, 0)
+    speech_ends = np.minimum(speech_ends[non_empty] + keep, len(samples))
+
+    # Padding that overlaps the next range joins the two, as pydub's pieces would when concatenated
+    ranges = []
+    for start, end in zip(speech_starts.tolist(), speech_ends.tolist()):
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+    return ranges
 
 def remove_silence(input_path, output_path):
+    """Decode input_path once and write it without its pauses as a 16kHz mono WAV at output_path.
+
+    The kept ranges are written straight from the decoded samples, with no concatenated
+    copy and no MP3 re-encode; aeneas reads the WAV and chunk_by_word_count memory-maps it.
+    Returns the offset map, [clean_start_sec, original_start_sec, duration_sec] per kept range.
+    """
     print(f"Removing silence from {os.path.basename(input_path)}...")
-    audio = AudioSegment.from_mp3(input_path)
-    chunks = split_on_silence(audio, min_silence_len=300, silence_thresh=audio.dBFS - 16, keep_silence=100)
-    if not chunks:
+    audio = DecodedAudio.from_file(input_path)
+    ranges = speech_ranges(audio.samples)
+    if not ranges:
         raise ValueError("No audio chunks found after silence removal.")
 
-    combined = AudioSegment.empty()
-    for chunk in chunks:
-        combined += chunk
-    combined.export(output_path, format="mp3")
-    return combined
-
-def run_aeneas_alignment(audio_path, transcript_path, output_json_path):
-    print(f"Aligning {os.path.basename(audio_path)}...")
-    command = [
-        "python", "-m", "aeneas.tools.execute_task",
-        audio_path,
-        transcript_path,
-        f"task_language={LANGUAGE}|is_text_type=plain|os_task_file_format=json",
-        output_json_path
-    ]
-    subprocess.run(command, check=True)
-
-def chunk_by_word_count(audio_path, json_path, file_prefix):
+    offsets = []
+    position = 0
+    tmp_path = f"{output_path}.tmp"
+    with wave.open(tmp_path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        for start, end in ranges:
+            wav.writeframes(to_pcm16(audio.samples[start:end]).tobytes())
+            offsets.append([position / SAMPLE_RATE, start / SAMPLE_RATE, (end - start) / SAMPLE_RATE])
+            position += end - start
+    os.replace(tmp_path, output_path)
+    return offsets
+
+def silence_remover(cleaned_audio_path, offsets):
+    """A prepare step for AlignmentPool.submit: removes the silence of the raw file into
+    cleaned_audio_path on a planner thread, fills offsets, and returns the path to align."""
+    def prepare(raw_audio_path):
+        offsets[:] = remove_silence(raw_audio_path, cleaned_audio_path)
+        return cleaned_audio_path
+    return prepare
+
+def remove_cleaned(cleaned_audio_path):
+    """Delete a cleaned WAV. Returns False if it is still mapped where that prevents it (Windows)."""
+    try:
+        if os.path.exists(cleaned_audio_path):
+            os.remove(cleaned_audio_path)
+        return True
+    except OSError:
+        return False
+
+def original_time(offsets, clean_sec):
+    """Map a time on the silence-removed timeline back to the original recording."""
+    index = max(bisect_right([clean_start for clean_start, _, _ in offsets], clean_sec) - 1, 0)
+    clean_start, original_start, duration = offsets[index]
+    return original_start + min(max(clean_sec - clean_start, 0.0), duration)
+
+def chunk_by_word_count(audio_path, data, file_prefix, audio=None, source_path=None, offsets=None):
+    """Export chunks of WORDS_PER_CHUNK words from an aeneas alignment ({"fragments": [...]})
+    of the cleaned audio_path. With the offsets from remove_silence, manifest rows point at
+    the original source_path and its timeline."""
     print(f"Chunking {file_prefix} by {WORDS_PER_CHUNK} words...")
-    audio = AudioSegment.from_mp3(audio_path)
-
-    with open(json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    if audio is None:
+        audio = DecodedAudio.from_wav(audio_path)
 
     chunk_index = 1
     word_buffer = []
@@ -71,52 +160,82 @@ def chunk_by_word_count(audio_path, json_path, file_prefix):
             time_buffer.append((word_start, word_end))
 
             if len(word_buffer) == WORDS_PER_CHUNK:
-                export_chunk(audio, word_buffer, time_buffer, file_prefix, chunk_index)
+                export_chunk(audio, word_buffer, time_buffer, file_prefix, chunk_index, source_path, offsets)
                 chunk_index += 1
                 word_buffer = []
                 time_buffer = []
 
     # Save any leftover words
     if word_buffer:
-        export_chunk(audio, word_buffer, time_buffer, file_prefix, chunk_index)
+        export_chunk(audio, word_buffer, time_buffer, file_prefix, chunk_index, source_path, offsets)
 
-def export_chunk(audio, words, times, prefix, index):
+def export_chunk(audio, words, times, prefix, index, source_path=None, offsets=None):
     chunk_name = f"{prefix}_chunk_{index:03}"
     audio_filename = os.path.join(OUTPUT_AUDIO_DIR, f"{chunk_name}.wav")
     text_filename = os.path.join(OUTPUT_TEXT_DIR, f"{chunk_name}.txt")
 
     start_ms = int(times[0][0] * 1000)
     end_ms = int(times[-1][1] * 1000)
-    chunk_audio = audio[start_ms:end_ms]
-    chunk_audio.set_frame_rate(16000).set_channels(1).export(audio_filename, format="wav")
-
-    with open(text_filename, "w", encoding="utf-8") as tf:
-        tf.write(" ".join(words))
+    start, end = start_ms / 1000, end_ms / 1000
+    if offsets:
+        # The chunk is cut from the cleaned audio, but the manifest locates it in the original
+        # recording; duration stays the length of the chunk, without the removed pauses
+        source_start, source_end = original_time(offsets, start), original_time(offsets, end)
+    else:
+        source_start, source_end = start, end
+    chunk_writer.write(audio, audio_filename, start, end, " ".join(words), text_filename,
+                       on_written=partial(manifest.append, chunk_name, source_path or prefix, LANGUAGE,
+                                          start=source_start, end=source_end, duration=end - start,
+                                          text=" ".join(words), path=audio_filename))
 
     print(f"Saved chunk: {chunk_name}")
 
 def process_all_files():
-    for audio_file in os.listdir(AUDIO_DIR):
-        if not audio_file.endswith(".mp3"):
-            continue
-
-        filename = os.path.splitext(audio_file)[0]
-        raw_audio_path = os.path.join(AUDIO_DIR, audio_file)
-        transcript_path = os.path.join(TRANSCRIPT_DIR, f"{filename}.txt")
-        cleaned_audio_path = os.path.join(TEMP_AUDIO_DIR, f"{filename}_clean.mp3")
-        alignment_json = f"temp_alignment_{filename}.json"
-
-        if not os.path.exists(transcript_path):
-            print(f"Transcript for {filename} not found. Skipping.")
-            continue
-
-        try:
-            remove_silence(raw_audio_path, cleaned_audio_path)
-            run_aeneas_alignment(cleaned_audio_path, transcript_path, alignment_json)
-            chunk_by_word_count(cleaned_audio_path, alignment_json, filename)
-        finally:
-            if os.path.exists(alignment_json):
-                os.remove(alignment_json)
+    os.makedirs(TEMP_AUDIO_DIR, exist_ok=True)
+    os.makedirs(OUTPUT_AUDIO_DIR, exist_ok=True)
+    os.makedirs(OUTPUT_TEXT_DIR, exist_ok=True)
+
+    # Silence is removed and the cleaned files aligned by the pool, several files at a time,
+    # and each file is chunked as it finishes
+    leftovers = []
+    with AlignmentPool() as pool:
+        aligning = {}
+        for audio_file in os.listdir(AUDIO_DIR):
+            if not audio_file.endswith(".mp3"):
+                continue
+
+            filename = os.path.splitext(audio_file)[0]
+            raw_audio_path = os.path.join(AUDIO_DIR, audio_file)
+            transcript_path = os.path.join(TRANSCRIPT_DIR, f"{filename}.txt")
+            cleaned_audio_path = os.path.join(TEMP_AUDIO_DIR, f"{filename}_clean.wav")
+
+            if not os.path.exists(transcript_path):
+                print(f"Transcript for {filename} not found. Skipping.")
+                continue
+
+            offsets = []
+            print(f"Aligning {os.path.basename(cleaned_audio_path)}...")
+            future = pool.submit(raw_audio_path, transcript_path, LANGUAGE,
+                                 prepare=silence_remover(cleaned_audio_path, offsets))
+            aligning[future] = (cleaned_audio_path, filename, raw_audio_path, offsets)
+
+        for future in as_completed(aligning):
+            cleaned_audio_path, filename, raw_audio_path, offsets = aligning[future]
+            try:
+                alignment, audio = future.result()
+            except Exception as e:
+                print(f"Alignment failed for {filename}: {e}")
+                remove_cleaned(cleaned_audio_path)
+                continue
+            chunk_by_word_count(cleaned_audio_path, alignment, filename, audio, raw_audio_path, offsets)
+            # The chunk writers read the queued chunks through the mapping, which outlives the file
+            if not remove_cleaned(cleaned_audio_path):
+                leftovers.append(cleaned_audio_path)
+
+    chunk_writer.flush()
+    for cleaned_audio_path in leftovers:
+        remove_cleaned(cleaned_audio_path)
+    build_duration_index(MANIFEST_PATH)
 
 if __name__ == "__main__":
     process_all_files()
@@ -1,7 +1,11 @@
 import os
-import json
-import subprocess
-from pydub import AudioSegment
+from concurrent.futures import as_completed
+from functools import partial
+from aeneas_pool import AlignmentPool
+from chunk_writer import ChunkWriter
+from decoded_audio import DecodedAudio
+from manifest import ManifestWriter, build_duration_index
+from word_timings import sidecar_alignment
 # import aeneas
 
 # ---- CONFIG ----
@@ -9,31 +13,23 @@ AUDIO_DIR = r"D:\Models\audio_data_processing\audio_data\hindi"
 TRANSCRIPT_DIR = r"D:\Models\audio_data_processing\audio_data\split_transcript"
 OUTPUT_AUDIO_DIR = "output/audio_chunks"
 OUTPUT_TEXT_DIR = "output/transcript_chunks"
+MANIFEST_PATH = "output/manifest.jsonl"
+WORDS_DIR = TRANSCRIPT_DIR  # Where <name>.words.json sidecars from the STT scripts are looked up
 LANGUAGE = "hin"
 WORDS_PER_CHUNK = 15
 
-# ---- Ensure output directories exist ----
-os.makedirs(OUTPUT_AUDIO_DIR, exist_ok=True)
-os.makedirs(OUTPUT_TEXT_DIR, exist_ok=True)
-
-def run_aeneas_alignment(audio_path, transcript_path, output_json_path):
-    print(f"Aligning {os.path.basename(audio_path)}...")
-    command = [
-        "python", "-m", "aeneas.tools.execute_task",
-        audio_path,
-        transcript_path,
-        f"task_language={LANGUAGE}|is_text_type=plain|os_task_file_format=json",
-        output_json_path
-    ]
-    subprocess.run(command, check=True)
-
-def chunk_by_word_count(audio_path, json_path, file_prefix):
-    print(f"Processing {file_prefix} by {WORDS_PER_CHUNK} words per chunk...")
-    audio = AudioSegment.from_mp3(audio_path)
-    audio_duration_sec = len(audio) / 1000.0
+manifest = ManifestWriter(MANIFEST_PATH)
+chunk_writer = ChunkWriter()
 
-    with open(json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+def chunk_by_word_count(audio_path, data, file_prefix, audio=None):
+    """Export chunks of WORDS_PER_CHUNK words from an aeneas-style alignment. Fragments with
+    "word_times" (from Google word timings) are cut at the real word boundaries; otherwise
+    a fragment's duration is spread evenly over its words. Pass audio when the file is
+    already decoded (AlignmentPool hands its decode on)."""
+    print(f"Processing {file_prefix} by {WORDS_PER_CHUNK} words per chunk...")
+    if audio is None:
+        audio = DecodedAudio.from_file(audio_path)
+    audio_duration_sec = audio.duration_sec
 
     chunk_index = 1
     word_buffer = []
@@ -49,25 +45,29 @@ def chunk_by_word_count(audio_path, json_path, file_prefix):
 
         # Insert silence chunk if there's a gap between previous and current fragment
         if start > prev_end:
-            export_chunk(audio, [], [(prev_end, start)], file_prefix, chunk_index)
+            export_chunk(audio, [], [(prev_end, start)], file_prefix, chunk_index, audio_path)
             chunk_index += 1
 
         if not words:
             # Still export an empty chunk if there's time range with no text
-            export_chunk(audio, [], [(start, end)], file_prefix, chunk_index)
+            export_chunk(audio, [], [(start, end)], file_prefix, chunk_index, audio_path)
             chunk_index += 1
             prev_end = end
             continue
 
         word_duration = duration / len(words)
+        word_times = fragment.get("word_times")
         for i, word in enumerate(words):
-            word_start = start + i * word_duration
-            word_end = word_start + word_duration
+            if word_times:
+                word_start, word_end = word_times[i]
+            else:
+                word_start = start + i * word_duration
+                word_end = word_start + word_duration
             word_buffer.append(word)
             time_buffer.append((word_start, word_end))
 
             if len(word_buffer) == WORDS_PER_CHUNK:
-                export_chunk(audio, word_buffer, time_buffer, file_prefix, chunk_index)
+                export_chunk(audio, word_buffer, time_buffer, file_prefix, chunk_index, audio_path)
                 chunk_index += 1
                 word_buffer = []
                 time_buffer = []
@@ -76,49 +76,67 @@ def chunk_by_word_count(audio_path, json_path, file_prefix):
 
     # Remaining words
     if word_buffer:
-        export_chunk(audio, word_buffer, time_buffer, file_prefix, chunk_index)
+        export_chunk(audio, word_buffer, time_buffer, file_prefix, chunk_index, audio_path)
         chunk_index += 1
 
     # Handle trailing silence at the end of the audio
     if prev_end < audio_duration_sec:
-        export_chunk(audio, [], [(prev_end, audio_duration_sec)], file_prefix, chunk_index)
+        export_chunk(audio, [], [(prev_end, audio_duration_sec)], file_prefix, chunk_index, audio_path)
 
-def export_chunk(audio, words, times, prefix, index):
+def export_chunk(audio, words, times, prefix, index, source_path=None):
     chunk_name = f"{prefix}_chunk_{index:03}"
     audio_filename = os.path.join(OUTPUT_AUDIO_DIR, f"{chunk_name}.wav")
     text_filename = os.path.join(OUTPUT_TEXT_DIR, f"{chunk_name}.txt")
 
     start_ms = int(times[0][0] * 1000)
     end_ms = int(times[-1][1] * 1000)
-    chunk_audio = audio[start_ms:end_ms]
-
-    chunk_audio.set_frame_rate(16000).set_channels(1).export(audio_filename, format="wav")
-
-    with open(text_filename, "w", encoding="utf-8") as tf:
-        tf.write(" ".join(words))  # Will be blank for silent chunks
+    # The text will be blank for silent chunks
+    chunk_writer.write(audio, audio_filename, start_ms / 1000, end_ms / 1000, " ".join(words), text_filename,
+                       on_written=partial(manifest.append, chunk_name, source_path or prefix, LANGUAGE,
+                                          start=start_ms / 1000, end=end_ms / 1000, text=" ".join(words),
+                                          path=audio_filename))
 
     print(f"Saved chunk: {chunk_name} ({end_ms - start_ms} ms, {' '.join(words) or 'SILENCE'})")
 
 def process_all_files():
-    for audio_file in os.listdir(AUDIO_DIR):
-        if not audio_file.endswith(".mp3"):
-            continue
-
-        filename = os.path.splitext(audio_file)[0]
-        audio_path = os.path.join(AUDIO_DIR, audio_file)
-        transcript_path = os.path.join(TRANSCRIPT_DIR, f"{filename}.txt")
-        alignment_json = f"temp_alignment_{filename}.json"
-
-        if not os.path.exists(transcript_path):
-            print(f"Transcript for {filename} not found. Skipping.")
-            continue
-
-        try:
-            run_aeneas_alignment(audio_path, transcript_path, alignment_json)
-            chunk_by_word_count(audio_path, alignment_json, filename)
-        finally:
-            if os.path.exists(alignment_json):
-                os.remove(alignment_json)
+    os.makedirs(OUTPUT_AUDIO_DIR, exist_ok=True)
+    os.makedirs(OUTPUT_TEXT_DIR, exist_ok=True)
+
+    # Files without word timings are aligned by a pool of aeneas workers and chunked as they finish
+    with AlignmentPool() as pool:
+        aligning = {}
+        for audio_file in os.listdir(AUDIO_DIR):
+            if not audio_file.endswith(".mp3"):
+                continue
+
+            filename = os.path.splitext(audio_file)[0]
+            audio_path = os.path.join(AUDIO_DIR, audio_file)
+            transcript_path = os.path.join(TRANSCRIPT_DIR, f"{filename}.txt")
+
+            if not os.path.exists(transcript_path):
+                print(f"Transcript for {filename} not found. Skipping.")
+                continue
+
+            alignment = sidecar_alignment(WORDS_DIR, filename, transcript_path)
+            if alignment is not None:
+                print(f"Using Google word timings for {filename}, skipping aeneas.")
+                chunk_by_word_count(audio_path, alignment, filename)
+                continue
+
+            print(f"Aligning {audio_file}...")
+            aligning[pool.submit(audio_path, transcript_path, LANGUAGE)] = (audio_path, filename)
+
+        for future in as_completed(aligning):
+            audio_path, filename = aligning[future]
+            try:
+                alignment, audio = future.result()
+            except Exception as e:
+                print(f"Alignment failed for {filename}: {e}")
+                continue
+            chunk_by_word_count(audio_path, alignment, filename, audio)
+
+    chunk_writer.flush()
+    build_duration_index(MANIFEST_PATH)
 
 if __name__ == "__main__":
     process_all_files()
@@ -0,0 +1,253 @@
+import argparse
+import importlib
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+
+from manifest import ManifestWriter
+
+# Script run by each subcommand and method. Scripts are imported only once their subcommand
+# runs, so --help and the light subcommands never load google-cloud, torch or whisperx.
+METHOD_MODULES = {
+    ("download", "youtube"): "youtube_download",
+    ("transcribe", "folder"): "transcript",
+    ("transcribe", "bucket"): "audio_transcript_in_bucket",
+    ("split", "words"): "split_transcript_by_words",
+    ("split", "sentences"): "transcript_edit",
+    ("align", "transcript"): "chunk_by_transcript",
+    ("align", "words"): "chunks_by_words",
+    ("align", "clean-words"): "chunks_by_the_no_of_words",
+    ("align", "whisper"): "chunk_by_transcript_wishper",
+    ("chunk", "fixed"): "chunk_create",
+    ("chunk", "energy"): "chunk_create",
+    ("chunk", "whisper"): "chunk_by_wishper",
+    ("daemon", "whisper"): "asr_daemon",
+}
+
+
+def methods(command):
+    return [method for name, method in METHOD_MODULES if name == command]
+
+
+def load(command, method):
+    return importlib.import_module(METHOD_MODULES[command, method])
+
+
+def configure(module, **constants):
+    """Override a script's CONFIG constants with the options that were given; None keeps the script's value."""
+    for name, value in constants.items():
+        if value is not None:
+            setattr(module, name, value)
+
+
+def positive_float(text):
+    value = float(text)
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"must be above 0, got {text}")
+    return value
+
+
+def ratio(text):
+    value = float(text)
+    if not 0.0 <= value <= 1.0:
+        raise argparse.ArgumentTypeError(f"must be between 0 and 1, got {text}")
+    return value
+
+
+def configure_outputs(module, output_dir):
+    """Point a chunking script's audio, text and manifest outputs into output_dir."""
+    if output_dir:
+        configure(module, OUTPUT_AUDIO_DIR=os.path.join(output_dir, "audio_chunks"),
+                  OUTPUT_TEXT_DIR=os.path.join(output_dir, "transcript_chunks"),
+                  MANIFEST_PATH=os.path.join(output_dir, "manifest.jsonl"))
+        module.manifest = ManifestWriter(module.MANIFEST_PATH)
+
+
+def run_download(args):
+    youtube_download = load("download", args.method)
+    urls = list(args.urls)
+    if args.urls_file:
+        with open(args.urls_file, "r", encoding="utf-8") as f:
+            urls += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    configure(youtube_download, download_folder=args.output_dir)
+    youtube_download.process_all(urls or youtube_download.urls)
+
+
+def run_transcribe(args):
+    if args.credentials:
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = args.credentials
+    module = load("transcribe", args.method)
+    cache_path = None if args.no_cache else args.cache or module.CACHE_DB
+    configure(module, OUTPUT_DIR=args.output_dir, WORD_TIMESTAMPS=args.word_timestamps)
+    if args.method == "bucket":
+        # The state store lives with the transcripts it describes unless it is given explicitly
+        state_db = args.state_db or (os.path.join(args.output_dir, ".bucket_state.sqlite3") if args.output_dir else None)
+        configure(module, BUCKET_NAME=args.bucket, BASE_GCS_PATH=args.prefix, MAX_IN_FLIGHT=args.max_in_flight,
+                  UPLOAD_ENCODING=args.encoding, STATE_DB=state_db)
+        module.init_clients(cache_path=cache_path)
+        module.process_bucket(module.MAX_IN_FLIGHT, module.POLL_INTERVAL_SEC, module.UPLOAD_ENCODING, module.STATE_DB)
+    else:
+        configure(module, INPUT_DIR=args.input_dir, MAX_IN_FLIGHT=args.max_in_flight, RECOGNIZE_MODE=args.mode,
+                  BUNDLE_SIZE=args.bundle_size, BUNDLE_BUCKET=args.bucket)
+        module.init_client(cache_path=cache_path)
+        module.process_folder(module.INPUT_DIR, module.OUTPUT_DIR, module.MAX_IN_FLIGHT, module.BUNDLE_SIZE)
+
+
+def run_split(args):
+    module = load("split", args.method)
+    input_dir = args.input_dir or module.TRANSCRIPT_DIR
+    output_dir = args.output_dir or module.OUTPUT_DIR
+    if args.method == "words":
+        module.process_all_transcripts(input_dir, output_dir, args.words_per_line)
+    else:
+        module.process_all_transcripts(input_dir, output_dir)
+
+
+def run_align(args):
+    module = load("align", args.method)
+    configure(module, AUDIO_DIR=args.audio_dir, TRANSCRIPT_DIR=args.transcript_dir)
+    if hasattr(module, "WORDS_DIR"):
+        configure(module, WORDS_DIR=args.words_dir or args.transcript_dir)
+    if args.method == "whisper":
+        configure(module, CHUNK_SIZE=args.words_per_chunk)
+    else:
+        configure(module, LANGUAGE=args.language, WORDS_PER_CHUNK=args.words_per_chunk)
+    configure(importlib.import_module("aeneas_pool"), ALIGN_WORKERS=args.workers)
+    configure_outputs(module, args.output_dir)
+    module.process_all_files()
+
+
+def run_chunk(args):
+    module = load("chunk", args.method)
+    if args.method == "whisper":
+        configure(module, AUDIO_DIR=args.input_dir, LANGUAGE=args.language, FILES_PER_CALL=args.files_per_call,
+                  BATCH_SIZE=args.batch_size)
+        configure_outputs(module, args.output_dir)
+        module.process_all_files(module.AUDIO_DIR, module.FILES_PER_CALL, module.BATCH_SIZE, module.DECODE_WORKERS)
+        return
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    input_root = Path(args.input_dir) if args.input_dir else module.INPUT_ROOT
+    output_root = Path(args.output_dir) if args.output_dir else module.OUTPUT_ROOT
+    configure(module, CHUNK_LENGTH_SEC=args.chunk_sec, TRAIN_RATIO=args.train_ratio,
+              MIN_CHUNK_SEC=args.min_chunk_sec, MAX_CHUNK_SEC=args.max_chunk_sec)
+    module.process_all(input_root, output_root, module.CHUNK_LENGTH_SEC, module.TRAIN_RATIO, args.language,
+                       args.stream, args.engine, args.workers, args.memory_budget_mb, args.output_format,
+                       args.run_id, args.method, module.MIN_CHUNK_SEC, module.MAX_CHUNK_SEC)
+
+
+def run_daemon(args):
+    asr_daemon = load("daemon", args.method)
+    configure(asr_daemon, ASR_SOCKET=args.socket, MODEL_NAME=args.model, WORKERS=args.workers,
+              MEMORY_BUDGET_MB=args.memory_budget_mb)
+    asr_daemon.serve(asr_daemon.ASR_SOCKET, asr_daemon.MODEL_NAME, asr_daemon.WORKERS, asr_daemon.MEMORY_BUDGET_MB)
+
+
+def build_parser():
+    """Options left unset default to None, which keeps the CONFIG value of the script that runs."""
+    parser = argparse.ArgumentParser(prog="transcripts", description="Download, transcribe, split, align and chunk audio.")
+    parser.add_argument("--config", default=None,
+                        help="JSON file of option values per subcommand, e.g. {\"chunk\": {\"workers\": 8}}; "
+                             "flags given on the command line win")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add(command, run, help):
+        subparser = subparsers.add_parser(command, help=help)
+        subparser.add_argument("--method", choices=methods(command), default=methods(command)[0])
+        subparser.set_defaults(run=run)
+        return subparser
+
+    download = add("download", run_download, "Download YouTube audio as MP3")
+    download.add_argument("urls", nargs="*", help="Video URLs (default: the list in youtube_download.py)")
+    download.add_argument("--urls-file", default=None, help="File with one URL per line")
+    download.add_argument("--output-dir", default=None)
+
+    transcribe = add("transcribe", run_transcribe, "Transcribe with Google Speech-to-Text, from a folder or a GCS bucket")
+    transcribe.add_argument("--input-dir", default=None, help="folder: WAVs to transcribe")
+    transcribe.add_argument("--output-dir", default=None)
+    transcribe.add_argument("--bucket", default=None,
+                            help="bucket: bucket name; folder: bucket that bundles are uploaded to")
+    transcribe.add_argument("--prefix", default=None, help="bucket: path of the MP3s in the bucket")
+    transcribe.add_argument("--max-in-flight", type=int, default=None)
+    transcribe.add_argument("--mode", choices=["sync", "streaming", "auto"], default=None, help="folder: recognize mode")
+    transcribe.add_argument("--bundle-size", type=int, default=None, help="folder: files per long-running request")
+    transcribe.add_argument("--encoding", choices=["linear16", "flac", "ogg_opus"], default=None,
+                            help="bucket: upload encoding")
+    transcribe.add_argument("--state-db", default=None, help="bucket: SQLite store of transcribed blobs (default: in --output-dir)")
+    transcribe.add_argument("--cache", default=None, help="Transcript cache database")
+    transcribe.add_argument("--no-cache", action="store_true")
+    transcribe.add_argument("--no-word-timestamps", dest="word_timestamps", action="store_const", const=False,
+                            default=None)
+    transcribe.add_argument("--credentials", default=None, help="Service account JSON")
+
+    split = add("split", run_split, "Split transcripts into lines of N words or into sentences")
+    split.add_argument("--input-dir", default=None)
+    split.add_argument("--output-dir", default=None)
+    split.add_argument("--words-per-line", type=int, default=20)
+
+    align = add("align", run_align, "Align transcripts to their audio and export chunks")
+    align.add_argument("--audio-dir", default=None)
+    align.add_argument("--transcript-dir", default=None)
+    align.add_argument("--words-dir", default=None, help="Where word timing sidecars are looked up "
+                                                         "(default: the transcript folder)")
+    align.add_argument("--output-dir", default=None)
+    align.add_argument("--language", default=None, help="aeneas language code, e.g. hin")
+    align.add_argument("--words-per-chunk", type=int, default=None,
+                       help="words, clean-words, whisper: words per chunk (transcript exports one chunk per line)")
+    align.add_argument("--workers", type=int, default=None, help="aeneas worker processes")
+
+    chunk = add("chunk", run_chunk, "Cut audio into chunks at fixed lengths, quiet points or whisper segments")
+    chunk.add_argument("--input-dir", default=None)
+    chunk.add_argument("--output-dir", default=None)
+    chunk.add_argument("--language", default=None,
+                       help="fixed/energy: language folder to process (default: all); whisper: language code")
+    chunk.add_argument("--chunk-sec", type=positive_float, default=None)
+    chunk.add_argument("--min-chunk-sec", type=positive_float, default=None)
+    chunk.add_argument("--max-chunk-sec", type=positive_float, default=None)
+    chunk.add_argument("--train-ratio", type=ratio, default=None, help="Share of chunks in train; 0 puts all in dev")
+    chunk.add_argument("--stream", action="store_true")
+    chunk.add_argument("--engine", choices=["thread", "process"], default="thread")
+    chunk.add_argument("--workers", type=int, default=None)
+    chunk.add_argument("--memory-budget-mb", type=float, default=None)
+    chunk.add_argument("--output-format", choices=["wav", "shards"], default="wav")
+    chunk.add_argument("--run-id", default=None)
+    chunk.add_argument("--batch-size", type=int, default=None, help="whisper: VAD segments per forward pass")
+    chunk.add_argument("--files-per-call", type=int, default=None, help="whisper: files batched per transcribe call")
+
+    daemon = add("daemon", run_daemon, "Run the ASR daemon that keeps whisperx models loaded")
+    daemon.add_argument("--socket", default=None)
+    daemon.add_argument("--model", default=None)
+    daemon.add_argument("--workers", type=int, default=None)
+    daemon.add_argument("--memory-budget-mb", type=float, default=None)
+    return parser, subparsers.choices
+
+
+def parse_args(argv=None):
+    """Parse argv, taking defaults for the chosen subcommand from --config when one is given."""
+    parser, subparsers = build_parser()
+    args = parser.parse_args(argv)
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            settings = json.load(f).get(args.command, {})
+        subparser = subparsers[args.command]
+        known = {action.dest for action in subparser._actions}
+        settings = {key.replace("-", "_"): value for key, value in settings.items()}
+        unknown = sorted(set(settings) - known)
+        if unknown:
+            parser.error(f"unknown {args.command} options in {args.config}: {', '.join(unknown)}")
+        subparser.set_defaults(**settings)
+        args = parser.parse_args(argv)
+    if args.command == "align" and args.method == "transcript" and args.words_per_chunk is not None:
+        parser.error("--words-per-chunk does not apply to --method transcript, which exports one chunk per transcript line")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
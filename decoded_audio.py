@@ -0,0 +1,181 @@
+import os
+import subprocess
+import tempfile
+import wave
+
+import numpy as np
+from pydub import AudioSegment
+
+SAMPLE_RATE = 16000
+MEMMAP_OVER_SEC = 20 * 60  # Longer files are decoded into a memory-mapped temp file
+DECODE_BLOCK_BYTES = 1024 * 1024
+
+
+def to_pcm16(samples):
+    """float32 samples in [-1, 1] as 16-bit PCM; 16-bit samples are returned as they are."""
+    if samples.dtype == np.int16:
+        return samples
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def decode_command(path):
+    return [AudioSegment.converter, "-nostdin", "-v", "error", "-i", str(path),
+            "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "f32le", "-"]
+
+
+def check_decoder(returncode, stderr_file, path):
+    """Raise with ffmpeg's messages (written to stderr_file) if the decode failed."""
+    if returncode != 0:
+        stderr_file.seek(0)
+        error = stderr_file.read().decode(errors="replace").strip()
+        raise RuntimeError(f"ffmpeg failed to decode {path}: {error}")
+
+
+class DecodedAudio:
+    """A source file decoded once to 16kHz mono float32 samples.
+
+    samples is what whisperx expects from load_audio, so it can be passed to
+    model.transcribe as is, and chunks are exported by slicing it by sample index: no
+    second decode and no per-chunk resampling. Files longer than MEMMAP_OVER_SEC are
+    kept in an unlinked temp file and memory-mapped instead of held in RAM.
+
+    from_wav maps a 16kHz mono 16-bit WAV in place instead; its samples are int16.
+
+    mapped_file is (path, byte offset) when the samples are mapped from a named file,
+    which another process can map as well (see asr_daemon.sample_spec).
+    """
+
+    def __init__(self, samples, source=None, mapped_file=None):
+        self.samples = samples
+        self.source = source
+        self.mapped_file = mapped_file
+        self._pcm16 = None
+        self._owned_file = None
+
+    @classmethod
+    def from_file(cls, path, memmap_over_sec=MEMMAP_OVER_SEC, tmp_dir=None, shared_dir=None):
+        """Decode path with ffmpeg. With shared_dir, the samples are decoded straight into a
+        named raw float32 file there and mapped, whatever their length, so another process
+        can map the same pages; release_file() removes the file once that is done."""
+        if shared_dir is not None:
+            return cls._decode_to_file(path, shared_dir, tmp_dir)
+        # stderr goes to a file: a pipe nobody reads fills up on the warnings of a damaged
+        # file and blocks ffmpeg while stdout is being read
+        with tempfile.TemporaryFile(dir=tmp_dir, prefix="ffmpeg_stderr_") as stderr_file:
+            process = subprocess.Popen(decode_command(path), stdout=subprocess.PIPE, stderr=stderr_file)
+            memmap_over_bytes = int(memmap_over_sec * SAMPLE_RATE * 4)
+            buffer = bytearray()
+            num_bytes = 0
+            spill = None
+            try:
+                for block in iter(lambda: process.stdout.read(DECODE_BLOCK_BYTES), b""):
+                    num_bytes += len(block)
+                    if spill is None and num_bytes > memmap_over_bytes:
+                        spill = tempfile.TemporaryFile(dir=tmp_dir, prefix="decoded_")
+                        spill.write(buffer)
+                        buffer = None
+                    if spill is not None:
+                        spill.write(block)
+                    else:
+                        buffer += block
+                check_decoder(process.wait(), stderr_file, path)
+
+                if spill is None:
+                    # A bytearray keeps the array writable without copying it
+                    samples = np.frombuffer(buffer, dtype=np.float32)
+                else:
+                    spill.flush()
+                    num_samples = num_bytes // 4
+                    # Copy-on-write so consumers that need a writable array (torch.from_numpy) accept it
+                    samples = np.memmap(spill, dtype=np.float32, mode="c", shape=(num_samples,))
+            finally:
+                process.stdout.close()
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+                if spill is not None:
+                    # The mapping keeps the data alive after the temp file is closed
+                    spill.close()
+        return cls(samples, path)
+
+    @classmethod
+    def _decode_to_file(cls, path, shared_dir, tmp_dir=None):
+        fd, samples_path = tempfile.mkstemp(prefix="decoded_", suffix=".f32", dir=shared_dir)
+        try:
+            with os.fdopen(fd, "wb") as out, \
+                    tempfile.TemporaryFile(dir=tmp_dir, prefix="ffmpeg_stderr_") as stderr_file:
+                process = subprocess.run(decode_command(path), stdout=out, stderr=stderr_file)
+                check_decoder(process.returncode, stderr_file, path)
+            if not os.path.getsize(samples_path):
+                os.remove(samples_path)
+                return cls(np.zeros(0, dtype=np.float32), path)
+            # Copy-on-write like a long decode, so consumers that need a writable array accept it
+            audio = cls(np.memmap(samples_path, dtype=np.float32, mode="c"), path, (samples_path, 0))
+        except BaseException:
+            if os.path.exists(samples_path):
+                os.remove(samples_path)
+            raise
+        audio._owned_file = samples_path
+        return audio
+
+    def release_file(self):
+        """Remove the file from_file(shared_dir=...) decoded into. The samples stay mapped and
+        usable in this process; other processes can no longer map them."""
+        if self._owned_file is not None:
+            try:
+                os.remove(self._owned_file)
+            except OSError:
+                pass
+            self._owned_file = self.mapped_file = None
+
+    @classmethod
+    def from_wav(cls, path):
+        """Memory-map the samples of a 16kHz mono 16-bit WAV (as written by export_wav) without decoding it."""
+        with open(path, "rb") as f:
+            with wave.open(f, "rb") as wav:
+                if (wav.getframerate(), wav.getnchannels(), wav.getsampwidth()) != (SAMPLE_RATE, 1, 2):
+                    raise ValueError(f"{path} is not a {SAMPLE_RATE}Hz mono 16-bit WAV")
+                num_samples = wav.getnframes()
+                # Opening the WAV leaves the file at the start of the data chunk
+                offset = f.tell()
+        if not num_samples:
+            return cls(np.zeros(0, dtype=np.int16), path)
+        return cls(np.memmap(path, dtype="<i2", mode="r", offset=offset, shape=(num_samples,)), path,
+                   (os.path.abspath(path), offset))
+
+    @property
+    def duration_sec(self):
+        return len(self.samples) / SAMPLE_RATE
+
+    def pcm16(self):
+        """The samples as 16-bit PCM, converted once and kept. The conversion of memory-mapped
+        samples goes into an unlinked temp file one block at a time, so it is mapped as well."""
+        if self._pcm16 is None:
+            if self.samples.dtype == np.int16:
+                self._pcm16 = self.samples
+            elif isinstance(self.samples, np.memmap) and len(self.samples):
+                with tempfile.TemporaryFile(prefix="pcm16_") as spill:
+                    pcm = np.memmap(spill, dtype=np.int16, mode="w+", shape=(len(self.samples),))
+                    block = DECODE_BLOCK_BYTES // 4
+                    for position in range(0, len(pcm), block):
+                        pcm[position:position + block] = to_pcm16(self.samples[position:position + block])
+                self._pcm16 = pcm
+            else:
+                self._pcm16 = to_pcm16(self.samples)
+        return self._pcm16
+
+    def slice(self, start_sec, end_sec):
+        """View of the samples between two times; no copy."""
+        return self.samples[int(round(start_sec * SAMPLE_RATE)):int(round(end_sec * SAMPLE_RATE))]
+
+    def export_wav(self, path, start_sec, end_sec):
+        """Write the samples between two times as a 16kHz mono 16-bit WAV. Returns the number of samples."""
+        pcm = to_pcm16(self.slice(start_sec, end_sec))
+        tmp_path = f"{path}.tmp"
+        with wave.open(tmp_path, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(SAMPLE_RATE)
+            wav.writeframes(pcm.tobytes())
+        os.replace(tmp_path, path)
+        return len(pcm)
@@ -0,0 +1,261 @@
+"""In-memory stand-ins for the Google Speech and Cloud Storage clients.
+
+They implement only the calls the transcription scripts make, and simulate
+network and recognition latency with sleeps, so the pipelines can be run and
+their throughput measured offline.
+"""
+import base64
+import hashlib
+import io
+import random
+import subprocess
+import threading
+import time
+import wave
+from array import array
+from datetime import timedelta
+from types import SimpleNamespace
+
+from google.api_core import exceptions
+from pydub import AudioSegment
+
+INLINE_LIMIT_SEC = 60  # The Speech API rejects inline (content) audio longer than about a minute
+
+
+def fake_response(transcript, word_sec=0.4):
+    """A recognize/long_running_recognize response with a single result whose words
+    are word_sec long each."""
+    words = [SimpleNamespace(word=word, start_time=timedelta(seconds=i * word_sec),
+                             end_time=timedelta(seconds=(i + 1) * word_sec), confidence=0.9)
+             for i, word in enumerate(transcript.split())]
+    alternative = SimpleNamespace(transcript=transcript, confidence=0.9, words=words)
+    return SimpleNamespace(results=[SimpleNamespace(alternatives=[alternative])])
+
+
+def inline_seconds(content):
+    """Duration of inline LINEAR16 audio: 16kHz 16-bit mono WAV bytes or raw PCM."""
+    if content[:4] == b"RIFF":
+        with wave.open(io.BytesIO(content)) as wav:
+            return wav.getnframes() / wav.getframerate()
+    return len(content) / 32000
+
+
+def decode_pcm(data):
+    """16kHz 16-bit mono PCM of encoded audio (WAV, FLAC, OGG_OPUS) through ffmpeg."""
+    result = subprocess.run([AudioSegment.converter, "-nostdin", "-v", "error", "-i", "-",
+                             "-ac", "1", "-ar", "16000", "-f", "s16le", "-"],
+                            input=data, stdout=subprocess.PIPE, check=True)
+    return result.stdout
+
+
+def words_from_audio(content, frame_ms=100, threshold=500):
+    """Words for 16kHz 16-bit mono audio (WAV bytes or raw PCM): one word per run of loud
+    frame_ms frames, named after its length in milliseconds, so a transcript does not
+    depend on where in the request the audio was."""
+    if content[:4] == b"RIFF":
+        with wave.open(io.BytesIO(content)) as wav:
+            content = wav.readframes(wav.getnframes())
+    samples = array("h", content[:len(content) - len(content) % 2])
+    frame = 16 * frame_ms
+    words = []
+    start = None
+    for i in range(0, len(samples) + frame, frame):
+        loud = max(map(abs, samples[i:i + frame]), default=0) > threshold
+        if loud and start is None:
+            start = i
+        elif not loud and start is not None:
+            end = min(i, len(samples))
+            words.append(SimpleNamespace(word=f"w{(end - start) // 16}", start_time=timedelta(milliseconds=start // 16),
+                                         end_time=timedelta(milliseconds=end // 16), confidence=0.9))
+            start = None
+    return words
+
+
+class FakeOperation:
+    """A long-running operation that completes latency_sec after it was started."""
+
+    def __init__(self, response, latency_sec):
+        self._response = response
+        self._ready_at = time.monotonic() + latency_sec
+
+    def done(self):
+        return time.monotonic() >= self._ready_at
+
+    def result(self, timeout=None):
+        remaining = self._ready_at - time.monotonic()
+        if timeout is not None and remaining > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("Operation did not complete within the timeout")
+        if remaining > 0:
+            time.sleep(remaining)
+        return self._response
+
+
+class FakeSpeechClient:
+    """Fake SpeechClient. Every request takes latency_sec; the transcript names the audio it got.
+
+    With error_rate > 0, that fraction of requests is rejected with a 429 (ResourceExhausted)
+    before doing any work, like a project running over its quota. With audio_words, inline
+    audio is "recognized" by words_from_audio(), so word timings follow the audio sent;
+    so is gs:// audio when storage (a FakeStorageClient) is given to read it from.
+    Inline audio over INLINE_LIMIT_SEC is rejected with InvalidArgument, as the real API does.
+    """
+
+    def __init__(self, latency_sec=2.0, error_rate=0.0, seed=0, audio_words=False, storage=None):
+        self.latency_sec = latency_sec
+        self.error_rate = error_rate
+        self.audio_words = audio_words
+        self.storage = storage
+        self.requests = 0
+        self.rejected = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _transcript(self, audio):
+        uri = getattr(audio, "uri", "")
+        if uri:
+            return f"transcript of {uri}"
+        return f"transcript of {len(getattr(audio, 'content', b''))} bytes"
+
+    def _count(self):
+        with self._lock:
+            self.requests += 1
+            if self._random.random() < self.error_rate:
+                self.rejected += 1
+                raise exceptions.ResourceExhausted("Quota exceeded for quota metric 'Requests'")
+
+    def _check_inline(self, audio):
+        content = getattr(audio, "content", b"")
+        if content and inline_seconds(content) > INLINE_LIMIT_SEC:
+            raise exceptions.InvalidArgument("Inline audio exceeds duration limit. Please use a GCS URI.")
+
+    def _read_uri(self, uri):
+        bucket_name, _, blob_name = uri[len("gs://"):].partition("/")
+        data = self.storage.bucket(bucket_name).data.get(blob_name)
+        if data is None:
+            raise exceptions.NotFound(f"No such object: {uri}")
+        return decode_pcm(data)
+
+    def _response(self, audio):
+        content = getattr(audio, "content", b"")
+        uri = getattr(audio, "uri", "")
+        if self.audio_words and uri and self.storage is not None:
+            content = self._read_uri(uri)
+        if self.audio_words and content:
+            words = words_from_audio(content)
+            response = fake_response(" ".join(word.word for word in words))
+            response.results[0].alternatives[0].words = words
+            return response
+        return fake_response(self._transcript(audio))
+
+    def recognize(self, config=None, audio=None, **kwargs):
+        self._count()
+        self._check_inline(audio)
+        time.sleep(self.latency_sec)
+        return self._response(audio)
+
+    def long_running_recognize(self, config=None, audio=None, **kwargs):
+        self._count()
+        self._check_inline(audio)
+        return FakeOperation(self._response(audio), self.latency_sec)
+
+    def streaming_recognize(self, config=None, requests=(), **kwargs):
+        """Reads the whole request stream, then yields a single final response."""
+        self._count()
+        num_bytes = sum(len(request.audio_content) for request in requests)
+        time.sleep(self.latency_sec)
+        response = fake_response(f"transcript of {num_bytes} streamed bytes")
+        for result in response.results:
+            result.is_final = True
+        yield response
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.generation = None
+        self.md5_hash = None
+        self.size = None
+
+    def _set_data(self, data):
+        self.bucket.client._transfer(len(data), upload=True)
+        with self.bucket.client._lock:
+            self.bucket.data[self.name] = data
+            self.bucket.generations[self.name] = self.bucket.generations.get(self.name, 0) + 1
+        self._refresh()
+
+    def _refresh(self):
+        data = self.bucket.data.get(self.name)
+        if data is not None:
+            self.generation = self.bucket.generations[self.name]
+            self.md5_hash = base64.b64encode(hashlib.md5(data).digest()).decode()
+            self.size = len(data)
+
+    def download_to_filename(self, filename):
+        data = self.bucket.data[self.name]
+        self.bucket.client._transfer(len(data), upload=False)
+        with open(filename, "wb") as f:
+            f.write(data)
+
+    def upload_from_filename(self, filename):
+        with open(filename, "rb") as f:
+            self._set_data(f.read())
+
+    def upload_from_file(self, file_obj, **kwargs):
+        self._set_data(file_obj.read())
+
+    def delete(self):
+        with self.bucket.client._lock:
+            del self.bucket.data[self.name]
+
+
+class FakeBucket:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.data = {}
+        self.generations = {}
+
+    def blob(self, name):
+        blob = FakeBlob(self, name)
+        blob._refresh()
+        return blob
+
+
+class FakeStorageClient:
+    """Fake storage.Client. Transfers take latency_sec plus size / bandwidth_bytes_per_sec."""
+
+    def __init__(self, latency_sec=0.05, bandwidth_bytes_per_sec=50 * 1024 * 1024):
+        self.latency_sec = latency_sec
+        self.bandwidth_bytes_per_sec = bandwidth_bytes_per_sec
+        self.bytes_uploaded = 0
+        self.bytes_downloaded = 0
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _transfer(self, num_bytes, upload):
+        with self._lock:
+            if upload:
+                self.bytes_uploaded += num_bytes
+            else:
+                self.bytes_downloaded += num_bytes
+        time.sleep(self.latency_sec + num_bytes / self.bandwidth_bytes_per_sec)
+
+    def bucket(self, name):
+        with self._lock:
+            if name not in self._buckets:
+                self._buckets[name] = FakeBucket(self, name)
+            return self._buckets[name]
+
+    def add_blob(self, bucket_name, blob_name, data):
+        """Seed a blob without simulated latency."""
+        bucket = self.bucket(bucket_name)
+        bucket.data[blob_name] = data
+        bucket.generations[blob_name] = bucket.generations.get(blob_name, 0) + 1
+
+    def list_blobs(self, bucket_or_name, prefix=None, **kwargs):
+        bucket = self.bucket(getattr(bucket_or_name, "name", bucket_or_name))
+        for name in sorted(bucket.data):
+            if prefix is None or name.startswith(prefix):
+                yield bucket.blob(name)
@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+# Columns of a manifest row, one row per exported chunk
+MANIFEST_COLUMNS = ["key", "source", "lang", "split", "start", "end", "duration",
+                    "num_samples", "text", "path", "shard", "offset"]
+DURATION_BUCKET_SEC = 1.0  # Width of a duration bucket in the prebuilt index
+
+logger = logging.getLogger(__name__)
+
+
+class ManifestWriter:
+    """Appends one JSON row per chunk to a JSONL manifest.
+
+    Every row is written with a single os.write on an O_APPEND descriptor, so threads
+    and worker processes can append to the same manifest without interleaving rows.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._fd = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def append(self, key, source, lang=None, split=None, start=0.0, end=0.0, num_samples=None,
+               text=None, path=None, shard=None, offset=None, duration=None):
+        """duration defaults to end - start; pass it when the chunk is shorter than its span of source (pauses removed)."""
+        row = {
+            "key": key,
+            "source": str(source),
+            "lang": lang,
+            "split": split,
+            "start": round(start, 3),
+            "end": round(end, 3),
+            "duration": round(end - start if duration is None else duration, 3),
+            "num_samples": num_samples,
+            "text": text,
+            "path": str(path) if path is not None else None,
+            "shard": shard,
+            "offset": offset,
+        }
+        line = (json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            # Reopen after a fork so children never share the parent's descriptor state
+            if self._fd is None or self._pid != os.getpid():
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                self._pid = os.getpid()
+            os.write(self._fd, line)
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None and self._pid == os.getpid():
+                os.close(self._fd)
+            self._fd = None
+
+
+def read_manifest(path):
+    """Reads a JSONL manifest. When a key appears more than once (a re-chunked file), the last row wins."""
+    rows = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                # Torn last line from a crash
+                continue
+            rows[row["key"]] = row
+    return list(rows.values())
+
+
+def build_duration_index(manifest_path, bucket_sec: float = DURATION_BUCKET_SEC):
+    """Builds a duration-bucketed index next to the manifest for length-bucketed batching.
+
+    Writes <manifest>.index.jsonl with all rows sorted by (bucket, duration), and
+    <manifest>.buckets.json mapping each bucket to its [first_row, end_row) range, so a
+    dataloader can draw batches of similar length without opening or stat-ing any audio.
+    If pandas and pyarrow are installed, the sorted rows are also written as
+    <manifest>.index.parquet. Returns the path of the JSONL index (None without a manifest).
+    """
+    manifest_path = Path(manifest_path)
+    if not manifest_path.exists():
+        logger.warning(f"No manifest at {manifest_path}, nothing to index.")
+        return None
+    rows = read_manifest(manifest_path)
+    for row in rows:
+        row["bucket"] = int(row["duration"] // bucket_sec)
+    rows.sort(key=lambda row: (row["bucket"], row["duration"], row["key"]))
+
+    buckets = {}
+    for i, row in enumerate(rows):
+        first, _ = buckets.get(row["bucket"], (i, i))
+        buckets[row["bucket"]] = (first, i + 1)
+
+    index_path = manifest_path.with_name(manifest_path.name + ".index.jsonl")
+    with open(index_path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    with open(manifest_path.with_name(manifest_path.name + ".buckets.json"), "w", encoding="utf-8") as f:
+        json.dump({"bucket_sec": bucket_sec, "num_rows": len(rows),
+                   "buckets": {str(b): list(span) for b, span in sorted(buckets.items())}}, f)
+
+    try:
+        import pandas as pd
+        pd.DataFrame(rows, columns=MANIFEST_COLUMNS + ["bucket"]).to_parquet(
+            manifest_path.with_name(manifest_path.name + ".index.parquet"), index=False)
+    except ImportError:
+        pass
+
+    logger.info(f"Indexed {len(rows)} chunks into {len(buckets)} duration buckets: {index_path}")
+    return index_path
+
+
+def load_duration_index(manifest_path):
+    """Loads the prebuilt index: returns (rows sorted by duration bucket, {bucket: (first_row, end_row)})."""
+    manifest_path = Path(manifest_path)
+    with open(manifest_path.with_name(manifest_path.name + ".buckets.json"), "r", encoding="utf-8") as f:
+        buckets = {int(b): tuple(span) for b, span in json.load(f)["buckets"].items()}
+    with open(manifest_path.with_name(manifest_path.name + ".index.jsonl"), "r", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return rows, buckets
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Build the duration-bucketed index of a chunk manifest.")
+    parser.add_argument("manifest", help="Path of the JSONL manifest written by the chunkers")
+    parser.add_argument("--bucket-sec", type=float, default=DURATION_BUCKET_SEC)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    build_duration_index(args.manifest, args.bucket_sec)
@@ -0,0 +1,131 @@
+import random
+import threading
+import time
+
+from google.api_core import exceptions
+
+# Per-minute quotas of the project; set these to what the Cloud console shows for Speech-to-Text
+REQUESTS_PER_MINUTE = 900
+AUDIO_SECONDS_PER_MINUTE = 1200  # 480 hours of audio per day
+MAX_RETRIES = 6
+BACKOFF_BASE_SEC = 1.0
+BACKOFF_MAX_SEC = 64.0
+
+# 429 and transient server errors; everything else is raised to the caller right away
+RETRYABLE_ERRORS = (
+    exceptions.ResourceExhausted,
+    exceptions.TooManyRequests,
+    exceptions.ServiceUnavailable,
+    exceptions.InternalServerError,
+    exceptions.DeadlineExceeded,
+)
+
+
+class TokenBucket:
+    """Thread-safe token bucket holding up to per_minute tokens, refilled at per_minute / 60 per second."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount=1.0):
+        """Block until amount tokens are available and take them. Returns the seconds spent waiting."""
+        # A single request larger than the whole bucket would otherwise wait forever
+        amount = min(float(amount), self.capacity)
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class RateLimitedSpeechClient:
+    """Wraps a SpeechClient so every caller shares one request and one audio-second quota.
+
+    recognize, long_running_recognize and streaming_recognize wait for both token buckets
+    before calling the API, and retry quota (429) and transient server errors with full-jitter exponential
+    backoff. Once max_retries is exhausted the last error is raised, so files are never
+    dropped silently. metrics() reports throttled time, retries and success rate.
+    """
+
+    def __init__(self, client, requests_per_minute=REQUESTS_PER_MINUTE,
+                 audio_seconds_per_minute=AUDIO_SECONDS_PER_MINUTE, max_retries=MAX_RETRIES,
+                 backoff_base_sec=BACKOFF_BASE_SEC, backoff_max_sec=BACKOFF_MAX_SEC):
+        self.client = client
+        self.requests = TokenBucket(requests_per_minute)
+        self.audio_seconds = TokenBucket(audio_seconds_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base_sec = backoff_base_sec
+        self.backoff_max_sec = backoff_max_sec
+        self.lock = threading.Lock()
+        self.counters = {"calls": 0, "succeeded": 0, "failed": 0, "retries": 0,
+                         "throttled_sec": 0.0, "backoff_sec": 0.0}
+
+    def _count(self, **amounts):
+        with self.lock:
+            for name, amount in amounts.items():
+                self.counters[name] += amount
+
+    def _call(self, request, audio_sec):
+        self._count(calls=1)
+        attempt = 0
+        while True:
+            throttled = self.requests.acquire() + self.audio_seconds.acquire(audio_sec)
+            self._count(throttled_sec=throttled)
+            try:
+                result = request()
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    self._count(failed=1)
+                    raise
+                attempt += 1
+                delay = random.uniform(0, min(self.backoff_max_sec, self.backoff_base_sec * 2 ** attempt))
+                print(f"Speech API {type(e).__name__}, retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                self._count(retries=1, backoff_sec=delay)
+                time.sleep(delay)
+                continue
+            except Exception:
+                self._count(failed=1)
+                raise
+            self._count(succeeded=1)
+            return result
+
+    def recognize(self, config=None, audio=None, audio_sec=0.0, **kwargs):
+        return self._call(lambda: self.client.recognize(config=config, audio=audio, **kwargs), audio_sec)
+
+    def long_running_recognize(self, config=None, audio=None, audio_sec=0.0, **kwargs):
+        return self._call(lambda: self.client.long_running_recognize(config=config, audio=audio, **kwargs),
+                          audio_sec)
+
+    def streaming_recognize(self, config, requests, audio_sec=0.0, **kwargs):
+        """Run one streaming session and return all its responses as a list.
+
+        requests is a zero-argument callable returning a fresh iterator of
+        StreamingRecognizeRequests, so a session that fails can be replayed from the start.
+        Errors surface while responses are read, which is why they are read here.
+        """
+        return self._call(lambda: list(self.client.streaming_recognize(config=config, requests=requests(), **kwargs)),
+                          audio_sec)
+
+    def metrics(self):
+        with self.lock:
+            metrics = dict(self.counters)
+        finished = metrics["succeeded"] + metrics["failed"]
+        metrics["success_rate"] = metrics["succeeded"] / finished if finished else 1.0
+        return metrics
+
+    def print_metrics(self):
+        m = self.metrics()
+        print(f"Speech API: {m['calls']} calls, {m['succeeded']} succeeded, {m['failed']} failed "
+              f"(success rate {m['success_rate']:.1%}), {m['retries']} retries, "
+              f"{m['throttled_sec']:.1f}s throttled, {m['backoff_sec']:.1f}s backing off")
@@ -1,4 +1,7 @@
 import os
+import shutil
+
+from word_timings import sidecar_path
 
 # Function to split the transcript into chunks of N words
 def split_transcript(input_file, output_file, words_per_line=20):
@@ -33,9 +36,15 @@ def process_all_transcripts(transcript_dir, output_dir, words_per_line=20):
             # Split the transcript and save the results
             split_transcript(input_file, output_file, words_per_line)
 
+            # Carry the word timings along so the chunkers can skip aeneas
+            words_file = sidecar_path(input_file)
+            if os.path.exists(words_file):
+                shutil.copy(words_file, sidecar_path(output_file))
+
 # ---- Set your directory paths here ----
 TRANSCRIPT_DIR = "/home/vikrant/chunks_by_transcript/test_transcript"
 OUTPUT_DIR = "/home/vikrant/chunks_by_transcript/split_transcripts"
 
 # Process all the transcripts
-process_all_transcripts(TRANSCRIPT_DIR, OUTPUT_DIR)
+if __name__ == "__main__":
+    process_all_transcripts(TRANSCRIPT_DIR, OUTPUT_DIR)
@@ -0,0 +1,66 @@
+"""Fixtures that run the transcription pipelines against the fake GCP clients in fake_gcp."""
+import pytest
+
+import audio_transcript_in_bucket as bucket_stt
+import transcript
+from benchmark_bucket_transcription import synthetic_mp3
+from benchmark_transcript_folder import make_word_input
+from fake_gcp import FakeSpeechClient, FakeStorageClient
+from speech_quota import TokenBucket
+
+
+@pytest.fixture(scope="session")
+def mp3_bytes():
+    """A 2 s MP3 of pink noise."""
+    return synthetic_mp3(2)
+
+
+@pytest.fixture
+def seeded_storage(mp3_bytes):
+    """seeded_storage(names) -> a FakeStorageClient holding mp3_bytes at each name under BASE_GCS_PATH."""
+    def seed(names):
+        storage = FakeStorageClient(latency_sec=0.0)
+        for name in names:
+            storage.add_blob(bucket_stt.BUCKET_NAME, f"{bucket_stt.BASE_GCS_PATH}/{name}", mp3_bytes)
+        return storage
+    return seed
+
+
+@pytest.fixture
+def transcribe_bucket(tmp_path, monkeypatch):
+    """transcribe_bucket(storage, output_dir, state_db, cache_path=None) -> (stats, speech client).
+    Runs process_bucket over storage with a fresh fake Speech client."""
+    monkeypatch.setattr(bucket_stt, "LOCAL_TMP", str(tmp_path / "tmp"))
+    monkeypatch.setattr(bucket_stt, "OUTPUT_DIR", bucket_stt.OUTPUT_DIR)
+
+    def transcribe(storage, output_dir, state_db, cache_path=None):
+        bucket_stt.OUTPUT_DIR = str(output_dir)
+        fake = FakeSpeechClient(latency_sec=0.0)
+        bucket_stt.init_clients(fake, storage, cache_path=cache_path)
+        stats = bucket_stt.process_bucket(max_in_flight=4, poll_interval=0.01, state_db=str(state_db))
+        return stats, fake
+    return transcribe
+
+
+@pytest.fixture(scope="session")
+def word_input(tmp_path_factory):
+    """Six 20 s WAVs of tone bursts in four folders; the fake client recognizes each burst as a word."""
+    input_dir = tmp_path_factory.mktemp("wavs")
+    make_word_input(str(input_dir), 6, 20)
+    return input_dir
+
+
+@pytest.fixture
+def transcribe_folder():
+    """transcribe_folder(input_dir, output_dir, max_in_flight=4, bundle_size=0, cache_path=None)
+    -> (stats, speech client, storage client). Runs process_folder with fresh fake clients."""
+    def transcribe(input_dir, output_dir, max_in_flight=4, bundle_size=0, cache_path=None):
+        storage = FakeStorageClient(latency_sec=0.0)
+        fake = FakeSpeechClient(latency_sec=0.0, audio_words=True, storage=storage)
+        transcript.init_client(fake, cache_path, storage_client_override=storage)
+        # Quotas are not what is being tested
+        transcript.client.requests = TokenBucket(1e9)
+        transcript.client.audio_seconds = TokenBucket(1e9)
+        stats = transcript.process_folder(str(input_dir), str(output_dir), max_in_flight, bundle_size)
+        return stats, fake, storage
+    return transcribe
@@ -0,0 +1,8 @@
+import numpy as np
+
+from aeneas_pool import ENERGY_FRAME_SEC, SAMPLE_RATE, frame_energy
+
+
+def test_frame_energy_is_not_lowered_at_the_edges():
+    samples = np.full(int(SAMPLE_RATE * ENERGY_FRAME_SEC) * 20, 1000, dtype=np.int16)
+    np.testing.assert_allclose(frame_energy(samples), 1000.0, rtol=1e-5)
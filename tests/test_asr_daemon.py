@@ -0,0 +1,31 @@
+import numpy as np
+
+from asr_daemon import mapped_samples, sample_spec
+from decoded_audio import SAMPLE_RATE, DecodedAudio
+
+
+def test_daemon_maps_the_file_a_client_decoded_into(mp3_bytes, tmp_path):
+    source = tmp_path / "talk.mp3"
+    source.write_bytes(mp3_bytes)
+    audio = DecodedAudio.from_file(source, shared_dir=tmp_path)
+
+    samples = mapped_samples(sample_spec(audio))
+    assert samples.dtype == np.float32
+    assert np.array_equal(samples, audio.samples)
+    audio.release_file()
+    assert sample_spec(audio) is None
+
+
+def test_daemon_maps_wav_samples_in_place_as_float32(tmp_path):
+    pcm = (np.sin(np.arange(SAMPLE_RATE) / 20) * 0.5).astype(np.float32)
+    wav_path = tmp_path / "clean.wav"
+    DecodedAudio(pcm).export_wav(wav_path, 0, 1)
+    audio = DecodedAudio.from_wav(wav_path)
+
+    samples = mapped_samples(sample_spec(audio))
+    assert samples.dtype == np.float32
+    assert np.allclose(samples, pcm, atol=1e-4)
+
+
+def test_audio_in_memory_is_sent_by_path():
+    assert sample_spec(DecodedAudio(np.zeros(SAMPLE_RATE, dtype=np.float32))) is None
@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+import audio_transcript_in_bucket as bucket_stt
+from bucket_state import BlobStateStore
+
+
+def test_finished_blobs_are_skipped_and_overwritten_ones_redone(tmp_path, mp3_bytes, seeded_storage,
+                                                                transcribe_bucket):
+    storage = seeded_storage(["a/talk.mp3", "b/talk.mp3", "c.mp3"])
+    output_dir, state_db = tmp_path / "out", tmp_path / "state.sqlite3"
+
+    stats, fake = transcribe_bucket(storage, output_dir, state_db)
+    assert (stats["files"], fake.requests) == (3, 3)
+    assert sorted(p.relative_to(output_dir).as_posix() for p in output_dir.rglob("*.txt")) == [
+        "a/talk.txt", "b/talk.txt", "c.txt"]
+
+    stats, fake = transcribe_bucket(storage, output_dir, state_db)
+    assert (stats["files"], fake.requests) == (0, 0)
+
+    # An overwritten blob has a new generation, so it is transcribed again
+    storage.add_blob(bucket_stt.BUCKET_NAME, f"{bucket_stt.BASE_GCS_PATH}/c.mp3", mp3_bytes)
+    stats, fake = transcribe_bucket(storage, output_dir, state_db)
+    assert (stats["files"], fake.requests) == (1, 1)
+    assert BlobStateStore(state_db).counts() == {"done": 3}
+
+
+def test_failed_blobs_are_retried_up_to_max_attempts(tmp_path):
+    store = BlobStateStore(tmp_path / "state.sqlite3")
+    blob = SimpleNamespace(name="full_audio/a.mp3", generation=1, md5_hash="x")
+    for _ in range(2):
+        store.mark_running(blob)
+        store.mark_failed(blob, "boom")
+        assert store.needs_processing(blob, store.lookup([blob.name])[blob.name], max_attempts=3)
+    store.mark_running(blob)
+    store.mark_failed(blob, "boom")
+    row = store.lookup([blob.name])[blob.name]
+    assert row[2:] == ("failed", 3)
+    assert not store.needs_processing(blob, row, max_attempts=3)
+
+    # A new generation starts counting again
+    blob.generation = 2
+    assert store.needs_processing(blob, row, max_attempts=3)
+    store.mark_running(blob)
+    assert store.lookup([blob.name])[blob.name][2:] == ("running", 1)
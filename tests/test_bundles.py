@@ -0,0 +1,40 @@
+import pytest
+from google.api_core import exceptions
+from google.cloud import speech
+
+import transcript
+from benchmark_transcript_folder import read_outputs
+from fake_gcp import FakeSpeechClient
+
+
+def test_inline_audio_over_the_limit_is_rejected():
+    fake = FakeSpeechClient(latency_sec=0.0)
+    audio = speech.RecognitionAudio(content=bytes(32000 * 61))
+    with pytest.raises(exceptions.InvalidArgument):
+        fake.recognize(config=transcript.recognition_config(), audio=audio)
+
+
+def test_bundles_give_the_same_transcripts_as_single_requests(word_input, tmp_path, transcribe_folder):
+    single_stats, single_fake, _ = transcribe_folder(word_input, tmp_path / "single")
+    # Three 20 s files and their gaps are over the inline limit, so this only passes through GCS
+    bundled_stats, bundled_fake, storage = transcribe_folder(word_input, tmp_path / "bundled", bundle_size=3)
+
+    single, bundled = read_outputs(tmp_path / "single"), read_outputs(tmp_path / "bundled")
+    assert len(single) == 12  # A transcript and a word timing sidecar per file
+    assert bundled == single
+    assert (single_stats["files"], single_stats["failed"]) == (6, 0)
+    assert (bundled_stats["files"], bundled_stats["failed"]) == (6, 0)
+    assert (single_fake.requests, bundled_fake.requests) == (6, 2)
+    # Every bundle was uploaded and deleted again
+    assert storage.bytes_uploaded > 0
+    assert not storage.bucket(transcript.BUNDLE_BUCKET).data
+
+
+def test_failed_bundle_upload_counts_every_file(word_input, tmp_path, monkeypatch, transcribe_folder):
+    def fail(*args, **kwargs):
+        raise RuntimeError("upload failed")
+
+    monkeypatch.setattr(transcript, "encode_and_upload", fail)
+    stats, fake, _ = transcribe_folder(word_input, tmp_path / "out", bundle_size=4)
+    assert (stats["files"], stats["failed"]) == (0, 6)
+    assert fake.requests == 0
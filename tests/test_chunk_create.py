@@ -0,0 +1,15 @@
+import numpy as np
+
+from chunk_create import ENERGY_FRAME_MS, SAMPLE_RATE, find_quiet_cut
+
+
+def test_quiet_cut_finds_a_pause_away_from_the_window_edges():
+    frame = SAMPLE_RATE * ENERGY_FRAME_MS // 1000
+    rng = np.random.default_rng(0)
+    samples = (rng.standard_normal(frame * 100) * 8000).astype(np.int16)
+    # A soft pause at 0.64 of the energy: an unnormalised moving sum sees 3/5 of it at both edges
+    pause = slice(frame * 60, frame * 66)
+    samples[pause] = (samples[pause] * 0.8).astype(np.int16)
+
+    cut = find_quiet_cut(samples.tobytes(), 0, len(samples))
+    assert pause.start <= cut < pause.stop
@@ -0,0 +1,24 @@
+from chunk_shards import ShardReader, ShardWriter
+
+
+def test_rerun_replaces_samples_whichever_shard_sorts_first(tmp_path):
+    with ShardWriter(tmp_path, "zz-run1") as writer:
+        writer.write("talk_0001", b"old", {"run": 1}, text="old text")
+    with ShardWriter(tmp_path, "aa-run2") as writer:
+        writer.write("talk_0001", b"new", {"run": 2})
+
+    with ShardReader(tmp_path) as reader:
+        # The whole sample is replaced, including members the new copy does not have
+        assert reader.sample("talk_0001") == {"wav": b"new", "json": {"run": 2, "key": "talk_0001"}}
+
+
+def test_torn_index_line_from_a_crash_is_skipped(tmp_path):
+    with ShardWriter(tmp_path, "run") as writer:
+        writer.write("talk_0001", b"audio", text="words")
+    idx_path = next(tmp_path.glob("*.tar.idx"))
+    with open(idx_path, "a", encoding="utf-8") as f:
+        f.write('{"key": "talk_0002", "ext": "wav", "sha')
+
+    with ShardReader(tmp_path) as reader:
+        assert list(reader.keys()) == ["talk_0001"]
+        assert reader.sample("talk_0001")["txt"] == "words"
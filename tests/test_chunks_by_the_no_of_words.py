@@ -0,0 +1,23 @@
+import wave
+
+import numpy as np
+
+from chunks_by_the_no_of_words import remove_cleaned, silence_remover
+from decoded_audio import SAMPLE_RATE, DecodedAudio
+
+
+def test_silence_is_removed_on_prepare_and_the_cleaned_file_deleted_after(tmp_path):
+    tone = (np.sin(np.arange(SAMPLE_RATE) / 5) * 0.5).astype(np.float32)
+    samples = np.concatenate([tone, np.zeros(SAMPLE_RATE, dtype=np.float32), tone])
+    raw_path = tmp_path / "talk.wav"
+    DecodedAudio(samples).export_wav(raw_path, 0, len(samples) / SAMPLE_RATE)
+    cleaned_path = str(tmp_path / "talk_clean.wav")
+
+    offsets = []
+    assert silence_remover(cleaned_path, offsets)(str(raw_path)) == cleaned_path
+    with wave.open(cleaned_path) as wav:
+        assert wav.getnframes() < len(samples) - SAMPLE_RATE // 2
+    assert [round(original_start) for _, original_start, _ in offsets] == [0, 2]
+
+    assert remove_cleaned(cleaned_path)
+    assert [p.name for p in tmp_path.iterdir()] == ["talk.wav"]
@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+
+import pytest
+
+import cli
+
+
+@pytest.fixture
+def chunk_create(monkeypatch):
+    """A stand-in for chunk_create that records the arguments process_all gets."""
+    module = SimpleNamespace(INPUT_ROOT="in", OUTPUT_ROOT="out", CHUNK_LENGTH_SEC=10, TRAIN_RATIO=0.9,
+                             MIN_CHUNK_SEC=6, MAX_CHUNK_SEC=14, calls=[])
+    module.process_all = lambda *args: module.calls.append(args)
+    monkeypatch.setattr(cli, "load", lambda command, method: module)
+    return module
+
+
+def test_explicit_zero_train_ratio_is_kept(chunk_create):
+    cli.main(["chunk", "--train-ratio", "0", "--chunk-sec", "2.5"])
+    (args,) = chunk_create.calls
+    assert args[2:4] == (2.5, 0.0)
+    assert args[-2:] == (6, 14)
+
+
+def test_unset_options_keep_the_script_values(chunk_create):
+    cli.main(["chunk", "--method", "energy", "--max-chunk-sec", "12"])
+    (args,) = chunk_create.calls
+    assert args[2:4] == (10, 0.9)
+    assert args[-2:] == (6, 12.0)
+
+
+@pytest.mark.parametrize("argv", [["chunk", "--chunk-sec", "0"], ["chunk", "--train-ratio", "1.5"],
+                                  ["align", "--method", "transcript", "--words-per-chunk", "20"]])
+def test_invalid_options_are_rejected(argv):
+    with pytest.raises(SystemExit):
+        cli.parse_args(argv)
@@ -0,0 +1,40 @@
+import io
+import wave
+
+import pytest
+
+import transcript
+from benchmark_transcript_folder import make_synthetic_input
+
+
+@pytest.fixture(scope="module")
+def wavs(tmp_path_factory):
+    root = tmp_path_factory.mktemp("convert")
+    make_synthetic_input(str(root / "conforming"), 1, 2, conforming=True)
+    make_synthetic_input(str(root / "stereo"), 1, 2)
+    return root
+
+
+def test_conforming_wav_is_passed_through(wavs):
+    path = str(wavs / "conforming" / "speaker_0" / "chunk_0000.wav")
+    assert transcript.probe_wav(path)
+    assert transcript.convert_audio(path) == path
+
+
+def test_other_wavs_are_converted_in_memory(wavs, tmp_path, monkeypatch):
+    path = str(wavs / "stereo" / "speaker_0" / "chunk_0000.wav")
+    assert not transcript.probe_wav(path)
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+
+    audio = transcript.convert_audio(path)
+    assert isinstance(audio, bytes)
+    with wave.open(io.BytesIO(audio)) as wav:
+        assert (wav.getnchannels(), wav.getsampwidth(), wav.getframerate()) == (1, 2, 16000)
+    assert transcript.audio_seconds(audio) == pytest.approx(2.0, abs=0.01)
+    assert not list(tmp_path.iterdir())
+
+
+def test_probe_rejects_what_is_not_a_wav(tmp_path):
+    path = tmp_path / "a.wav"
+    path.write_bytes(b"ID3" + bytes(100))
+    assert not transcript.probe_wav(str(path))
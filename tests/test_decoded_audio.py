@@ -0,0 +1,53 @@
+import sys
+import threading
+
+import numpy as np
+import pytest
+from pydub import AudioSegment
+
+from decoded_audio import SAMPLE_RATE, DecodedAudio
+
+
+@pytest.fixture
+def noisy_decoder(tmp_path, monkeypatch):
+    """A stand-in for ffmpeg that writes far more than a pipe buffer of warnings before its samples."""
+    script = tmp_path / "noisy_ffmpeg.py"
+    script.write_text("import sys\n"
+                      "sys.stderr.write('[mp3float] overread, skip -5 enddists: -2 -2\\n' * 20000)\n"
+                      "sys.stderr.flush()\n"
+                      f"sys.stdout.buffer.write(bytes({SAMPLE_RATE * 4}))\n")
+    decoder = tmp_path / "ffmpeg"
+    decoder.write_text(f"#!/bin/sh\nexec {sys.executable} {script} \"$@\"\n")
+    decoder.chmod(0o755)
+    monkeypatch.setattr(AudioSegment, "converter", str(decoder))
+
+
+def test_warnings_on_stderr_do_not_block_the_decode(noisy_decoder, tmp_path):
+    decoded = []
+    thread = threading.Thread(target=lambda: decoded.append(DecodedAudio.from_file(tmp_path / "damaged.mp3")),
+                              daemon=True)
+    thread.start()
+    thread.join(30)
+    assert not thread.is_alive(), "the decode blocked on a full stderr pipe"
+    assert decoded[0].duration_sec == 1.0
+    assert not np.any(decoded[0].samples)
+
+
+def test_shared_decode_maps_a_named_file_until_released(mp3_bytes, tmp_path):
+    source = tmp_path / "talk.mp3"
+    source.write_bytes(mp3_bytes)
+    shared_dir = tmp_path / "shm"
+    shared_dir.mkdir()
+
+    audio = DecodedAudio.from_file(source, shared_dir=shared_dir)
+    samples_path, offset = audio.mapped_file
+    assert [p.name for p in shared_dir.iterdir()] == [samples_path.rsplit("/", 1)[-1]]
+    assert offset == 0
+    assert np.array_equal(np.fromfile(samples_path, dtype=np.float32), audio.samples)
+    assert np.array_equal(audio.samples, DecodedAudio.from_file(source).samples)
+
+    expected = np.array(audio.samples)
+    audio.release_file()
+    assert not list(shared_dir.iterdir())
+    assert audio.mapped_file is None
+    assert np.array_equal(audio.samples, expected)
@@ -0,0 +1,24 @@
+import logging
+
+from manifest import ManifestWriter, build_duration_index, load_duration_index
+
+
+def test_duration_index_groups_rows_by_bucket_and_logs(tmp_path, caplog):
+    manifest_path = tmp_path / "manifest.jsonl"
+    writer = ManifestWriter(manifest_path)
+    for key, end in [("c", 2.5), ("a", 0.5), ("b", 2.2)]:
+        writer.append(key, "talk.wav", start=0.0, end=end)
+    writer.close()
+
+    with caplog.at_level(logging.INFO, logger="manifest"):
+        build_duration_index(manifest_path)
+    assert "Indexed 3 chunks into 2 duration buckets" in caplog.text
+
+    rows, buckets = load_duration_index(manifest_path)
+    assert [row["key"] for row in rows] == ["a", "b", "c"]
+    assert buckets == {0: (0, 1), 2: (1, 3)}
+
+
+def test_missing_manifest_is_a_warning(tmp_path, caplog):
+    assert build_duration_index(tmp_path / "missing.jsonl") is None
+    assert [record.levelname for record in caplog.records] == ["WARNING"]
@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+
+import pytest
+from google.api_core import exceptions
+from google.cloud import speech
+
+from fake_gcp import FakeSpeechClient
+from speech_quota import RateLimitedSpeechClient, TokenBucket
+
+
+def flaky_client(draws):
+    """A FakeSpeechClient that rejects a request with a 429 for every draw below its error rate of 0.5."""
+    fake = FakeSpeechClient(latency_sec=0.0, error_rate=0.5)
+    fake._random = SimpleNamespace(random=iter(draws).__next__)
+    return fake
+
+
+def limited(fake, max_retries=3):
+    return RateLimitedSpeechClient(fake, max_retries=max_retries, backoff_base_sec=0.001, backoff_max_sec=0.01)
+
+
+def test_429s_are_retried_with_backoff():
+    fake = flaky_client([0.0, 0.0, 0.9, 0.9, 0.0, 0.9])
+    client = limited(fake)
+    for _ in range(3):
+        response = client.recognize(config=speech.RecognitionConfig(), audio=speech.RecognitionAudio(content=b"\0\0"))
+        assert response.results
+    assert (fake.requests, fake.rejected) == (6, 3)
+
+    metrics = client.metrics()
+    assert {name: metrics[name] for name in ("calls", "succeeded", "failed", "retries")} == {
+        "calls": 3, "succeeded": 3, "failed": 0, "retries": 3}
+    assert metrics["success_rate"] == 1.0
+    assert metrics["backoff_sec"] > 0
+
+
+def test_last_error_is_raised_once_retries_run_out():
+    fake = flaky_client([0.0] * 3)
+    client = limited(fake, max_retries=2)
+    with pytest.raises(exceptions.ResourceExhausted):
+        client.long_running_recognize(config=speech.RecognitionConfig(), audio=speech.RecognitionAudio(uri="gs://b/a"))
+    assert fake.requests == 3
+
+    metrics = client.metrics()
+    assert (metrics["calls"], metrics["succeeded"], metrics["failed"], metrics["retries"]) == (1, 0, 1, 2)
+    assert metrics["success_rate"] == 0.0
+
+
+def test_other_errors_are_not_retried():
+    fake = FakeSpeechClient(latency_sec=0.0)
+    client = limited(fake)
+    with pytest.raises(exceptions.InvalidArgument):
+        # Inline audio over the limit
+        client.recognize(config=speech.RecognitionConfig(), audio=speech.RecognitionAudio(content=bytes(32000 * 61)))
+    assert fake.requests == 1
+    assert (client.metrics()["failed"], client.metrics()["retries"]) == (1, 0)
+
+
+def test_streaming_recognize_replays_its_requests():
+    fake = flaky_client([0.0, 0.9])
+    client = limited(fake)
+    streams = []
+
+    def requests():
+        streams.append(1)
+        return iter([speech.StreamingRecognizeRequest(audio_content=b"\0" * 3200)])
+
+    responses = client.streaming_recognize(speech.StreamingRecognitionConfig(), requests)
+    assert len(streams) == 2
+    assert [result.alternatives[0].transcript for response in responses for result in response.results] == [
+        "transcript of 3200 streamed bytes"]
+    assert client.metrics()["retries"] == 1
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(600)  # 10 tokens per second
+    assert bucket.acquire(600) == 0.0
+    assert bucket.acquire(1) == pytest.approx(0.1, abs=0.05)
+
+
+def test_throttled_time_is_counted():
+    client = RateLimitedSpeechClient(FakeSpeechClient(latency_sec=0.0), requests_per_minute=600)
+    client.requests.tokens = 0.0
+    client.recognize(config=speech.RecognitionConfig(), audio=speech.RecognitionAudio(content=b"\0\0"))
+    assert client.metrics()["throttled_sec"] == pytest.approx(0.1, abs=0.05)
@@ -0,0 +1,71 @@
+import subprocess
+import wave
+
+from pydub import AudioSegment
+
+import audio_transcript_in_bucket as bucket_stt
+import transcript
+from benchmark_transcript_folder import read_outputs
+from transcript_cache import TranscriptCache, decode_command, pcm_digest
+
+
+def folder_digest(path):
+    """The digest transcript.py keys the cache on for a file."""
+    with transcript.open_pcm(transcript.convert_audio(str(path))) as pcm:
+        return pcm_digest(pcm)
+
+
+def test_folder_cache_hits_make_no_requests(word_input, tmp_path, transcribe_folder):
+    cache_path = str(tmp_path / "cache.sqlite3")
+    _, first_fake, _ = transcribe_folder(word_input, tmp_path / "first", cache_path=cache_path)
+    stats, second_fake, _ = transcribe_folder(word_input, tmp_path / "second", cache_path=cache_path)
+
+    assert first_fake.requests == 6
+    assert second_fake.requests == 0
+    assert stats["files"] == 6
+    assert read_outputs(tmp_path / "second") == read_outputs(tmp_path / "first")
+
+
+def test_bucket_cache_hits_make_no_requests(tmp_path, seeded_storage, transcribe_bucket):
+    storage = seeded_storage(["a.mp3", "b.mp3"])
+    cache_path = str(tmp_path / "cache.sqlite3")
+
+    _, fake = transcribe_bucket(storage, tmp_path / "first", tmp_path / "first.sqlite3", cache_path)
+    assert fake.requests == 2
+    # A new state store and output folder, so only the cache can save the requests
+    stats, fake = transcribe_bucket(storage, tmp_path / "second", tmp_path / "second.sqlite3", cache_path)
+    assert (stats["files"], fake.requests) == (2, 0)
+
+
+def test_both_scripts_hash_the_same_pcm(tmp_path, mp3_bytes):
+    mp3_path = tmp_path / "talk.mp3"
+    mp3_path.write_bytes(mp3_bytes)
+    # What chunk_create.py writes: the recording as a 16kHz mono WAV, which transcript.py passes through
+    conforming = tmp_path / "conforming.wav"
+    with wave.open(str(conforming), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(subprocess.run(decode_command(mp3_path), stdout=subprocess.PIPE, check=True).stdout)
+    # And a 44.1kHz stereo WAV, which transcript.py converts
+    stereo = tmp_path / "stereo.wav"
+    subprocess.run([AudioSegment.converter, "-nostdin", "-v", "error", "-i", str(mp3_path), "-ac", "2",
+                    "-ar", "44100", str(stereo)], check=True)
+
+    assert transcript.probe_wav(str(conforming)) and not transcript.probe_wav(str(stereo))
+    assert folder_digest(conforming) == bucket_stt.decoded_pcm_digest(str(conforming))[0]
+    assert folder_digest(conforming) == bucket_stt.decoded_pcm_digest(str(mp3_path))[0]
+    assert folder_digest(stereo) == bucket_stt.decoded_pcm_digest(str(stereo))[0]
+
+
+def test_eviction_counts_what_other_processes_wrote(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    first, second = TranscriptCache(path, max_bytes=100), TranscriptCache(path, max_bytes=100)
+    for i in range(4):
+        first.put(f"first {i}", "x" * 20)
+    for i in range(4):
+        second.put(f"second {i}", "x" * 20)
+
+    assert second.total_bytes() == first.total_bytes() <= 100
+    assert second.get("second 3") is not None
+    assert first.get("first 0") is None
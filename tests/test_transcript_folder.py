@@ -0,0 +1,26 @@
+import shutil
+
+from benchmark_transcript_folder import read_outputs
+
+
+def test_concurrent_run_writes_the_same_tree_as_a_serial_one(word_input, tmp_path, transcribe_folder):
+    serial_stats, _, _ = transcribe_folder(word_input, tmp_path / "serial", max_in_flight=1)
+    stats, fake, _ = transcribe_folder(word_input, tmp_path / "concurrent", max_in_flight=4)
+
+    outputs = read_outputs(tmp_path / "concurrent")
+    assert outputs == read_outputs(tmp_path / "serial")
+    assert sorted(path for path in outputs if path.endswith(".txt")) == sorted(
+        f"speaker_{i % 4}/chunk_{i:04}.txt" for i in range(6))
+    assert not [path for path in outputs if path.endswith(".tmp")]
+    assert (stats["files"], stats["failed"], fake.requests) == (6, 0, 6)
+    assert stats["audio_sec_per_sec"] > 0
+
+
+def test_a_failed_file_is_counted_and_the_rest_are_written(word_input, tmp_path, transcribe_folder):
+    input_dir = tmp_path / "in"
+    shutil.copytree(word_input, input_dir)
+    (input_dir / "speaker_0" / "broken.wav").write_bytes(b"not audio")
+
+    stats, _, _ = transcribe_folder(input_dir, tmp_path / "out")
+    assert (stats["files"], stats["failed"]) == (6, 1)
+    assert not (tmp_path / "out" / "speaker_0" / "broken.txt").exists()
@@ -1,68 +1,490 @@
 import os
 import io
+import mmap
 import shutil
 import pathlib
-from google.cloud import speech
-from pydub import AudioSegment
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+import wave
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+import numpy as np
+from google.cloud import speech, storage
 
-# Set your credentials JSON path
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "/home/vikrant/youtube_downloader/gstt_json.json"
+from audio_transcript_in_bucket import UPLOAD_ENCODINGS, encode_and_upload
+from speech_quota import RateLimitedSpeechClient
+from transcript_cache import CACHE_DB, TranscriptCache, cache_key, decode_command, pcm_digest
+from word_timings import response_words, sidecar_path, write_sidecar
+
+# Set your credentials JSON path (used unless GOOGLE_APPLICATION_CREDENTIALS is already set)
+CREDENTIALS_PATH = "/home/vikrant/youtube_downloader/gstt_json.json"
 
 # Input and output directories
 INPUT_DIR = "/home/vikrant/youtube_downloader/test"
 OUTPUT_DIR = "/home/vikrant/youtube_downloader/hindi_transcripts_2"
+WORD_TIMESTAMPS = True  # Also save word timings and confidences next to each transcript
+MAX_IN_FLIGHT = 16  # Recognize requests in flight at the same time
+RECOGNIZE_MODE = "auto"  # "sync", "streaming", or "auto": stream files longer than SYNC_LIMIT_SEC
+SYNC_LIMIT_SEC = 59  # Synchronous recognize rejects more than a minute of audio
+STREAM_FRAME_MS = 100  # Audio per streaming request
+STREAM_SESSION_SEC = 290  # A streaming session is cut off at about 5 minutes, so rotate before that
+STREAM_CUT_SEARCH_SEC = 5  # Rotate sessions at the quietest frame in this window before the limit
+PROBE_BYTES = 4096  # Header bytes read to decide whether a WAV needs converting
+BUNDLE_SIZE = 0  # Short files packed into one long_running_recognize request; 0 sends each file on its own
+BUNDLE_SILENCE_SEC = 1.0  # Silence between the files of a bundle
+BUNDLE_MAX_SEC = 280  # Audio per bundle, which bounds what a failed request has to redo
+BUNDLE_BUCKET = "mixed_audio_data"  # Bundles are recognized from here: inline audio is limited to about a minute
+BUNDLE_GCS_PREFIX = "gstt_temp/bundles"  # Where bundles are uploaded, deleted once recognized
+BUNDLE_ENCODING = "flac"  # Upload encoding of bundles (see audio_transcript_in_bucket.UPLOAD_ENCODINGS)
+BUNDLE_TIMEOUT_SEC = 900
+
+# Google Speech client and transcript cache shared by all worker threads, set by init_client()
+client = None
+cache = None
+storage_client = None  # Used for bundles only, so created on first use unless init_client() was given one
+_storage_lock = threading.Lock()
+
+def init_client(client_override=None, cache_path=CACHE_DB, storage_client_override=None):
+    """Create the Speech client, rate limited to the project's quotas, and open the transcript
+    cache at cache_path (None disables it). Pass fake clients to run offline."""
+    global client, cache, storage_client
+    if client_override is None:
+        os.environ.setdefault("GOOGLE_APPLICATION_CREDENTIALS", CREDENTIALS_PATH)
+    client = RateLimitedSpeechClient(client_override or speech.SpeechClient())
+    cache = TranscriptCache(cache_path) if cache_path else None
+    storage_client = storage_client_override
 
-# Make sure output root exists
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+def get_storage_client():
+    global storage_client
+    with _storage_lock:
+        if storage_client is None:
+            storage_client = storage.Client()
+        return storage_client
 
-# Initialize Google Speech client
-client = speech.SpeechClient()
+def probe_wav(path):
+    """Check from the header alone whether path is already a PCM WAV in the mono, 16-bit, 16kHz format."""
+    with open(path, "rb") as f:
+        header = f.read(PROBE_BYTES)
+    if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        return False
+    position = 12
+    while position + 8 <= len(header):
+        chunk_id, chunk_size = struct.unpack_from("<4sI", header, position)
+        if chunk_id == b"fmt ":
+            if position + 24 > len(header):
+                return False
+            format_tag, channels, frame_rate, _, _, bits = struct.unpack_from("<HHIIHH", header, position + 8)
+            return format_tag == 1 and channels == 1 and frame_rate == 16000 and bits == 16
+        position += 8 + chunk_size + (chunk_size & 1)
+    return False
 
 def convert_audio(input_path):
-    """Convert audio to mono, 16-bit, 16kHz WAV format required by GSTT."""
-    sound = AudioSegment.from_file(input_path)
-    sound = sound.set_channels(1).set_frame_rate(16000).set_sample_width(2)
+    """Convert audio to mono, 16-bit, 16kHz WAV format required by GSTT.
 
-    temp_path = input_path + "_converted.wav"
-    sound.export(temp_path, format="wav")
-    return temp_path
+    Files that already are in that format (everything chunk_create.py writes) are passed
+    through untouched and their path is returned. Anything else is converted in memory
+    and returned as WAV bytes, so no temporary file is written either way. Conversion uses
+    the decoder of transcript_cache.decode_command, as audio_transcript_in_bucket does,
+    so both scripts hash the same PCM for the transcript cache.
+    """
+    if probe_wav(input_path):
+        return input_path
+    result = subprocess.run(decode_command(input_path), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to decode {input_path}: {result.stderr.decode(errors='replace').strip()}")
 
-def transcribe_audio(audio_path):
-    """Transcribe audio using Google Speech-to-Text API."""
-    with io.open(audio_path, "rb") as audio_file:
-        content = audio_file.read()
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(result.stdout)
+    return buffer.getvalue()
 
-    audio = speech.RecognitionAudio(content=content)
-    config = speech.RecognitionConfig(
+def audio_seconds(audio):
+    """Duration of converted audio (a WAV path or WAV bytes), less the 44-byte header."""
+    size = len(audio) if isinstance(audio, bytes) else os.path.getsize(audio)
+    return max(size - 44, 0) / 32000
+
+@contextmanager
+def open_pcm(audio):
+    """Yields a memoryview of the PCM in converted audio: memory-mapped for a WAV path,
+    a view into the buffer for WAV bytes. Neither copies the samples."""
+    if isinstance(audio, bytes):
+        data_offset, data_size = wav_data_range(audio)
+        with memoryview(audio)[data_offset:data_offset + data_size] as pcm:
+            yield pcm
+        return
+    with open(audio, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        data_offset, data_size = wav_data_range(mapped)
+        pcm = memoryview(mapped)[data_offset:data_offset + data_size]
+        try:
+            yield pcm
+        finally:
+            pcm.release()
+
+def recognition_config():
+    return speech.RecognitionConfig(
         encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+        sample_rate_hertz=16000,
         language_code="hi-IN",  # Hindi (can still recognize English parts)
-        enable_automatic_punctuation=True
+        enable_automatic_punctuation=True,
+        enable_word_time_offsets=WORD_TIMESTAMPS,
+        enable_word_confidence=WORD_TIMESTAMPS
     )
 
-    response = client.recognize(config=config, audio=audio)
+def wav_data_range(mapped):
+    """(offset, size) of the PCM in a WAV file, found by walking its RIFF chunks."""
+    position = 12
+    while position + 8 <= len(mapped):
+        chunk_id, chunk_size = struct.unpack_from("<4sI", mapped, position)
+        if chunk_id == b"data":
+            size = min(chunk_size, len(mapped) - position - 8)
+            return position + 8, size - size % 2
+        position += 8 + chunk_size + (chunk_size & 1)
+    raise ValueError("No data chunk in WAV file")
+
+def session_ranges(pcm):
+    """Split 16kHz 16-bit mono PCM into (start, end) byte ranges of at most STREAM_SESSION_SEC,
+    each ending at the quietest STREAM_FRAME_MS frame of its last STREAM_CUT_SEARCH_SEC."""
+    frame_bytes = 32 * STREAM_FRAME_MS
+    session_bytes = 32000 * STREAM_SESSION_SEC
+    search_frames = STREAM_CUT_SEARCH_SEC * 1000 // STREAM_FRAME_MS
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    ranges = []
+    start = 0
+    while len(pcm) - start > session_bytes:
+        limit = start + session_bytes - session_bytes % frame_bytes
+        window = samples[(limit - search_frames * frame_bytes) // 2:limit // 2].astype(np.float32)
+        energy = (window.reshape(search_frames, -1) ** 2).sum(axis=1)
+        end = limit - (search_frames - 1 - int(np.argmin(energy))) * frame_bytes
+        ranges.append((start, end))
+        start = end
+    ranges.append((start, len(pcm)))
+    return ranges
+
+def streaming_session(pcm, start, end):
+    """Returns a function yielding one StreamingRecognizeRequest per frame of pcm[start:end]."""
+    frame_bytes = 32 * STREAM_FRAME_MS
+
+    def requests():
+        for offset in range(start, end, frame_bytes):
+            yield speech.StreamingRecognizeRequest(audio_content=bytes(pcm[offset:min(offset + frame_bytes, end)]))
+
+    return requests
+
+def transcribe_audio_streaming(audio):
+    """Transcribe converted audio of any length with streaming_recognize.
+
+    The PCM is fed to the API in STREAM_FRAME_MS frames straight from the memory-mapped
+    file (or the in-memory conversion), so a file is never read into memory at once.
+    Files longer than STREAM_SESSION_SEC are sent over consecutive sessions; the final
+    results of all sessions are stitched into one transcript, with word timings shifted
+    to the start of the file.
+    """
+    streaming_config = speech.StreamingRecognitionConfig(config=recognition_config(), interim_results=False)
+    lines = []
+    words = {"words": [], "start": [], "end": [], "confidence": []}
+    with open_pcm(audio) as pcm:
+        for start, end in session_ranges(pcm):
+            responses = client.streaming_recognize(streaming_config, streaming_session(pcm, start, end),
+                                                   audio_sec=(end - start) / 32000)
+            for response in responses:
+                final = [result for result in response.results if result.is_final and result.alternatives]
+                lines.extend(result.alternatives[0].transcript.strip() for result in final)
+                if WORD_TIMESTAMPS:
+                    session_words = response_words(response)
+                    session_start_ms = start // 32
+                    words["words"] += session_words["words"]
+                    words["start"] += [t + session_start_ms for t in session_words["start"]]
+                    words["end"] += [t + session_start_ms for t in session_words["end"]]
+                    words["confidence"] += session_words["confidence"]
+    return "\n".join(lines), words if WORD_TIMESTAMPS else None
+
+def transcribe_audio(audio, mode=None):
+    """Transcribe converted audio (a WAV path or WAV bytes from convert_audio) using Google Speech-to-Text API.
+    Returns the transcript and, with WORD_TIMESTAMPS, the word timing columns (else None).
+
+    mode (default RECOGNIZE_MODE) picks synchronous recognize or streaming; "auto" streams
+    only files longer than SYNC_LIMIT_SEC, which synchronous recognize would reject."""
+    mode = mode or RECOGNIZE_MODE
+    audio_sec = audio_seconds(audio)
+    if mode == "streaming" or (mode == "auto" and audio_sec > SYNC_LIMIT_SEC):
+        return transcribe_audio_streaming(audio)
+
+    if isinstance(audio, bytes):
+        content = audio
+    else:
+        with io.open(audio, "rb") as audio_file:
+            content = audio_file.read()
+
+    audio = speech.RecognitionAudio(content=content)
+    response = client.recognize(config=recognition_config(), audio=audio, audio_sec=audio_sec)
     transcript = "\n".join(result.alternatives[0].transcript for result in response.results)
-    return transcript
+    words = response_words(response) if WORD_TIMESTAMPS else None
+    return transcript, words
+
+def write_atomic(path, text):
+    """Write text to path through a temporary file, so a crash never leaves a partial transcript."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def save_transcript(output_path, transcript, words):
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    if words is not None:
+        write_sidecar(sidecar_path(output_path), words)
+    write_atomic(output_path, transcript)
+
+def transcribe_file(input_path, output_path):
+    """Convert, transcribe and save one file. Runs on a worker thread; returns its audio seconds.
+    Audio that was transcribed before with the same settings is served from the cache."""
+    audio = convert_audio(input_path)
+    audio_sec = audio_seconds(audio)
+    key = cached = None
+    if cache is not None:
+        with open_pcm(audio) as pcm:
+            key = cache_key(pcm_digest(pcm), recognition_config())
+        cached = cache.get(key)
+    if cached is not None:
+        transcript, words = cached
+    else:
+        transcript, words = transcribe_audio(audio)
+        if key is not None:
+            cache.put(key, transcript, words)
+    save_transcript(output_path, transcript, words)
+    return audio_sec
 
-def process_folder():
-    for root, _, files in os.walk(INPUT_DIR):
-        for file in files:
+def bundle_config():
+    """The recognition config of bundles: uploaded in BUNDLE_ENCODING, and always with word
+    offsets, which bundles need to be split again."""
+    config = recognition_config()
+    config.encoding = getattr(speech.RecognitionConfig.AudioEncoding, UPLOAD_ENCODINGS[BUNDLE_ENCODING][1])
+    config.enable_word_time_offsets = True
+    return config
+
+def upload_bundle(parts, blob_name):
+    """Write PCM parts one after another to a temporary WAV and upload it to BUNDLE_BUCKET as
+    blob_name, encoded in BUNDLE_ENCODING. Returns the gs:// URI."""
+    fd, wav_path = tempfile.mkstemp(prefix="bundle_", suffix=".wav")
+    os.close(fd)
+    try:
+        with wave.open(wav_path, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(16000)
+            for part in parts:
+                wav.writeframes(part)
+        gcs_uri, _ = encode_and_upload(wav_path, BUNDLE_BUCKET, blob_name, BUNDLE_ENCODING, get_storage_client())
+        return gcs_uri
+    finally:
+        os.remove(wav_path)
+
+def split_words(words, spans):
+    """Assign word timing columns to the files of a bundle.
+
+    spans are the (start_ms, end_ms) of each file in the bundle. A word goes to the file
+    its midpoint falls in, or to the nearer file when it falls in a separator. Returns
+    one set of columns per file, with times relative to the start of that file.
+    """
+    starts = [start for start, _ in spans]
+    per_file = [{"words": [], "start": [], "end": [], "confidence": []} for _ in spans]
+    for word, start, end, confidence in zip(words["words"], words["start"], words["end"], words["confidence"]):
+        middle = (start + end) / 2
+        index = max(bisect_right(starts, middle) - 1, 0)
+        if (middle > spans[index][1] and index + 1 < len(spans)
+                and spans[index + 1][0] - middle < middle - spans[index][1]):
+            index += 1
+        span_start, span_end = spans[index]
+        columns = per_file[index]
+        columns["words"].append(word)
+        columns["start"].append(min(max(start - span_start, 0), span_end - span_start))
+        columns["end"].append(min(max(end - span_start, 0), span_end - span_start))
+        columns["confidence"].append(confidence)
+    return per_file
+
+def recognize_bundle(group, config):
+    """Concatenate the PCM of (input_path, output_path, pcm, cache key) items with
+    BUNDLE_SILENCE_SEC separators, recognize them with one long_running_recognize request
+    and save each file's share of the words as its transcript.
+
+    The API takes only about a minute of inline audio, so the bundle goes through a
+    temporary object in BUNDLE_BUCKET, deleted once the operation is done. Returns
+    {input_path: error} of the files whose transcript could not be saved.
+    """
+    separator = bytes(2 * int(16000 * BUNDLE_SILENCE_SEC))
+    parts = []
+    spans = []
+    position = 0
+    for i, (_, _, pcm, _) in enumerate(group):
+        if i:
+            parts.append(separator)
+            position += len(separator)
+        spans.append((position // 32, (position + len(pcm)) // 32))
+        parts.append(pcm)
+        position += len(pcm)
+
+    blob_name = f"{BUNDLE_GCS_PREFIX}/{uuid.uuid4().hex}{UPLOAD_ENCODINGS[BUNDLE_ENCODING][2]}"
+    try:
+        gcs_uri = upload_bundle(parts, blob_name)
+        operation = client.long_running_recognize(config=config, audio=speech.RecognitionAudio(uri=gcs_uri),
+                                                  audio_sec=position / 32000)
+        words = response_words(operation.result(timeout=BUNDLE_TIMEOUT_SEC))
+    finally:
+        # Also removes what a failed streamed upload may have left
+        try:
+            get_storage_client().bucket(BUNDLE_BUCKET).blob(blob_name).delete()
+        except Exception as e:
+            print(f"Error deleting gs://{BUNDLE_BUCKET}/{blob_name}: {e}")
+
+    failures = {}
+    for (input_path, output_path, _, key), file_words in zip(group, split_words(words, spans)):
+        try:
+            transcript = " ".join(file_words["words"])
+            if key is not None:
+                cache.put(key, transcript, file_words)
+            save_transcript(output_path, transcript, file_words if WORD_TIMESTAMPS else None)
+        except Exception as e:
+            failures[input_path] = e
+    return failures
+
+def transcribe_bundle(jobs):
+    """Transcribe several short files with as few requests as possible. Runs on a worker
+    thread; returns the audio seconds of the files transcribed and {input_path: error} of
+    those that failed.
+
+    Cached files are saved right away. The rest are packed into bundles of at most
+    BUNDLE_MAX_SEC, each sent as one long_running_recognize request whose words are
+    split back per file by their time offsets. A file too long for a bundle is
+    transcribed on its own. Failures are per file: a failed request fails the files of
+    its bundle only, never files already written.
+    """
+    config = bundle_config()
+    audio_sec = 0.0
+    failures = {}
+    group = []
+    group_sec = 0.0
+
+    def recognize(group):
+        nonlocal audio_sec
+        try:
+            group_failures = recognize_bundle(group, config)
+        except Exception as e:
+            group_failures = {input_path: e for input_path, _, _, _ in group}
+        failures.update(group_failures)
+        audio_sec += sum(len(pcm) / 32000 for input_path, _, pcm, _ in group if input_path not in group_failures)
+
+    for input_path, output_path in jobs:
+        try:
+            audio = convert_audio(input_path)
+            with open_pcm(audio) as pcm:
+                pcm = bytes(pcm)
+            file_sec = len(pcm) / 32000
+
+            key = cache_key(pcm_digest(pcm), config) if cache is not None else None
+            cached = cache.get(key) if key is not None else None
+            if cached is not None:
+                transcript, words = cached
+                save_transcript(output_path, transcript, words if WORD_TIMESTAMPS else None)
+                audio_sec += file_sec
+                continue
+            if file_sec > BUNDLE_MAX_SEC:
+                audio_sec += transcribe_file(input_path, output_path)
+                continue
+        except Exception as e:
+            failures[input_path] = e
+            continue
+
+        if group and group_sec + BUNDLE_SILENCE_SEC + file_sec > BUNDLE_MAX_SEC:
+            recognize(group)
+            group, group_sec = [], 0.0
+        group_sec += file_sec + (BUNDLE_SILENCE_SEC if group else 0.0)
+        group.append((input_path, output_path, pcm, key))
+    if group:
+        recognize(group)
+    return audio_sec, failures
+
+def gather_jobs(input_dir, output_dir):
+    """(input_path, output_path) for every WAV under input_dir, mirrored under output_dir."""
+    jobs = []
+    for root, _, files in os.walk(input_dir):
+        for file in sorted(files):
             if file.endswith("wav"):
                 input_path = os.path.join(root, file)
 
                 # Get relative path and make mirrored output path
-                rel_path = os.path.relpath(input_path, INPUT_DIR)
+                rel_path = os.path.relpath(input_path, input_dir)
                 rel_no_ext = os.path.splitext(rel_path)[0]
-                output_path = os.path.join(OUTPUT_DIR, rel_no_ext + ".txt")
-                os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-                try:
-                    print(f"Processing: {input_path}")
-                    converted_path = convert_audio(input_path)
-                    transcript = transcribe_audio(converted_path)
-                    with open(output_path, "w", encoding="utf-8") as f:
-                        f.write(transcript)
-                    os.remove(converted_path)  # Clean up temp file
-                except Exception as e:
-                    print(f"Error processing {input_path}: {e}")
-
-process_folder()
+                jobs.append((input_path, os.path.join(output_dir, rel_no_ext + ".txt")))
+    return jobs
+
+def process_folder(input_dir=INPUT_DIR, output_dir=OUTPUT_DIR, max_in_flight=MAX_IN_FLIGHT, bundle_size=None):
+    """Transcribe every WAV under input_dir with up to max_in_flight requests in flight.
+
+    Worker threads share the one rate-limited client. Transcripts are written atomically
+    into the mirrored tree under output_dir. Files/sec and audio-seconds/sec are printed
+    at the end and returned as a dict.
+
+    With bundle_size (default BUNDLE_SIZE) above 0, that many files at a time are packed
+    into one long_running_recognize request instead of one recognize request each; the
+    bundles are uploaded to BUNDLE_BUCKET for recognition.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = gather_jobs(input_dir, output_dir)
+    print(f"Found {len(jobs)} files to transcribe.")
+    bundle_size = BUNDLE_SIZE if bundle_size is None else bundle_size
+    # (function, arguments, input paths it covers)
+    if bundle_size > 0:
+        bundles = [jobs[i:i + bundle_size] for i in range(0, len(jobs), bundle_size)]
+        tasks = [(transcribe_bundle, (bundle,), [input_path for input_path, _ in bundle]) for bundle in bundles]
+    else:
+        tasks = [(transcribe_file, job, [job[0]]) for job in jobs]
+
+    done = failed = 0
+    audio_sec = 0.0
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        futures = {executor.submit(function, *args): input_paths for function, args, input_paths in tasks}
+        for future in as_completed(futures):
+            input_paths = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failures = {input_path: e for input_path in input_paths}
+            else:
+                # Bundles report their failed files; a single file either raises or is done
+                task_sec, failures = result if bundle_size > 0 else (result, {})
+                audio_sec += task_sec
+            for input_path in input_paths:
+                if input_path in failures:
+                    print(f"Error processing {input_path}: {failures[input_path]}")
+            processed = [input_path for input_path in input_paths if input_path not in failures]
+            if processed:
+                print(f"Processed: {', '.join(processed)}")
+            done += len(processed)
+            failed += len(failures)
+
+    elapsed = time.time() - start_time
+    stats = {
+        "files": done,
+        "failed": failed,
+        "elapsed_sec": elapsed,
+        "files_per_sec": done / elapsed if elapsed else 0.0,
+        "audio_sec_per_sec": audio_sec / elapsed if elapsed else 0.0,
+    }
+    print(f"Transcribed {done} files ({failed} failed) in {elapsed:.1f}s: "
+          f"{stats['files_per_sec']:.2f} files/sec, {stats['audio_sec_per_sec']:.1f} audio-sec/sec")
+    client.print_metrics()
+    if cache is not None:
+        cache.print_stats()
+    return stats
+
+if __name__ == "__main__":
+    init_client()
+    process_folder()
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from pydub import AudioSegment
+
+CACHE_DB = "/home/vikrant/youtube_downloader/transcript_cache.sqlite3"
+CACHE_MAX_BYTES = 2 * 1024 ** 3  # Least recently used entries are evicted beyond this size
+EVICT_BATCH = 100
+
+# Recognition settings that change what the API returns for the same audio
+CONFIG_FIELDS = ("language_code", "model", "enable_automatic_punctuation",
+                 "enable_word_time_offsets", "enable_word_confidence")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    key TEXT PRIMARY KEY,
+    transcript TEXT NOT NULL,
+    words TEXT,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transcripts_last_used ON transcripts (last_used);
+"""
+
+
+def cache_key(pcm_digest, config):
+    """Key of a transcript: the hash of the decoded 16kHz mono PCM plus the recognition settings."""
+    settings = {field: getattr(config, field, None) for field in CONFIG_FIELDS}
+    return hashlib.sha1((pcm_digest + json.dumps(settings, sort_keys=True)).encode()).hexdigest()
+
+
+def pcm_digest(pcm):
+    """sha1 of a PCM buffer (bytes, or a memoryview of a memory-mapped WAV)."""
+    return hashlib.sha1(pcm).hexdigest()
+
+
+def decode_command(path):
+    """ffmpeg command writing path to stdout as 16kHz mono 16-bit PCM.
+
+    Both scripts hash PCM from this one decoder, so a recording gets the same key in
+    either. A WAV that already is in that format holds exactly the bytes it would output,
+    so its data is hashed as it is.
+    """
+    return [AudioSegment.converter, "-nostdin", "-v", "error", "-i", str(path),
+            "-ac", "1", "-ar", "16000", "-f", "s16le", "-"]
+
+
+class TranscriptCache:
+    """Content-addressed store of transcripts and word timings, bounded in size with LRU eviction.
+
+    Keys come from cache_key(), so a file that was moved, renamed or downloaded again
+    is recognized by its audio. Safe to share between threads; several processes can
+    use the same database file, which is why its size is always read from the database.
+    """
+
+    def __init__(self, path=CACHE_DB, max_bytes=CACHE_MAX_BYTES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        """Returns (transcript, word columns or None) for key, or None on a miss."""
+        with self.lock:
+            row = self.conn.execute("SELECT transcript, words FROM transcripts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            self.conn.execute("UPDATE transcripts SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+        transcript, words = row
+        return transcript, json.loads(words) if words is not None else None
+
+    def put(self, key, transcript, words=None):
+        words_json = json.dumps(words, ensure_ascii=False, separators=(",", ":")) if words is not None else None
+        size = len(transcript.encode("utf-8")) + len(words_json or "")
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO transcripts (key, transcript, words, size, last_used) "
+                              "VALUES (?, ?, ?, ?, ?)", (key, transcript, words_json, size, time.time()))
+            self._evict()
+            self.conn.commit()
+
+    def total_bytes(self):
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+
+    def _evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes. Runs in the
+        write transaction of put(), so the size read here includes every process's entries."""
+        total = self.total_bytes()
+        while total > self.max_bytes:
+            rows = self.conn.execute("SELECT key, size FROM transcripts ORDER BY last_used LIMIT ?",
+                                     (EVICT_BATCH,)).fetchall()
+            if not rows:
+                return
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    return
+                self.conn.execute("DELETE FROM transcripts WHERE key = ?", (key,))
+                total -= size
+                self.stats["evictions"] += 1
+
+    def print_stats(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        hit_rate = self.stats["hits"] / lookups if lookups else 0.0
+        with self.lock:
+            total_bytes = self.total_bytes()
+        print(f"Transcript cache: {self.stats['hits']} hits, {self.stats['misses']} misses "
+              f"(hit rate {hit_rate:.1%}), {self.stats['evictions']} evictions, "
+              f"{total_bytes / 1e6:.1f} MB cached")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -40,4 +40,5 @@ def process_all_transcripts(transcript_dir, output_dir):
 TRANSCRIPT_DIR = "/home/vikrant/chunks_by_transcript/test_transcript"
 OUTPUT_DIR = "/home/vikrant/chunks_by_transcript/split_transcripts"
 
-process_all_transcripts(TRANSCRIPT_DIR, OUTPUT_DIR)
+if __name__ == "__main__":
+    process_all_transcripts(TRANSCRIPT_DIR, OUTPUT_DIR)
@@ -0,0 +1,91 @@
+import json
+import os
+
+# Sidecar written next to every transcript: <transcript name>.words.json
+WORDS_SUFFIX = ".words.json"
+
+
+def sidecar_path(transcript_path):
+    return os.path.splitext(transcript_path)[0] + WORDS_SUFFIX
+
+
+def _seconds(offset):
+    # proto-plus returns Durations as timedelta; raw protobuf messages have seconds/nanos
+    if hasattr(offset, "total_seconds"):
+        return offset.total_seconds()
+    return offset.seconds + offset.nanos / 1e9
+
+
+def response_words(response):
+    """Collects the word timings and confidences of a recognize/long_running_recognize
+    response (requested with enable_word_time_offsets and enable_word_confidence) into
+    columns: words, start and end in milliseconds, confidence."""
+    columns = {"words": [], "start": [], "end": [], "confidence": []}
+    for result in response.results:
+        if not result.alternatives:
+            continue
+        for info in result.alternatives[0].words:
+            columns["words"].append(info.word)
+            columns["start"].append(int(round(_seconds(info.start_time) * 1000)))
+            columns["end"].append(int(round(_seconds(info.end_time) * 1000)))
+            columns["confidence"].append(round(float(info.confidence), 3))
+    return columns
+
+
+def write_sidecar(path, columns):
+    """Atomically writes the word columns as compact JSON."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(dict(columns, version=1), f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_sidecar(path):
+    """Returns the word columns of a sidecar, or None if there is none."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def line_fragments(columns, lines):
+    """Turns sidecar word timings into aeneas-style alignment for the given transcript lines.
+
+    Consecutive words are assigned to each line by word count, so lines must split the
+    same transcript the sidecar came from. Every fragment carries the exact
+    [start, end] of its words in "word_times". Returns {"fragments": [...]} like the
+    aeneas JSON output, or None when the word counts do not match and the file has to
+    be aligned by aeneas instead.
+    """
+    lines = [line.strip() for line in lines if line.strip()]
+    if sum(len(line.split()) for line in lines) != len(columns["words"]):
+        return None
+
+    fragments = []
+    position = 0
+    for line in lines:
+        count = len(line.split())
+        starts = columns["start"][position:position + count]
+        ends = columns["end"][position:position + count]
+        position += count
+        fragments.append({
+            "begin": f"{starts[0] / 1000:.3f}",
+            "end": f"{ends[-1] / 1000:.3f}",
+            "lines": [line],
+            "word_times": [[s / 1000, e / 1000] for s, e in zip(starts, ends)],
+        })
+    return {"fragments": fragments}
+
+
+def sidecar_alignment(words_dir, name, transcript_path):
+    """Alignment of transcript_path from the sidecar <words_dir>/<name>.words.json, or None
+    if there is no usable sidecar for it."""
+    columns = read_sidecar(os.path.join(words_dir, name + WORDS_SUFFIX))
+    if columns is None:
+        return None
+    with open(transcript_path, "r", encoding="utf-8") as f:
+        alignment = line_fragments(columns, f.readlines())
+    if alignment is None:
+        print(f"Word timings of {name} do not match its transcript, falling back to aeneas.")
+    return alignment
@@ -135,9 +135,6 @@ urls = [
 # Folder to save audio
 download_folder = "downloads_tam"
 
-# Create necessary folder
-os.makedirs(download_folder, exist_ok=True)
-
 def download_audio(url):
     """
     Uses yt-dlp to download the best audio and convert it to mp3.
@@ -164,6 +161,8 @@ def process_all(urls):
     """
     Processes all URLs: downloads audio.
     """
+    # Create necessary folder
+    os.makedirs(download_folder, exist_ok=True)
     for url in urls:
         print("=" * 60)
         print(f"Processing URL: {url}")